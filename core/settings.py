@@ -111,3 +111,97 @@ STORAGES = {
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Origen del dataset: URL, ruta a un archivo CSV local o directorio que lo contiene
+DASHBOARD_DATA_SOURCE = os.environ.get(
+    'DASHBOARD_DATA_SOURCE',
+    'https://raw.githubusercontent.com/iamrodrigodev/online-retail/main/dataset/retail_with_categories.csv'
+)
+
+# Directorio de snapshots locales del dataset (Arrow IPC)
+DASHBOARD_DATA_CACHE_DIR = os.environ.get('DASHBOARD_DATA_CACHE_DIR', str(BASE_DIR / '.data_cache'))
+
+# Reintentos acotados de la carga del dataset (backoff exponencial en segundos)
+DASHBOARD_DATA_LOAD_ATTEMPTS = int(os.environ.get('DASHBOARD_DATA_LOAD_ATTEMPTS', '3'))
+DASHBOARD_DATA_RETRY_BACKOFF = float(os.environ.get('DASHBOARD_DATA_RETRY_BACKOFF', '1.0'))
+
+# Compartir el dataset entre workers: el proceso maestro materializa el snapshot
+# Arrow y cada worker lo mapea en memoria sin copiarlo (ver gunicorn.conf.py)
+DASHBOARD_DATA_SHARED = os.environ.get('DASHBOARD_DATA_SHARED', 'false').lower() in ('1', 'true', 'yes')
+
+# Almacén de las consultas: 'memory' (DataFrame mapeado en memoria) o
+# 'partitioned' (Parquet particionado por mes y país, con poda de particiones)
+DASHBOARD_DATA_STORE = os.environ.get('DASHBOARD_DATA_STORE', 'memory')
+
+# Máximo de clasificaciones por perfil (umbrales IQR + códigos) memorizadas por
+# filtro en cada worker, en entradas y en bytes
+DASHBOARD_PROFILE_CACHE_SIZE = int(os.environ.get('DASHBOARD_PROFILE_CACHE_SIZE', '32'))
+DASHBOARD_PROFILE_CACHE_MAX_BYTES = int(os.environ.get('DASHBOARD_PROFILE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Máximo de series diarias de ventas (sumas acumuladas) memorizadas por filtro
+DASHBOARD_DAILY_INDEX_CACHE_SIZE = int(os.environ.get('DASHBOARD_DAILY_INDEX_CACHE_SIZE', '64'))
+
+# Productos guardados por partición (mes, país, categoría, subcategoría) en los
+# resúmenes del Top 5 de productos
+DASHBOARD_TOP_PRODUCTS_SUMMARY_SIZE = int(os.environ.get('DASHBOARD_TOP_PRODUCTS_SUMMARY_SIZE', '64'))
+
+# Caché de resultados de los endpoints: presupuesto de memoria (bytes; 0 la
+# desactiva) y tiempo de vida de cada respuesta (segundos; 0 sin vencimiento)
+DASHBOARD_RESULT_CACHE_MAX_BYTES = int(os.environ.get('DASHBOARD_RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+DASHBOARD_RESULT_CACHE_TTL = float(os.environ.get('DASHBOARD_RESULT_CACHE_TTL', '900'))
+
+# Figuras serializadas (bytes JSON) memorizadas por filtros y versión del dataset
+DASHBOARD_FIGURE_CACHE_SIZE = int(os.environ.get('DASHBOARD_FIGURE_CACHE_SIZE', '128'))
+
+# Índices de vecinos de la similitud de clientes memorizados por (filtros,
+# normalización, métrica): máximo de índices y memoria máxima en bytes
+DASHBOARD_NEIGHBOR_INDEX_CACHE_SIZE = int(os.environ.get('DASHBOARD_NEIGHBOR_INDEX_CACHE_SIZE', '16'))
+DASHBOARD_NEIGHBOR_INDEX_MAX_BYTES = int(os.environ.get('DASHBOARD_NEIGHBOR_INDEX_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Salidas de las etapas del pipeline de similitud (características,
+# normalización, PCA, KMeans, outliers) memorizadas por el hash de sus
+# entradas: máximo de etapas y memoria máxima en bytes
+DASHBOARD_SIMILARITY_STAGE_CACHE_SIZE = int(os.environ.get('DASHBOARD_SIMILARITY_STAGE_CACHE_SIZE', '128'))
+DASHBOARD_SIMILARITY_STAGE_MAX_BYTES = int(os.environ.get('DASHBOARD_SIMILARITY_STAGE_MAX_BYTES', str(128 * 1024 * 1024)))
+
+# Configuraciones de similitud (config_key del endpoint de vecinos) recordadas
+# en memoria por worker
+DASHBOARD_SIMILARITY_CONFIG_CACHE_SIZE = int(os.environ.get('DASHBOARD_SIMILARITY_CONFIG_CACHE_SIZE', '1024'))
+
+# Segundo nivel de la caché de resultados, compartido entre workers
+# (DASHBOARD_RESULT_CACHE_BACKEND): 'file' (archivos en el directorio de caché,
+# por defecto), 'redis' (servidor compatible con Redis en
+# DASHBOARD_RESULT_CACHE_URL) o 'local' (solo la caché en memoria de cada worker)
+DASHBOARD_RESULT_CACHE_BACKEND = os.environ.get('DASHBOARD_RESULT_CACHE_BACKEND', 'file').lower()
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+if DASHBOARD_RESULT_CACHE_BACKEND == 'file':
+    CACHES['results'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(DASHBOARD_DATA_CACHE_DIR, 'results'),
+        'TIMEOUT': DASHBOARD_RESULT_CACHE_TTL or None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('DASHBOARD_RESULT_CACHE_MAX_ENTRIES', '2000')),
+        },
+    }
+elif DASHBOARD_RESULT_CACHE_BACKEND == 'redis':
+    CACHES['results'] = {
+        'BACKEND': 'dashboard.cache_backends.RedisCompatibleCache',
+        'LOCATION': os.environ.get('DASHBOARD_RESULT_CACHE_URL', 'redis://localhost:6379/0'),
+        'TIMEOUT': DASHBOARD_RESULT_CACHE_TTL or None,
+        'KEY_PREFIX': 'dashboard-results',
+    }
+
+# Resúmenes de cuantiles por (país, mes) para los umbrales de perfil:
+# 'exact' solo usa resúmenes exactos; 'approximate' acepta resúmenes comprimidos
+# con un error de rango relativo de DASHBOARD_QUANTILE_EPSILON
+DASHBOARD_QUANTILE_MODE = os.environ.get('DASHBOARD_QUANTILE_MODE', 'exact')
+DASHBOARD_QUANTILE_EPSILON = float(os.environ.get('DASHBOARD_QUANTILE_EPSILON', '0.001'))
+DASHBOARD_QUANTILE_EXACT_LIMIT = int(os.environ.get('DASHBOARD_QUANTILE_EXACT_LIMIT', '65536'))
+
+# Cargar el dataset al iniciar la aplicación (en cada worker de Gunicorn)
+DASHBOARD_DATA_WARMUP = os.environ.get('DASHBOARD_DATA_WARMUP', 'true').lower() not in ('0', 'false', 'no')
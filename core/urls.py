@@ -11,7 +11,10 @@ urlpatterns = [
     path('api/top-products/', views.get_top_products, name='top_products'),
     path('api/categories/', views.get_categories, name='get_categories'),
     path('api/client-similarity/compute/', views.compute_client_similarity, name='compute_client_similarity'),
+    path('api/client-similarity/neighbors/', views.get_similarity_neighbors, name='similarity_neighbors'),
     path('api/client-similarity/customer-ids/', views.get_customer_ids, name='get_customer_ids'),
     path('api/products-by-customers/', views.get_products_by_customers, name='products_by_customers'),
     path('api/sales-detail/<str:date>/', views.get_sales_detail, name='sales_detail'),
+    path('healthz/', views.healthz, name='healthz'),
+    path('readyz/', views.readyz, name='readyz'),
 ]
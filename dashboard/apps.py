@@ -1,5 +1,47 @@
+import os
+import sys
 from django.apps import AppConfig
 
+
+# Módulos de servidores WSGI/ASGI que, si están importados, indican que el
+# proceso va a servir peticiones
+SERVER_MODULES = ('gunicorn', 'uwsgi', 'uvicorn', 'daphne', 'waitress')
+
+
+def _is_server_process():
+    """
+    Indica si el proceso actual va a servir peticiones.
+
+    Con manage.py solo se considera servidor a `runserver` (en el proceso hijo
+    del autoreloader). Fuera de manage.py solo lo son los procesos marcados
+    con DASHBOARD_SERVER_PROCESS (gunicorn.conf.py lo activa) o los que
+    ejecutan un servidor WSGI/ASGI conocido; pytest, `python -c`, Celery o
+    scripts con django.setup() no cargan el dataset al iniciar.
+    """
+    if os.path.basename(sys.argv[0]) == 'manage.py':
+        if len(sys.argv) < 2 or sys.argv[1] != 'runserver':
+            return False
+        return '--noreload' in sys.argv or os.environ.get('RUN_MAIN') == 'true'
+
+    if os.environ.get('DASHBOARD_SERVER_PROCESS', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return any(name in sys.modules for name in SERVER_MODULES)
+
+
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
+
+    def ready(self):
+        from django.conf import settings
+
+        # Cargar el dataset al iniciar: en modo compartido (gunicorn.conf.py) cada
+        # worker solo mapea el snapshot que el proceso maestro ya materializó
+        if getattr(settings, 'DASHBOARD_DATA_WARMUP', True) and _is_server_process():
+            from .visualizations.shared.data_loader import warm_up
+            df = warm_up()
+
+            # Contenido de la página inicial para la versión cargada
+            if df.height > 0:
+                from .index_payload import warm_up_index_payload
+                warm_up_index_payload()
@@ -0,0 +1,120 @@
+"""
+Backends de caché de Django para la caché compartida de resultados.
+
+`RedisCompatibleCache` habla con cualquier servidor compatible con Redis
+(Redis, Valkey, KeyDB, ...) a través de un cliente intercambiable: por
+defecto se crea con `redis.Redis.from_url(LOCATION)` (dependencia opcional,
+solo necesaria con este backend), y con la opción CLIENT_FACTORY se puede
+indicar otra función que reciba la URL y retorne el cliente. El cliente solo
+necesita los métodos get, set(ex=, nx=), delete, exists, expire y scan_iter.
+
+Ejemplo en settings.py:
+
+    CACHES = {
+        'results': {
+            'BACKEND': 'dashboard.cache_backends.RedisCompatibleCache',
+            'LOCATION': 'redis://localhost:6379/0',
+            'TIMEOUT': 900,
+        }
+    }
+"""
+import pickle
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+
+def default_client_factory(location):
+    """Cliente redis-py para la URL indicada"""
+    try:
+        import redis
+    except ImportError as e:
+        raise ImportError(
+            "RedisCompatibleCache requiere el paquete 'redis' (pip install redis) "
+            "o una opción CLIENT_FACTORY"
+        ) from e
+    return redis.Redis.from_url(location)
+
+
+class RedisCompatibleCache(BaseCache):
+    """Backend de caché sobre un cliente compatible con Redis (valores serializados con pickle)"""
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        self._location = server if isinstance(server, str) else server[0]
+        options = params.get('OPTIONS', {})
+        factory = options.get('CLIENT_FACTORY', default_client_factory)
+        self._client_factory = import_string(factory) if isinstance(factory, str) else factory
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory(self._location)
+        return self._client
+
+    def _expiry(self, timeout):
+        """
+        Segundos de vida para el cliente: None sin vencimiento, y <= 0 si la
+        clave debe expirar de inmediato (semántica de Django)
+        """
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return None
+        if timeout <= 0:
+            return 0
+        return max(1, int(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expiry = self._expiry(timeout)
+        if expiry is not None and expiry <= 0:
+            return False
+        return bool(self.client.set(key, pickle.dumps(value), ex=expiry, nx=True))
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = self.client.get(key)
+        if value is None:
+            return default
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expiry = self._expiry(timeout)
+        if expiry is not None and expiry <= 0:
+            self.client.delete(key)
+            return
+        self.client.set(key, pickle.dumps(value), ex=expiry)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expiry = self._expiry(timeout)
+        if expiry is not None and expiry <= 0:
+            return bool(self.client.delete(key))
+        if expiry is None:
+            value = self.client.get(key)
+            if value is None:
+                return False
+            self.client.set(key, value)
+            return True
+        return bool(self.client.expire(key, expiry))
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self.client.delete(key))
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self.client.exists(key))
+
+    def clear(self):
+        """Elimina solo las claves de esta caché (las de su KEY_PREFIX)"""
+        pattern = f'{self.key_prefix}:*'
+        keys = list(self.client.scan_iter(match=pattern))
+        if keys:
+            self.client.delete(*keys)
+
+    def close(self, **kwargs):
+        pass
@@ -0,0 +1,186 @@
+"""
+Contenido precalculado de la página inicial.
+
+La página inicial siempre muestra lo mismo para una versión del dataset: el
+mapa mundial, los gráficos globales de perfiles, tendencia de ventas y Top 5
+de productos, la lista de países y el rango de meses. Ese contenido (ya
+serializado y listo para incrustarse en la plantilla) se calcula una sola vez
+por versión del dataset y se guarda en memoria y en disco, junto al snapshot
+(`retail-<huella>-v<formato>.index.json`): los demás workers y los reinicios
+lo leen del archivo, y una carga de la página solo cuesta renderizar la
+plantilla. Cuando cambia la huella del dataset se regenera y se eliminan los
+archivos de versiones anteriores.
+"""
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .serialization import dumps, script_safe
+from .visualizations.customer_profiles.plot import create_customer_profiles_plot
+from .visualizations.products.plot import create_top_products_plot
+from .visualizations.sales.plot import create_sales_trend_plot
+from .visualizations.shared.data_loader import get_cache_dir, get_dataset_version, load_online_retail_data
+from .visualizations.shared.snapshot import SNAPSHOT_FORMAT, write_atomic
+from .visualizations.world_map.plot import create_world_map_plot
+
+# Versión del formato del contenido: incrementarla (por ejemplo, al cambiar una
+# figura) invalida los archivos guardados con el mismo dataset
+PAYLOAD_FORMAT = 1
+
+# Claves del contexto de la plantilla index.html
+PAYLOAD_KEYS = (
+    'worldMapJSON',
+    'customerProfilesJSON',
+    'salesTrendJSON',
+    'topProductsJSON',
+    'dataset_countries',
+    'date_range',
+)
+
+_lock = threading.Lock()
+_payload = None  # (versión del dataset, contexto)
+
+
+def payload_path(cache_dir, fingerprint):
+    """Ruta del contenido precalculado para una huella de contenido"""
+    return Path(cache_dir) / f'retail-{fingerprint[:16]}-v{SNAPSHOT_FORMAT}.index.json'
+
+
+def get_date_range(df):
+    """Primer y último mes (YYYY-MM) con transacciones"""
+    date_range = {'min': None, 'max': None}
+
+    if df is not None and df.height > 0:
+        min_date = df['InvoiceDate'].min()
+        max_date = df['InvoiceDate'].max()
+
+        if min_date and max_date:
+            date_range = {
+                'min': min_date.strftime('%Y-%m'),
+                'max': max_date.strftime('%Y-%m')
+            }
+    return date_range
+
+
+def build_index_payload():
+    """
+    Calcula el contexto de la página inicial: las figuras globales y los
+    datos auxiliares, serializados para incrustarse en un <script>.
+
+    Returns:
+        dict {clave de la plantilla: str JSON}
+    """
+    # 1. Mapa mundial y lista de países del dataset
+    world_map_fig, dataset_countries = create_world_map_plot()
+
+    # 2-4. Gráficos globales de perfiles, tendencia de ventas y top productos
+    customer_profiles_fig = create_customer_profiles_plot()
+    sales_trend_fig = create_sales_trend_plot()
+    top_products_fig = create_top_products_plot()
+
+    # 5. Rango de fechas del dataset
+    date_range = get_date_range(load_online_retail_data())
+
+    return {
+        'worldMapJSON': script_safe(dumps(world_map_fig)),
+        'customerProfilesJSON': script_safe(dumps(customer_profiles_fig)),
+        'salesTrendJSON': script_safe(dumps(sales_trend_fig)),
+        'topProductsJSON': script_safe(dumps(top_products_fig)),
+        'dataset_countries': script_safe(dumps(dataset_countries)),
+        'date_range': script_safe(dumps(date_range))
+    }
+
+
+def _read_payload(path):
+    """Contenido guardado en disco, o None si no existe o no es utilizable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(stored, dict) or stored.get('format') != PAYLOAD_FORMAT:
+        return None
+    payload = stored.get('payload')
+    if not isinstance(payload, dict):
+        return None
+    if not all(isinstance(payload.get(key), str) for key in PAYLOAD_KEYS):
+        return None
+    return payload
+
+
+def _write_payload(path, payload):
+    """Guarda el contenido y elimina el de otras versiones del dataset"""
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': PAYLOAD_FORMAT, 'payload': payload}, f, ensure_ascii=False)
+
+    try:
+        write_atomic(path, write)
+        for old_path in path.parent.glob('retail-*.index.json'):
+            if old_path.name != path.name:
+                try:
+                    old_path.unlink()
+                except OSError:
+                    pass
+    except OSError as e:
+        print(f"No se pudo guardar el contenido de la página inicial: {e}", file=sys.stderr)
+
+
+def get_index_payload():
+    """
+    Contexto de la página inicial para la versión actual del dataset: desde
+    memoria, desde disco o calculándolo si aún no existe.
+
+    Returns:
+        dict {clave de la plantilla: str JSON}
+    """
+    global _payload
+    load_online_retail_data()
+    version = get_dataset_version()
+    if version is None:
+        # Dataset no disponible: se calcula sin guardarlo para reintentar luego
+        return build_index_payload()
+
+    cached = _payload
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    with _lock:
+        cached = _payload
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        path = payload_path(get_cache_dir(), version)
+        payload = _read_payload(path)
+        if payload is None:
+            payload = build_index_payload()
+            # Solo se guarda si el dataset no cambió mientras se calculaba
+            if get_dataset_version() == version:
+                _write_payload(path, payload)
+        if get_dataset_version() == version:
+            _payload = (version, payload)
+    return payload
+
+
+def warm_up_index_payload():
+    """
+    Calcula (o lee de disco) el contenido de la página inicial al arrancar el
+    proceso, para que la primera visita no pague el costo de las figuras.
+    """
+    start = time.perf_counter()
+    try:
+        get_index_payload()
+    except Exception as e:
+        print(f"No se pudo precalcular la página inicial: {type(e).__name__}: {e}", file=sys.stderr)
+        return
+    elapsed = time.perf_counter() - start
+    print(f"Página inicial lista en {elapsed:.2f}s", file=sys.stderr)
+
+
+def clear_index_payload():
+    """Descarta el contenido en memoria (el de disco se conserva)"""
+    global _payload
+    with _lock:
+        _payload = None
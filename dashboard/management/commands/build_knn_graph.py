@@ -0,0 +1,97 @@
+"""
+Precalcula el grafo completo de K vecinos más cercanos de una configuración
+de similitud de clientes (ver client_similarity/knn_graph.py).
+
+    python manage.py build_knn_graph --k 20 --metric cosine --country "United Kingdom"
+    python manage.py build_knn_graph --edges red_clientes.csv
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.visualizations.client_similarity.data_processor import (
+    normalize_features,
+    prepare_customer_features,
+    similarity_config_key,
+)
+from dashboard.visualizations.client_similarity.distances import METRICS
+from dashboard.visualizations.client_similarity.knn_graph import (
+    build_knn_graph,
+    export_edge_list,
+    graph_path,
+    open_knn_graph,
+    save_knn_graph,
+)
+from dashboard.visualizations.shared.data_loader import (
+    get_cache_dir,
+    get_dataset_version,
+    load_online_retail_data,
+)
+
+
+class Command(BaseCommand):
+    help = 'Precalcula el grafo de K vecinos más cercanos de todos los clientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='Vecinos por cliente (por defecto 10)')
+        parser.add_argument('--metric', default='euclidean', choices=METRICS)
+        parser.add_argument('--normalization', default='zscore', choices=('zscore', 'minmax_01'))
+        parser.add_argument('--country', default=None, help='País a filtrar')
+        parser.add_argument('--start-date', default=None, help='Mes inicial (YYYY-MM)')
+        parser.add_argument('--end-date', default=None, help='Mes final (YYYY-MM)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Hilos para calcular los bloques (por defecto, los núcleos disponibles)')
+        parser.add_argument('--block-size', type=int, default=None,
+                            help='Filas de la matriz de distancias por bloque')
+        parser.add_argument('--edges', default=None,
+                            help='Exportar además el grafo como lista de aristas CSV en esta ruta')
+
+    def handle(self, *args, **options):
+        if options['k'] < 1:
+            raise CommandError('--k debe ser al menos 1')
+
+        df = load_online_retail_data()
+        version = get_dataset_version()
+        if df.height == 0 or version is None:
+            raise CommandError('El dataset no está disponible')
+
+        country = options['country']
+        start_date, end_date = options['start_date'], options['end_date']
+        metric, normalization = options['metric'], options['normalization']
+
+        customer_ids, features, _ = prepare_customer_features(country, start_date, end_date)
+        if len(customer_ids) < 2:
+            raise CommandError('No hay suficientes clientes para esos filtros')
+        features_normalized = normalize_features(features, normalization)
+
+        start = time.perf_counter()
+        graph = build_knn_graph(
+            features_normalized, k=options['k'], metric=metric,
+            block_size=options['block_size'], workers=options['workers']
+        )
+        elapsed = time.perf_counter() - start
+
+        config_key = similarity_config_key(metric, normalization, country, start_date, end_date)
+        path = graph_path(get_cache_dir(), version, config_key)
+        k = int(graph[0][1]) if len(graph[0]) > 1 else 0
+        save_knn_graph(path, graph, customer_ids, {
+            'k': k,
+            'metric': metric,
+            'normalization': normalization,
+            'country': country,
+            'start_date': start_date,
+            'end_date': end_date,
+            'customers': len(customer_ids),
+            'dataset_version': version,
+            'config_key': config_key,
+        })
+        self.stdout.write(
+            f'Grafo de {len(customer_ids)} clientes y k={k} calculado en {elapsed:.2f}s: {path}'
+        )
+
+        if options['edges']:
+            saved = open_knn_graph(path)
+            if saved is None:
+                raise CommandError(f'No se pudo abrir el grafo guardado en {path}')
+            count = export_edge_list(saved, options['edges'])
+            self.stdout.write(f'{count} aristas exportadas a {options["edges"]}')
@@ -0,0 +1,344 @@
+"""
+Caché de resultados de los endpoints de la API.
+
+La interfaz repite constantemente las mismas consultas (perfiles globales,
+tendencia por defecto, las mismas ventanas de meses del slider), así que la
+respuesta serializada de cada endpoint se guarda con la clave:
+
+    (endpoint, parámetros canónicos, versión del dataset, formato de respuesta)
+
+Los parámetros de filtro se normalizan con FilterSpec (dos peticiones
+equivalentes comparten entrada) y la versión del dataset invalida todo al
+cambiar los datos.
+
+La caché tiene un presupuesto de memoria (DASHBOARD_RESULT_CACHE_MAX_BYTES) y
+un tiempo de vida (DASHBOARD_RESULT_CACHE_TTL). El desalojo sigue la política
+GreedyDual-Size: la prioridad de cada entrada es L + costo / tamaño, donde el
+costo es el tiempo que tardó en calcularse y L crece con cada desalojo. Sin
+diferencias de costo equivale a LRU; con ellas, los resultados caros (por
+ejemplo, la similitud de clientes) permanecen más tiempo. Una respuesta nueva
+solo se admite si su prioridad supera la de las entradas que tendría que
+desalojar.
+
+Esa caché en memoria es el primer nivel, propio de cada worker. El segundo
+nivel es la caché de Django con alias 'results' (settings.CACHES), compartida
+entre todos los workers: por defecto archivos en el directorio de caché, o un
+servidor compatible con Redis (ver cache_backends.py). Un fallo del primer
+nivel consulta el segundo antes de calcular, de modo que cada resultado caro
+se calcula una sola vez para todos los workers.
+"""
+import functools
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .visualizations.shared.data_loader import get_setting, get_dataset_version
+from .visualizations.shared.filters import FilterSpec
+
+# Alias de settings.CACHES del segundo nivel, compartido entre workers
+RESULTS_CACHE_ALIAS = 'results'
+
+# Versión del formato de las respuestas: forma parte de la clave para que la
+# caché compartida no sirva respuestas de un formato anterior tras un despliegue
+RESPONSE_FORMAT = 3
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 900
+
+
+class _Entry:
+    """Respuesta guardada con su costo, tamaño, prioridad y vencimiento"""
+
+    __slots__ = ('status', 'content_type', 'content', 'cost', 'size', 'priority', 'expires_at')
+
+    def __init__(self, status, content_type, content, cost):
+        self.status = status
+        self.content_type = content_type
+        self.content = content
+        self.cost = cost
+        self.size = len(content)
+        self.priority = 0.0
+        self.expires_at = None
+
+    @classmethod
+    def from_response(cls, response, cost):
+        return cls(response.status_code, response['Content-Type'], response.content, cost)
+
+    def to_response(self):
+        return HttpResponse(self.content, content_type=self.content_type, status=self.status)
+
+    def to_shared(self):
+        """Valor que se guarda en la caché compartida"""
+        return (self.status, self.content_type, self.content, self.cost)
+
+
+class ResultCache:
+    """Caché GreedyDual-Size con presupuesto de bytes y TTL, segura entre hilos"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.bytes = 0
+        # Prioridad de la última entrada desalojada (inflación de GreedyDual)
+        self.inflation = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    @property
+    def max_bytes(self):
+        return max(0, int(get_setting('DASHBOARD_RESULT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)))
+
+    @property
+    def ttl(self):
+        return float(get_setting('DASHBOARD_RESULT_CACHE_TTL', DEFAULT_TTL))
+
+    def _priority(self, entry):
+        return self.inflation + entry.cost / max(1, entry.size)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+        return entry
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            # Un acierto renueva la prioridad, como en LRU
+            entry.priority = self._priority(entry)
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """Guarda una respuesta si cabe en el presupuesto y su prioridad lo justifica"""
+        max_bytes = self.max_bytes
+        ttl = self.ttl
+        entry.expires_at = time.monotonic() + ttl if ttl > 0 else None
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if entry.size > max_bytes:
+                self.rejections += 1
+                return False
+
+            entry.priority = self._priority(entry)
+
+            # Elegir víctimas por menor prioridad (las vencidas primero)
+            needed = self.bytes + entry.size - max_bytes
+            victims = []
+            if needed > 0:
+                now = time.monotonic()
+                candidates = sorted(
+                    self.entries.items(),
+                    key=lambda item: (
+                        item[1].expires_at is None or item[1].expires_at > now,
+                        item[1].priority
+                    )
+                )
+                for victim_key, victim in candidates:
+                    if needed <= 0:
+                        break
+                    expired = victim.expires_at is not None and victim.expires_at <= now
+                    if not expired and victim.priority > entry.priority:
+                        # Admisión: no se desalojan resultados más valiosos
+                        self.rejections += 1
+                        return False
+                    victims.append((victim_key, victim))
+                    needed -= victim.size
+
+            for victim_key, victim in victims:
+                self._remove(victim_key)
+                self.inflation = max(self.inflation, victim.priority)
+                self.evictions += 1
+
+            self.entries[key] = entry
+            self.bytes += entry.size
+            return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+            self.inflation = 0.0
+
+    def stats(self):
+        """Aciertos, fallos, tamaño y desalojos de la caché (para /healthz)"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'rejections': self.rejections,
+                'shared_backend': _shared_backend_name(),
+                'shared_hits': self.shared_hits,
+                'shared_errors': self.shared_errors,
+            }
+
+
+_cache = ResultCache()
+
+
+def _shared_cache():
+    """Caché de Django compartida entre workers (alias 'results'), o None"""
+    if RESULTS_CACHE_ALIAS not in settings.CACHES:
+        return None
+    return caches[RESULTS_CACHE_ALIAS]
+
+
+def _shared_backend_name():
+    backend = settings.CACHES.get(RESULTS_CACHE_ALIAS, {}).get('BACKEND')
+    return backend.rsplit('.', 1)[-1] if backend else None
+
+
+def _shared_key(key):
+    """Clave de la caché compartida: hash estable de la clave completa"""
+    return hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+
+
+def _shared_get(key):
+    """Busca una respuesta calculada por cualquier worker (None si no está)"""
+    shared = _shared_cache()
+    if shared is None:
+        return None
+    try:
+        value = shared.get(_shared_key(key))
+    except Exception as e:
+        _cache.shared_errors += 1
+        print(f"Error leyendo la caché compartida: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+    if value is None:
+        return None
+    _cache.shared_hits += 1
+    return _Entry(*value)
+
+
+def _shared_set(key, entry):
+    """Publica una respuesta para el resto de workers"""
+    shared = _shared_cache()
+    if shared is None:
+        return
+    try:
+        shared.set(_shared_key(key), entry.to_shared())
+    except Exception as e:
+        _cache.shared_errors += 1
+        print(f"Error escribiendo la caché compartida: {type(e).__name__}: {e}", file=sys.stderr)
+
+
+def canonical_params(request, kwargs, spec_params=None):
+    """
+    Parámetros canónicos de una petición: los de filtro normalizados con
+    FilterSpec y el resto (query string, URL y cuerpo JSON) ordenados por nombre.
+
+    Args:
+        request: HttpRequest
+        kwargs: parámetros de la URL
+        spec_params: dict {parámetro de la petición: campo de FilterSpec}
+
+    Returns:
+        tuple hashable; lanza ValueError si los parámetros no son válidos
+    """
+    params = {name: value for name, value in request.GET.items()}
+    params.update(kwargs)
+    if request.method == 'POST':
+        body = json.loads(request.body or b'{}')
+        if not isinstance(body, dict):
+            raise ValueError('Cuerpo JSON no válido')
+        params.update(body)
+
+    spec_values = {
+        field: params.pop(name)
+        for name, field in (spec_params or {}).items()
+        if name in params
+    }
+    spec_key = FilterSpec.from_params(**spec_values).key if spec_params else ()
+    return spec_key, json.dumps(params, sort_keys=True, default=str)
+
+
+def cache_result(endpoint, spec_params=None):
+    """
+    Decorador de vistas: sirve la respuesta desde la caché de resultados
+    cuando la misma consulta ya se respondió con la versión actual del dataset.
+
+    Solo se guardan respuestas 200. Si el dataset no está cargado o los
+    parámetros no son válidos, la vista se ejecuta sin caché.
+
+    Args:
+        endpoint: nombre del endpoint (parte de la clave)
+        spec_params: dict {parámetro de la petición: campo de FilterSpec} de
+            los parámetros de filtro que se normalizan
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            version = get_dataset_version()
+            key = None
+            if version is not None and _cache.max_bytes > 0:
+                try:
+                    key = (endpoint, canonical_params(request, kwargs, spec_params), version, RESPONSE_FORMAT)
+                except ValueError:
+                    key = None
+
+            if key is not None:
+                entry = _cache.get(key)
+                status = 'hit'
+                if entry is None:
+                    # Resultado calculado por otro worker
+                    entry = _shared_get(key)
+                    status = 'shared-hit'
+                    if entry is not None:
+                        _cache.put(key, entry)
+                if entry is not None:
+                    response = entry.to_response()
+                    response['X-Result-Cache'] = status
+                    return response
+
+            start = time.perf_counter()
+            response = view(request, *args, **kwargs)
+            cost = time.perf_counter() - start
+
+            if key is not None and response.status_code == 200:
+                # La versión puede haber cambiado durante el cálculo
+                if get_dataset_version() == version:
+                    entry = _Entry.from_response(response, cost)
+                    stored = _cache.put(key, entry)
+                    _shared_set(key, entry)
+                    response['X-Result-Cache'] = 'miss' if stored else 'bypass'
+            return response
+        return wrapper
+    return decorator
+
+
+def get_result_cache_stats():
+    """Estadísticas de la caché de resultados"""
+    return _cache.stats()
+
+
+def clear_result_cache():
+    """Vacía la caché de resultados (la de este proceso y la compartida)"""
+    _cache.clear()
+    shared = _shared_cache()
+    if shared is not None:
+        shared.clear()
@@ -0,0 +1,119 @@
+"""
+Serialización JSON de las respuestas y figuras del dashboard.
+
+Las figuras de Plotly se serializan una sola vez, como objeto anidado dentro
+de la respuesta (no como texto JSON dentro de otro JSON), con orjson: soporta
+de forma nativa arrays de numpy, fechas y datetimes, y escribe NaN como null
+igual que PlotlyJSONEncoder. Si orjson no está instalado se usa el módulo
+json estándar con PlotlyJSONEncoder.
+
+Las figuras serializadas se guardan como bytes por (figura, filtros, versión
+del dataset) en una caché LRU (DASHBOARD_FIGURE_CACHE_SIZE): la página
+inicial y los endpoints sin filtros comparten las mismas figuras, y una
+respuesta se arma empalmando esos bytes sin volver a codificarlos.
+"""
+import decimal
+import json
+
+import plotly.utils
+from django.http import HttpResponse
+
+from .visualizations.shared.data_loader import get_dataset_version
+from .visualizations.shared.lru import LRUCache
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+DEFAULT_FIGURE_CACHE_SIZE = 128
+
+# Caracteres que se escapan para poder incrustar el JSON en un <script>
+_SCRIPT_ESCAPES = {
+    b'<': b'\\u003c',
+    b'>': b'\\u003e',
+    b'&': b'\\u0026',
+}
+
+
+def _default(obj):
+    """Tipos que orjson no serializa de forma nativa"""
+    if hasattr(obj, 'to_plotly_json'):
+        return obj.to_plotly_json()
+    if hasattr(obj, 'tolist'):
+        # Arrays de numpy de tipo object o no contiguos
+        return obj.tolist()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def dumps(obj):
+    """Serializa a bytes JSON (figuras de Plotly incluidas) en una sola pasada"""
+    if orjson is not None:
+        return orjson.dumps(
+            obj,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(
+        obj, cls=plotly.utils.PlotlyJSONEncoder, separators=(',', ':'), ensure_ascii=False
+    ).encode('utf-8')
+
+
+def script_safe(data):
+    """JSON en bytes apto para incrustarse en un <script> de la plantilla"""
+    for char, escaped in _SCRIPT_ESCAPES.items():
+        data = data.replace(char, escaped)
+    return data.decode('utf-8')
+
+
+_figure_cache = LRUCache('DASHBOARD_FIGURE_CACHE_SIZE', DEFAULT_FIGURE_CACHE_SIZE)
+
+
+def figure_bytes(name, key, build):
+    """
+    Figura serializada, desde la caché de bytes si ya se construyó para los
+    mismos filtros y versión del dataset.
+
+    Args:
+        name: nombre de la figura
+        key: clave hashable de los filtros (por ejemplo, FilterSpec.key)
+        build: función sin argumentos que construye la figura
+
+    Returns:
+        bytes con el JSON de la figura
+    """
+    version = get_dataset_version()
+    cache_key = (name, key, version)
+    data = _figure_cache.get(cache_key) if version is not None else None
+    if data is None:
+        data = dumps(build())
+        # Solo se guarda si el dataset estaba (y sigue) cargado
+        if version is not None and get_dataset_version() == version:
+            _figure_cache.put(cache_key, data)
+    return data
+
+
+def json_response(data, status=200, **figures):
+    """
+    Respuesta JSON serializada en una pasada.
+
+    Args:
+        data: dict con los campos de la respuesta
+        status: código HTTP
+        **figures: campos cuyo valor ya es JSON en bytes (por ejemplo, de
+            figure_bytes), que se empalman sin volver a codificarse
+    """
+    body = dumps(data)
+    if figures:
+        members = b','.join(dumps(name) + b':' + value for name, value in figures.items())
+        body = b'{' + members + (b',' + body[1:] if body != b'{}' else b'}')
+    return HttpResponse(body, content_type='application/json', status=status)
+
+
+def get_figure_cache_stats():
+    """Estadísticas de la caché de figuras serializadas"""
+    return _figure_cache.stats()
@@ -0,0 +1,100 @@
+"""
+Configuraciones de similitud de clientes referenciadas por clave.
+
+El endpoint de similitud devuelve, junto con el embedding, la clave de su
+configuración (filtros, normalización y métrica; ver
+data_processor.similarity_config_key). Al seleccionar otro cliente la
+interfaz solo envía esa clave, el cliente y k al endpoint de vecinos, que
+recupera aquí la configuración para buscar los vecinos sin volver a enviar
+el embedding.
+
+Las configuraciones se guardan en memoria en cada worker y en la caché
+compartida de resultados (alias 'results'), porque la respuesta con la clave
+puede haberla calculado otro worker.
+"""
+import sys
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .result_cache import RESULTS_CACHE_ALIAS
+from .visualizations.client_similarity.data_processor import similarity_config_key
+from .visualizations.shared.lru import LRUCache
+
+DEFAULT_CONFIG_CACHE_SIZE = 1024
+
+CONFIG_FIELDS = ('metric', 'normalization', 'country', 'start_date', 'end_date')
+
+_configs = LRUCache('DASHBOARD_SIMILARITY_CONFIG_CACHE_SIZE', DEFAULT_CONFIG_CACHE_SIZE)
+
+
+def _shared_cache():
+    """Caché de Django compartida entre workers, o None"""
+    if RESULTS_CACHE_ALIAS not in settings.CACHES:
+        return None
+    return caches[RESULTS_CACHE_ALIAS]
+
+
+def _shared_key(config_key):
+    return f'similarity-config:{config_key}'
+
+
+def register_similarity_config(metric='euclidean', normalization='zscore',
+                               country=None, start_date=None, end_date=None):
+    """
+    Registra una configuración de similitud.
+
+    Returns:
+        clave de la configuración (str hex)
+    """
+    config = {
+        'metric': metric,
+        'normalization': normalization,
+        'country': country,
+        'start_date': start_date,
+        'end_date': end_date,
+    }
+    config_key = similarity_config_key(**config)
+    if _configs.get(config_key) is None:
+        _configs.put(config_key, config)
+        shared = _shared_cache()
+        if shared is not None:
+            try:
+                # Sin vencimiento: la respuesta con la clave puede durar más
+                # que el TTL de la caché de resultados
+                shared.set(_shared_key(config_key), config, timeout=None)
+            except Exception as e:
+                print(f"Error guardando la configuración de similitud: {type(e).__name__}: {e}", file=sys.stderr)
+    return config_key
+
+
+def get_similarity_config(config_key):
+    """
+    Configuración registrada con esa clave, o None si no se conoce.
+
+    Returns:
+        dict con metric, normalization, country, start_date y end_date
+    """
+    if not isinstance(config_key, str) or not config_key:
+        return None
+    config = _configs.get(config_key)
+    if config is not None:
+        return config
+
+    shared = _shared_cache()
+    if shared is None:
+        return None
+    try:
+        config = shared.get(_shared_key(config_key))
+    except Exception as e:
+        print(f"Error leyendo la configuración de similitud: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+    if not isinstance(config, dict) or set(config) != set(CONFIG_FIELDS):
+        return None
+    _configs.put(config_key, config)
+    return config
+
+
+def clear_similarity_configs():
+    """Descarta las configuraciones en memoria (las compartidas se conservan)"""
+    _configs.clear()
@@ -597,7 +597,7 @@ document.addEventListener('DOMContentLoaded', function () {
                     fetch(url)
                         .then(response => response.json())
                         .then(data => {
-                            const newGraphData = JSON.parse(data.graph);
+                            const newGraphData = data.graph;
                             Plotly.react(profilesDiv, newGraphData.data, newGraphData.layout).then(function() {
                                 Plotly.relayout(profilesDiv, { 'dragmode': false });
                                 setupProfileClickEvents();
@@ -655,7 +655,7 @@ document.addEventListener('DOMContentLoaded', function () {
             fetch(url)
                 .then(response => response.json())
                 .then(data => {
-                    const graphData = JSON.parse(data.graph);
+                    const graphData = data.graph;
 
                     Plotly.react(salesDiv, graphData.data, graphData.layout, {
                         responsive: true,
@@ -733,7 +733,7 @@ document.addEventListener('DOMContentLoaded', function () {
             fetch(url)
                 .then(response => response.json())
                 .then(data => {
-                    const graphData = JSON.parse(data.graph);
+                    const graphData = data.graph;
 
                     Plotly.react(productsDiv, graphData.data, graphData.layout, {
                         responsive: true,
@@ -1077,7 +1077,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 fetch(profileUrl)
                     .then(response => response.json())
                     .then(data => {
-                        const newGraphData = JSON.parse(data.graph);
+                        const newGraphData = data.graph;
                         Plotly.react(profilesDiv, newGraphData.data, newGraphData.layout).then(function() {
                             // Deshabilitar dragmode para evitar cursor de cruz
                             Plotly.relayout(profilesDiv, {
@@ -1146,6 +1146,7 @@ document.addEventListener('DOMContentLoaded', function () {
     const totalCustomersSpan = document.getElementById('totalCustomers');
     
     let currentSimilarityData = null;
+    let currentSimilarityConfig = null; // Filtros y opciones (sin cliente ni K) de currentSimilarityData
     let customerIdsCache = null; // Cache para IDs de clientes
     let isLoadingCustomerIds = false; // Estado de carga
     let similarityGraphCache = {}; // Cache para diferentes configuraciones del gráfico
@@ -1307,6 +1308,66 @@ document.addEventListener('DOMContentLoaded', function () {
             return;
         }
         
+        // Configuración del embedding: todo lo que no es el cliente ni K
+        const configKey = `${selectedCountry || 'all'}_${selectedStartDate || 'start'}_${selectedEndDate || 'end'}_${norm}_${met}_${dim}_${xAxisFeature}_${yAxisFeature}`;
+        
+        // Si solo cambió el cliente o K, reutilizar el embedding actual
+        if (currentSimilarityData && currentSimilarityData.config_key && currentSimilarityConfig === configKey) {
+            if (!customerId) {
+                const data = { ...currentSimilarityData, neighbors: [], edges: [] };
+                currentSimilarityData = data;
+                similarityGraphCache[cacheKey] = data;
+                renderSimilarityGraph(data, customerId, met, norm);
+                return;
+            }
+            fetchSimilarityNeighbors(customerId, k, cacheKey, configKey, met, norm, dim, xAxisFeature, yAxisFeature);
+            return;
+        }
+        
+        fetchSimilarityGraph(customerId, k, cacheKey, configKey, met, norm, dim, xAxisFeature, yAxisFeature);
+    }
+    
+    // Función para pedir solo los vecinos de un cliente sobre el embedding actual
+    function fetchSimilarityNeighbors(customerId, k, cacheKey, configKey, met, norm, dim, xAxisFeature, yAxisFeature) {
+        const params = new URLSearchParams({
+            config_key: currentSimilarityData.config_key,
+            customer_id: customerId,
+            k: k
+        });
+        
+        applyButton.disabled = true;
+        applyButton.textContent = 'Calculando...';
+        
+        fetch('/api/client-similarity/neighbors/?' + params.toString())
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Error del servidor (${response.status})`);
+                }
+                return response.json();
+            })
+            .then(result => {
+                const data = {
+                    ...currentSimilarityData,
+                    neighbors: result.neighbors,
+                    edges: result.edges
+                };
+                currentSimilarityData = data;
+                similarityGraphCache[cacheKey] = data;
+                renderSimilarityGraph(data, customerId, met, norm);
+                
+                applyButton.disabled = false;
+                applyButton.textContent = 'APLICAR';
+            })
+            .catch(error => {
+                // Configuración desconocida para el servidor u otro error:
+                // pedir el gráfico completo
+                console.warn('No se pudieron obtener solo los vecinos:', error.message);
+                fetchSimilarityGraph(customerId, k, cacheKey, configKey, met, norm, dim, xAxisFeature, yAxisFeature);
+            });
+    }
+    
+    // Función para pedir el gráfico de similitud completo (embedding y vecinos)
+    function fetchSimilarityGraph(customerId, k, cacheKey, configKey, met, norm, dim, xAxisFeature, yAxisFeature) {
         // Mostrar mensaje de carga
         applyButton.disabled = true;
         applyButton.textContent = 'Calculando...';
@@ -1375,6 +1436,7 @@ document.addEventListener('DOMContentLoaded', function () {
             }
             
             currentSimilarityData = data;
+            currentSimilarityConfig = configKey;
             
             // Guardar en caché
             similarityGraphCache[cacheKey] = data;
@@ -2027,7 +2089,7 @@ document.addEventListener('DOMContentLoaded', function () {
             if (data.graph) {
                 console.log('Reemplazando gráfico de productos...');
                 // Reemplazar gráfico completo con Top 5 de clientes seleccionados
-                const newGraphData = JSON.parse(data.graph);
+                const newGraphData = data.graph;
                 Plotly.react(productsDiv, newGraphData.data, newGraphData.layout, {
                     responsive: true,
                     displayModeBar: false,
@@ -1 +1,1964 @@
-from django.test import TestCase
+import datetime
+import fnmatch
+import hashlib
+import io
+import json
+import math
+import random
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import plotly.graph_objects as go
+import polars as pl
+from django.core.management import CommandError, call_command
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import index_payload, result_cache, similarity_configs
+from .cache_backends import RedisCompatibleCache
+from .serialization import dumps
+from .visualizations.shared import data_loader, snapshot
+from .visualizations.shared.bitmaps import build_bitmap_index, pack_mask, select_rows
+from .visualizations.shared.cubes import CUBE_DAILY, CUBE_DIMENSIONS, CUBE_PRODUCTS, cube_path
+from .visualizations.shared.daily_index import DailySalesIndex, get_daily_sales_index
+from .visualizations.shared.filters import FilterSpec
+from .visualizations.shared.partitioned import ensure_partitioned, partitioned_path, scan_partitioned
+from .visualizations.shared.heavy_hitters import build_top_products_index, top_products
+from .visualizations.shared.quantiles import (
+    SUBSET_ALL,
+    SUBSET_VALID,
+    QuantileSummary,
+    build_quantile_index,
+    merged_upper_bounds,
+)
+from .visualizations.shared.time_index import (
+    build_month_index,
+    day_window,
+    intersect_windows,
+    month_days,
+    month_window,
+)
+from .visualizations.client_similarity.distances import compute_distance_matrix
+from .visualizations.client_similarity import data_processor, knn_graph, nn_index, stage_cache
+from .visualizations.client_similarity.data_processor import (
+    normalize_features,
+    prepare_customer_features,
+    similarity_config_key,
+)
+from .visualizations.client_similarity.knn import find_k_nearest_neighbors, find_k_nearest_neighbors_blocked
+from .visualizations.customer_profiles.plot import build_customer_profiles_figure
+from .visualizations.products.data_processor import get_top_products_data
+from .visualizations.products.plot import build_products_by_customers_figure, build_top_products_figure
+from .visualizations.sales.data_processor import get_sales_trend_data
+from .visualizations.sales.plot import build_sales_trend_figure
+from .visualizations.world_map.plot import build_world_map_figure
+
+
+class FakeRedis:
+    """Sustituto local de un cliente Redis: un dict con vencimientos"""
+
+    def __init__(self, location=None):
+        self.location = location
+        self.data = {}
+        self.expires = {}
+
+    def _alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def get(self, key):
+        return self.data.get(key) if self._alive(key) else None
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self._alive(key):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if ex is not None:
+            self.expires[key] = time.monotonic() + ex
+        return True
+
+    def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                deleted += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return deleted
+
+    def exists(self, key):
+        return int(self._alive(key))
+
+    def expire(self, key, seconds):
+        if not self._alive(key):
+            return False
+        self.expires[key] = time.monotonic() + seconds
+        return True
+
+    def scan_iter(self, match='*'):
+        return [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatchcase(key, match)]
+
+
+class RedisCompatibleCacheTests(SimpleTestCase):
+
+    def make_cache(self, **params):
+        self.client = FakeRedis()
+        params.setdefault('OPTIONS', {'CLIENT_FACTORY': lambda location: self.client})
+        return RedisCompatibleCache('redis://stand-in/0', params)
+
+    def test_set_get_roundtrip(self):
+        cache = self.make_cache()
+        value = (200, 'application/json', b'{"graph": {}}', 0.25)
+        cache.set('figure', value)
+        self.assertEqual(cache.get('figure'), value)
+        self.assertIsNone(cache.get('missing'))
+        self.assertEqual(cache.get('missing', 'default'), 'default')
+
+    def test_client_factory_receives_location(self):
+        cache = RedisCompatibleCache('redis://stand-in/0', {
+            'OPTIONS': {'CLIENT_FACTORY': FakeRedis},
+        })
+        self.assertEqual(cache.client.location, 'redis://stand-in/0')
+
+    def test_add_only_when_missing(self):
+        cache = self.make_cache()
+        self.assertTrue(cache.add('key', 1))
+        self.assertFalse(cache.add('key', 2))
+        self.assertEqual(cache.get('key'), 1)
+
+    def test_timeouts(self):
+        cache = self.make_cache(TIMEOUT=60)
+        cache.set('default', 1)
+        cache.set('forever', 2, timeout=None)
+        cache.set('expired', 3, timeout=0)
+        self.assertIn(cache.make_key('default'), self.client.expires)
+        self.assertNotIn(cache.make_key('forever'), self.client.expires)
+        self.assertFalse(cache.has_key('expired'))
+
+        self.client.expires[cache.make_key('default')] = time.monotonic() - 1
+        self.assertIsNone(cache.get('default'))
+        self.assertEqual(cache.get('forever'), 2)
+
+    def test_touch_and_delete(self):
+        cache = self.make_cache()
+        cache.set('key', 'value', timeout=10)
+        self.assertTrue(cache.touch('key', timeout=None))
+        self.assertNotIn(cache.make_key('key'), self.client.expires)
+        self.assertTrue(cache.delete('key'))
+        self.assertFalse(cache.delete('key'))
+        self.assertFalse(cache.touch('key'))
+
+    def test_clear_only_removes_own_prefix(self):
+        cache = self.make_cache(KEY_PREFIX='results')
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.client.set('other:1:a', b'keep')
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(self.client.get('other:1:a'), b'keep')
+
+
+# Figuras de referencia generadas con las funciones de graficado originales
+# (plotly.graph_objects, y la figura de productos por clientes armada dentro
+# de la vista) a partir de las mismas entradas, serializadas como lo hacían
+# las vistas (PlotlyJSONEncoder)
+BASELINE_FIGURES = Path(__file__).resolve().parent / 'testdata' / 'baseline_figures.json'
+
+
+def baseline_sales_data(data):
+    """Entrada de la tendencia de ventas con años enteros y el total que calcula el procesador"""
+    if data is None:
+        return None
+    data_by_year = {int(year): values for year, values in data['data_by_year'].items()}
+    total = 0
+    for year in data['years']:
+        total += sum(data_by_year[year]['sales'])
+    return {'years': data['years'], 'data_by_year': data_by_year, 'total_sales': total}
+
+
+class FigureParityTests(SimpleTestCase):
+    """Las figuras armadas como dicts son idénticas a las de las funciones originales"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(BASELINE_FIGURES, encoding='utf-8') as f:
+            cls.baseline = json.load(f)
+
+    def assertSameFigure(self, fig, expected):
+        self.assertEqual(json.loads(dumps(fig)), expected)
+        # Los validadores de Plotly aceptan el dict sin normalizar nada
+        self.assertEqual(json.loads(dumps(go.Figure(fig))), expected)
+
+    def test_sales_trend(self):
+        for case in self.baseline['sales_trend']:
+            with self.subTest(country=case['country'], profile=case['customer_profile']):
+                self.assertSameFigure(
+                    build_sales_trend_figure(
+                        baseline_sales_data(case['data']), case['country'], case['customer_profile']
+                    ),
+                    case['figure']
+                )
+
+    def test_top_products(self):
+        for case in self.baseline['top_products']:
+            with self.subTest(country=case['country'], profile=case['customer_profile']):
+                self.assertSameFigure(
+                    build_top_products_figure(case['data'], case['country'], case['customer_profile']),
+                    case['figure']
+                )
+
+    def test_customer_profiles(self):
+        for case in self.baseline['customer_profiles']:
+            with self.subTest(country=case['country']):
+                self.assertSameFigure(
+                    build_customer_profiles_figure(case['data'], case['country']),
+                    case['figure']
+                )
+
+    def test_world_map(self):
+        for case in self.baseline['world_map']:
+            self.assertSameFigure(build_world_map_figure(case['countries']), case['figure'])
+
+    def test_products_by_customers(self):
+        for case in self.baseline['products_by_customers']:
+            with self.subTest(category=case['category'], subcategory=case['subcategory']):
+                self.assertSameFigure(
+                    build_products_by_customers_figure(
+                        case['products'], case['quantities'], case['total_customers'],
+                        case['category'], case['subcategory']
+                    ),
+                    case['figure']
+                )
+
+
+COUNTRIES = ['United Kingdom'] * 6 + ['France'] * 2 + ['Germany', 'Spain']
+CATEGORIES = {'Home': ['Kitchen', 'Decor'], 'Toys': ['Games', 'Dolls'], 'Gifts': ['Cards']}
+MONTHS = [(2010, 12), (2011, 1), (2011, 2), (2011, 3), (2011, 4), (2011, 5), (2011, 6)]
+
+
+def retail_csv(seed=7, rows=3000, products=40, customers=60):
+    """
+    CSV sintético con el formato del dataset de origen: ventas sesgadas (pocos
+    productos y países concentran la mayoría), precios continuos, algunas
+    cancelaciones y días sin ventas (domingos)
+    """
+    rng = random.Random(seed)
+    catalog = []
+    for p in range(products):
+        category = rng.choice(sorted(CATEGORIES))
+        catalog.append((f'{85000 + p}', f'PRODUCT {p:02d}', category, rng.choice(CATEGORIES[category])))
+    weights = [1.0 / (rank + 1) ** 1.2 for rank in range(products)]
+    lines = ['InvoiceNo,StockCode,Description,Quantity,InvoiceDate,UnitPrice,CustomerID,Country,Category,Subcategory']
+    for i in range(rows):
+        year, month = rng.choice(MONTHS)
+        day = rng.randint(1, 28)
+        while time.strptime(f'{year}-{month:02d}-{day:02d}', '%Y-%m-%d').tm_wday == 6:
+            day = rng.randint(1, 28)
+        stock_code, description, category, subcategory = rng.choices(catalog, weights)[0]
+        quantity = int(rng.paretovariate(1.5) * 2)
+        invoice = f'{536000 + i // 3}'
+        if rng.random() < 0.03:
+            invoice, quantity = f'C{invoice}', -quantity
+        lines.append(','.join([
+            invoice, stock_code, description, str(quantity),
+            f'{year}-{month:02d}-{day:02d} {rng.randint(8, 19):02d}:{rng.randint(0, 59):02d}:00',
+            f'{rng.lognormvariate(1.0, 0.9):.4f}', f'{12000 + rng.randrange(customers)}.0',
+            rng.choice(COUNTRIES), category, subcategory,
+        ]))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def reset_dataset_state():
+    """Descarta el dataset cargado en el proceso y su estado de carga"""
+    data_loader._state.__init__()
+
+
+class RetailDataMixin:
+    """
+    Carga el CSV sintético como dataset del proceso, con un directorio de
+    caché temporal y cachés en memoria
+    """
+    loader_settings = {}
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        self.enterContext(override_settings(**{
+            'DASHBOARD_DATA_CACHE_DIR': self.cache_dir,
+            'DASHBOARD_DATA_SHARED': False,
+            'DASHBOARD_DATA_STORE': 'memory',
+            'DASHBOARD_DATA_RETRY_BACKOFF': 0,
+            'CACHES': {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'results': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+            },
+            **self.loader_settings,
+        }))
+        self.raw = retail_csv()
+        self.fingerprint = hashlib.sha256(self.raw).hexdigest()
+        self.source = self.enterContext(mock.patch.object(
+            data_loader, 'load_with_snapshot',
+            side_effect=lambda source, parse, cache_dir: (parse(self.raw), self.fingerprint)
+        ))
+        reset_dataset_state()
+        self.addCleanup(reset_dataset_state)
+
+
+class DatasetLoadingTests(RetailDataMixin, SimpleTestCase):
+    """Carga única por proceso, reintentos sin cachear fallos y /readyz"""
+
+    loader_settings = {'DASHBOARD_DATA_LOAD_ATTEMPTS': 2}
+
+    def failing_source(self, failures, release=None):
+        """Origen que falla las primeras `failures` llamadas y luego carga el CSV"""
+        calls = []
+
+        def load(source, parse, cache_dir):
+            calls.append(source)
+            if release is not None:
+                release.wait(5)
+            if len(calls) <= failures:
+                raise ConnectionError(f'fallo simulado {len(calls)}')
+            return parse(self.raw), self.fingerprint
+
+        self.source.side_effect = load
+        return calls
+
+    def test_concurrent_callers_trigger_one_load(self):
+        release = threading.Event()
+        calls = self.failing_source(0, release)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(data_loader.load_online_retail_data()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(df is results[0] for df in results))
+        self.assertGreater(results[0].height, 0)
+
+    def test_failures_are_not_cached(self):
+        # 2 intentos por carga: la primera carga agota los reintentos
+        calls = self.failing_source(3)
+
+        df = data_loader.load_online_retail_data()
+        self.assertTrue(df.is_empty())
+        status = data_loader.get_dataset_status()
+        self.assertEqual(status['status'], data_loader.STATUS_FAILED)
+        self.assertIn('fallo simulado 2', status['error'])
+        self.assertIsNone(data_loader.get_dataset_version())
+        self.assertEqual(len(calls), 2)
+
+        # La siguiente llamada vuelve a intentarlo: falla una vez más y carga
+        df = data_loader.load_online_retail_data()
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(df.height, 3000)
+        status = data_loader.get_dataset_status()
+        self.assertEqual(status['status'], data_loader.STATUS_READY)
+        self.assertEqual(status['attempts'], 2)
+        self.assertIsNone(status['error'])
+        self.assertEqual(data_loader.get_dataset_version(), self.fingerprint)
+
+        # Ya cargado no se vuelve a leer el origen
+        data_loader.load_online_retail_data()
+        self.assertEqual(len(calls), 4)
+
+    def test_readyz_reports_503_until_loaded(self):
+        release = threading.Event()
+        calls = self.failing_source(1, release)
+
+        response = self.client.get('/readyz/')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['ready'])
+        # Mientras carga (y reintenta) sigue sin estar listo
+        self.assertEqual(self.client.get('/readyz/').status_code, 503)
+
+        release.set()
+        deadline = time.monotonic() + 10
+        while data_loader.get_dataset_version() is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        response = self.client.get('/readyz/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['ready'])
+        self.assertEqual(response.json()['rows'], 3000)
+        self.assertEqual(len(calls), 2)
+
+
+class PersistedIndexTests(RetailDataMixin, SimpleTestCase):
+    """Los índices mapeados desde el directorio de caché equivalen a construirlos en memoria"""
+
+    def test_indexes_are_mapped_from_cache_dir(self):
+        df = data_loader.load_online_retail_data()
+        self.assertTrue(any(Path(self.cache_dir).glob('retail-*.indexes-*.bitmaps.npy')))
+
+        # Otro proceso (estado nuevo) abre los mismos archivos sin reconstruirlos
+        reset_dataset_state()
+        with mock.patch('dashboard.visualizations.shared.index_files._write_indexes') as write:
+            df = data_loader.load_online_retail_data()
+        write.assert_not_called()
+
+        self.assertEqual(data_loader.get_month_index(), build_month_index(df))
+
+        bitmap_index = data_loader.get_bitmap_index()
+        expected = build_bitmap_index(df)
+        self.assertEqual(bitmap_index.keys(), expected.keys())
+        for column, by_value in expected.items():
+            self.assertEqual(bitmap_index[column].keys(), by_value.keys())
+            for value, bitmap in by_value.items():
+                self.assertIsInstance(bitmap_index[column][value], np.memmap)
+                np.testing.assert_array_equal(bitmap_index[column][value], bitmap)
+
+        settings = data_loader.get_quantile_settings()
+        quantile_index = data_loader.get_quantile_index()
+        expected = build_quantile_index(df, settings['epsilon'], settings['exact_limit'])
+        self.assertEqual(quantile_index.keys(), expected.keys())
+        for key, by_month in expected.items():
+            for year_month, by_column in by_month.items():
+                for column, summary in by_column.items():
+                    stored = quantile_index[key][year_month][column]
+                    np.testing.assert_array_equal(stored.values, summary.values)
+                    np.testing.assert_array_equal(stored.weights, summary.weights)
+                    self.assertEqual(stored.rank_error, summary.rank_error)
+
+        top_products_index = data_loader.get_top_products_index()
+        expected = build_top_products_index(df, data_loader.get_top_products_summary_size())
+        sort_columns = ['year_month', 'Country', 'Category', 'Subcategory', 'Description']
+        self.assertTrue(top_products_index.entries.sort(sort_columns).equals(expected.entries.sort(sort_columns)))
+        self.assertTrue(top_products_index.residuals.sort(sort_columns[:-1]).equals(
+            expected.residuals.sort(sort_columns[:-1])))
+
+    def test_settings_change_rebuilds_indexes(self):
+        data_loader.load_online_retail_data()
+        reset_dataset_state()
+        with override_settings(DASHBOARD_TOP_PRODUCTS_SUMMARY_SIZE=3):
+            data_loader.load_online_retail_data()
+            self.assertEqual(data_loader.get_top_products_index().size, 3)
+        # Solo quedan los índices de la configuración vigente
+        self.assertEqual(len(list(Path(self.cache_dir).glob('retail-*.indexes-*.json'))), 1)
+
+
+class SnapshotTests(SimpleTestCase):
+    """Reutilización y reconstrucción del snapshot local según el validador del origen"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        self.source = self.cache_dir / 'origen.csv'
+        self.source.write_bytes(retail_csv(rows=200))
+        self.parsed = []
+
+    def parse(self, raw):
+        self.parsed.append(raw)
+        return pl.read_csv(raw)
+
+    def load(self, source=None):
+        return snapshot.load_with_snapshot(str(source or self.source), self.parse, self.cache_dir)
+
+    def snapshots(self):
+        return sorted(path.name for path in self.cache_dir.glob('retail-*.arrow'))
+
+    def test_matching_validator_reuses_snapshot(self):
+        df, fingerprint = self.load()
+        self.assertEqual(fingerprint, hashlib.sha256(self.source.read_bytes()).hexdigest())
+        self.assertEqual(len(self.parsed), 1)
+
+        with mock.patch.object(snapshot, 'read_source_bytes') as read:
+            reused, reused_fingerprint = self.load()
+        read.assert_not_called()
+        self.assertEqual(len(self.parsed), 1)
+        self.assertEqual(reused_fingerprint, fingerprint)
+        self.assertTrue(reused.equals(df))
+
+    def test_changed_content_rebuilds_and_unlinks_old_snapshot(self):
+        _, old_fingerprint = self.load()
+        old_snapshots = self.snapshots()
+
+        self.source.write_bytes(retail_csv(seed=8, rows=200))
+        df, fingerprint = self.load()
+        self.assertNotEqual(fingerprint, old_fingerprint)
+        self.assertEqual(len(self.parsed), 2)
+        self.assertEqual(df.height, 200)
+        self.assertEqual(self.snapshots(), [snapshot.snapshot_path(self.cache_dir, fingerprint).name])
+        self.assertNotEqual(self.snapshots(), old_snapshots)
+
+    def test_unreachable_source_uses_last_snapshot(self):
+        df, fingerprint = self.load()
+        with mock.patch.object(snapshot, 'get_source_validator', return_value=None), \
+                mock.patch.object(snapshot, 'read_source_bytes') as read:
+            reused, reused_fingerprint = self.load()
+        read.assert_not_called()
+        self.assertEqual(reused_fingerprint, fingerprint)
+        self.assertTrue(reused.equals(df))
+
+    def test_source_without_validator_compares_fingerprint(self):
+        url = 'https://example.com/retail.csv'
+        contents = [retail_csv(rows=200)]
+        with mock.patch.object(snapshot, 'get_source_validator', return_value=snapshot.NO_VALIDATOR), \
+                mock.patch.object(snapshot, 'read_source_bytes', side_effect=lambda source: contents[-1]) as read:
+            _, fingerprint = self.load(url)
+            # Mismo contenido: se descarga, pero no se vuelve a parsear
+            _, same_fingerprint = self.load(url)
+            self.assertEqual(read.call_count, 2)
+            self.assertEqual(len(self.parsed), 1)
+            self.assertEqual(same_fingerprint, fingerprint)
+
+            # Contenido nuevo sin cambio de validador: se reconstruye
+            contents.append(retail_csv(seed=8, rows=200))
+            _, new_fingerprint = self.load(url)
+        self.assertEqual(len(self.parsed), 2)
+        self.assertEqual(new_fingerprint, hashlib.sha256(contents[-1]).hexdigest())
+        self.assertEqual(self.snapshots(), [snapshot.snapshot_path(self.cache_dir, new_fingerprint).name])
+
+    def test_url_validator(self):
+        def head(headers):
+            response = mock.MagicMock()
+            response.__enter__.return_value.headers = headers
+            return response
+
+        url = 'https://example.com/retail.csv'
+        with mock.patch('urllib.request.urlopen', return_value=head({'ETag': '"abc"'})):
+            self.assertEqual(snapshot.get_source_validator(url), 'etag:"abc"')
+        with mock.patch('urllib.request.urlopen', return_value=head({})):
+            self.assertEqual(snapshot.get_source_validator(url), snapshot.NO_VALIDATOR)
+        with mock.patch('urllib.request.urlopen', side_effect=OSError('sin red')):
+            self.assertIsNone(snapshot.get_source_validator(url))
+
+
+def baseline_filter(df, country=None, start_date=None, end_date=None, customer_profile=None):
+    """
+    Filtros de país, meses y perfil encadenados como en los endpoints
+    originales: fechas, país y clasificación IQR sobre las filas filtradas
+    """
+    if start_date:
+        df = df.filter(pl.col('InvoiceDate') >= datetime.datetime.strptime(start_date + '-01', '%Y-%m-%d'))
+    if end_date:
+        year, month = map(int, end_date.split('-'))
+        next_month = datetime.datetime(year + month // 12, month % 12 + 1, 1)
+        df = df.filter(pl.col('InvoiceDate') <= next_month - datetime.timedelta(seconds=1))
+    if country:
+        df = df.filter(pl.col('Country') == country)
+    if customer_profile:
+        bounds = {}
+        for column in ('Total', 'UnitPrice'):
+            q1 = df[column].quantile(0.25)
+            q3 = df[column].quantile(0.75)
+            bounds[column] = q3 + 1.5 * (q3 - q1)
+        total_upper, price_upper = bounds['Total'], bounds['UnitPrice']
+        df = df.with_columns(
+            pl.when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') <= price_upper))
+            .then(pl.lit('Mayorista Estándar'))
+            .when((pl.col('Total') <= total_upper) & (pl.col('UnitPrice') > price_upper))
+            .then(pl.lit('Minorista Lujo'))
+            .when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') > price_upper))
+            .then(pl.lit('Mayorista Lujo'))
+            .otherwise(pl.lit('Minorista Estándar'))
+            .alias('Perfil')
+        ).filter(pl.col('Perfil') == customer_profile)
+    return df
+
+
+FILTER_CASES = [
+    (None, None, None, None),
+    ('United Kingdom', '2011-01', '2011-03', 'Mayorista Lujo'),
+    ('France', None, '2011-02', 'Minorista Estándar'),
+    (None, '2011-06', '2011-06', 'Minorista Lujo'),
+    ('Spain', '2010-12', '2011-06', 'Mayorista Estándar'),
+    (None, None, None, 'Mayorista Estándar'),
+    ('Germany', '2011-04', None, None),
+    ('Germany', '2011-03', '2011-02', None),  # Ventana vacía
+    ('Iceland', '2011-01', '2011-03', None),  # País sin filas
+]
+
+
+def comparable(df):
+    """Filas en un orden y tipos comparables entre almacenes (sin categóricos)"""
+    df = df.with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.Utf8))
+    return df.sort(df.columns, nulls_last=True)
+
+
+class FilterSpecTests(SimpleTestCase):
+    """Normalización de FilterSpec"""
+
+    def test_equivalent_params_share_key(self):
+        spec = FilterSpec.from_params(
+            country=' France ', start_date='2011-1', end_date=' 2011-03', customer_profile='',
+            category='Toys', subcategory='  ', customer_ids=[12003, '12001', 12003.0, 12002]
+        )
+        same = FilterSpec.from_params(
+            country='France', start_date='2011-01', end_date='2011-03',
+            category='Toys', customer_ids=(12001, 12002, 12003), valid_only=0
+        )
+        self.assertEqual(spec.key, same.key)
+        self.assertEqual(spec, same)
+        self.assertEqual(hash(spec), hash(same))
+        self.assertEqual(spec.key, (
+            ('country', 'France'), ('start_date', '2011-01'), ('end_date', '2011-03'),
+            ('category', 'Toys'), ('customer_ids', (12001, 12002, 12003)),
+        ))
+        self.assertEqual(FilterSpec.from_params().key, FilterSpec.from_params(country='', end_date=None).key)
+
+    def test_different_params_change_key(self):
+        base = FilterSpec.from_params(country='France', start_date='2011-01')
+        for other in [
+            FilterSpec.from_params(country='france', start_date='2011-01'),
+            FilterSpec.from_params(country='France', start_date='2011-02'),
+            FilterSpec.from_params(country='France', end_date='2011-01'),
+            FilterSpec.from_params(country='France', start_date='2011-01', valid_only=True),
+            FilterSpec.from_params(country='France', start_date='2011-01', customer_ids=[]),
+        ]:
+            with self.subTest(other=other):
+                self.assertNotEqual(base.key, other.key)
+
+    def test_invalid_months_raise(self):
+        for month in ['2011-13', '2011-00', '11-01', '2011/01', 'enero', '2011-01-05', '2011-']:
+            with self.subTest(month=month):
+                with self.assertRaises(ValueError):
+                    FilterSpec.from_params(start_date=month)
+                with self.assertRaises(ValueError):
+                    FilterSpec.from_params(end_date=month)
+
+
+class InvalidFilterParamsTests(RetailDataMixin, SimpleTestCase):
+    """Los endpoints responden 400 (no 500) a meses inválidos"""
+
+    def setUp(self):
+        super().setUp()
+        result_cache.clear_result_cache()
+        self.addCleanup(result_cache.clear_result_cache)
+        data_loader.load_online_retail_data()
+
+    def test_get_endpoints_reject_invalid_months(self):
+        for url in [
+            '/api/sales-trend/',
+            '/api/top-products/',
+            '/api/customer-profiles-global/',
+            '/api/customer-profiles/France/',
+            '/api/client-similarity/customer-ids/',
+        ]:
+            for params in [{'start_date': 'bogus'}, {'start_date': '2011-13'}, {'end_date': '2011-00'}]:
+                with self.subTest(url=url, params=params):
+                    response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('Mes inválido', response.json()['error'])
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, {'start_date': '2011-1'}).status_code, 200)
+
+    def test_similarity_rejects_invalid_months(self):
+        response = self.client.post(
+            '/api/client-similarity/compute/',
+            json.dumps({'start_date': '2011-13'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Mes inválido', response.json()['error'])
+
+
+class FilterCompileTests(RetailDataMixin, SimpleTestCase):
+    """spec.compile() selecciona las mismas filas que la cadena de filter() original"""
+
+    columns = ['InvoiceNo', 'StockCode', 'Quantity', 'InvoiceDate', 'UnitPrice', 'CustomerID', 'Country', 'Total']
+
+    def test_compile_matches_baseline_filters(self):
+        df = data_loader.load_online_retail_data()
+        for country, start_date, end_date, profile in FILTER_CASES:
+            with self.subTest(country=country, start_date=start_date, end_date=end_date, profile=profile):
+                spec = FilterSpec.from_params(
+                    country=country, start_date=start_date, end_date=end_date, customer_profile=profile
+                )
+                columns = [*self.columns, 'Perfil'] if profile else self.columns
+                expected = baseline_filter(df, country, start_date, end_date, profile).select(columns)
+                result = spec.compile(self.columns, classify=bool(profile)).collect()
+                self.assertEqual(result.height, expected.height)
+                # El almacén particionado no conserva el orden entre particiones
+                result = result.with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.Utf8)).sort(columns)
+                expected = expected.with_columns(pl.col(pl.Categorical).cast(pl.Utf8)).sort(columns)
+                self.assertTrue(result.equals(expected))
+
+    def test_all_profiles_partition_the_rows(self):
+        data_loader.load_online_retail_data()
+        spec = FilterSpec.from_params(country='United Kingdom', start_date='2011-02', end_date='2011-04')
+        total = spec.compile(['InvoiceNo']).collect().height
+        counts = [
+            FilterSpec.from_params(
+                country='United Kingdom', start_date='2011-02', end_date='2011-04', customer_profile=profile
+            ).compile(['InvoiceNo']).collect().height
+            for profile in ('Minorista Estándar', 'Mayorista Estándar', 'Minorista Lujo', 'Mayorista Lujo')
+        ]
+        self.assertTrue(all(counts))
+        self.assertEqual(sum(counts), total)
+        unknown = FilterSpec.from_params(country='United Kingdom', customer_profile='Desconocido')
+        self.assertEqual(unknown.compile(['InvoiceNo']).collect().height, 0)
+
+
+class BitmapIndexTests(RetailDataMixin, SimpleTestCase):
+    """AND de bitmaps empaquetados dentro de una ventana frente a filter()"""
+
+    equals_cases = [
+        {},
+        {'Country': 'France'},
+        {'Country': 'United Kingdom', 'Category': 'Toys'},
+        {'Category': 'Home', 'Subcategory': 'Decor'},
+        {'Country': 'Spain', 'Category': 'Gifts', 'Subcategory': 'Cards'},
+        {'Category': 'Gifts', 'Subcategory': 'Dolls'},  # Combinación sin filas
+        {'Country': 'Iceland'},  # País sin filas
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.df = data_loader.load_online_retail_data()
+        self.bitmap_index = data_loader.get_bitmap_index()
+        self.month_index = data_loader.get_month_index()
+
+    def expected_rows(self, equals, window, extra=None):
+        mask = pl.repeat(True, self.df.height, eager=True)
+        for column, value in equals.items():
+            mask = mask & (self.df[column].cast(pl.Utf8) == value)
+        if extra is not None:
+            mask = mask & extra
+        rows = np.flatnonzero(mask.to_numpy())
+        if window is not None:
+            # Una ventana invertida no selecciona filas
+            rows = rows[(rows >= window[0]) & (rows < max(window))]
+        return rows
+
+    def test_bitmaps_match_columns(self):
+        for column, by_value in self.bitmap_index.items():
+            self.assertEqual(set(by_value), set(self.df[column].cast(pl.Utf8).drop_nulls().unique()))
+            for value, bitmap in by_value.items():
+                with self.subTest(column=column, value=value):
+                    bits = np.unpackbits(bitmap, count=self.df.height).astype(bool)
+                    np.testing.assert_array_equal(bits, (self.df[column].cast(pl.Utf8) == value).to_numpy())
+
+    def test_select_rows_matches_filter(self):
+        height = self.df.height
+        # Ventanas alineadas y no alineadas a bytes, de una fila, vacías y de meses
+        windows = [None, (0, height), (0, 0), (3, 17), (5, 6), (height - 9, height), (40, 20)]
+        windows += [month_window(self.month_index, *months) for months in [
+            ('2011-02', '2011-02'), ('2011-01', '2011-03'), ('2011-04', '2011-02'), ('2012-01', None)
+        ]]
+        positive = self.df['Quantity'] > 0
+        for equals in self.equals_cases:
+            for window in windows:
+                with self.subTest(equals=equals, window=window):
+                    np.testing.assert_array_equal(
+                        select_rows(self.bitmap_index, equals, [], window, height),
+                        self.expected_rows(equals, window)
+                    )
+                    np.testing.assert_array_equal(
+                        select_rows(self.bitmap_index, equals, [pack_mask(positive)], window, height),
+                        self.expected_rows(equals, window, positive)
+                    )
+
+    def test_compile_with_categories_matches_filter(self):
+        for country, start_date, end_date, _ in FILTER_CASES:
+            for category, subcategory in ((None, None), ('Toys', None), ('Home', 'Kitchen'), (None, 'Cards')):
+                with self.subTest(country=country, start=start_date, end=end_date,
+                                  category=category, subcategory=subcategory):
+                    spec = FilterSpec.from_params(
+                        country=country, start_date=start_date, end_date=end_date,
+                        category=category, subcategory=subcategory
+                    )
+                    expected = baseline_filter(self.df, country, start_date, end_date)
+                    if category:
+                        expected = expected.filter(pl.col('Category') == category)
+                    if subcategory:
+                        expected = expected.filter(pl.col('Subcategory') == subcategory)
+                    result = spec.compile().collect()
+                    self.assertTrue(comparable(result).equals(comparable(expected)))
+
+
+class PartitionedFilterCompileTests(FilterCompileTests):
+    """Lo mismo sobre el almacén particionado"""
+
+    loader_settings = {'DASHBOARD_DATA_STORE': 'partitioned'}
+
+    def test_partitioned_store_is_used(self):
+        data_loader.load_online_retail_data()
+        self.assertIsNotNone(data_loader.get_partitioned_store())
+
+
+class PartitionedStoreTests(SimpleTestCase):
+    """Almacén Parquet particionado por mes y país frente al filtro de Polars"""
+
+    countries = (None, 'United Kingdom', 'France', 'Iceland')  # Iceland: sin filas
+    windows = [
+        (None, None),
+        ('2011-02', '2011-02'),  # Un solo mes
+        ('2010-12', '2011-03'),
+        ('2011-05', None),
+        (None, '2011-01'),
+        ('2011-04', '2011-02'),  # Ventana vacía
+        ('2012-01', '2012-06'),  # Fuera de los datos
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.df = data_loader.parse_csv(retail_csv())
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        self.path = ensure_partitioned(self.df, self.cache_dir, 'a' * 64)
+
+    def test_layout(self):
+        self.assertEqual(self.path, partitioned_path(self.cache_dir, 'a' * 64))
+        parts = {str(path.relative_to(self.path)) for path in self.path.rglob('*.parquet')}
+        self.assertIn('year_month=2010-12/country=United%20Kingdom/part-0.parquet', parts)
+        self.assertEqual(len(parts), self.df.select(
+            pl.col('InvoiceDate').dt.strftime('%Y-%m'), 'Country'
+        ).unique().height)
+
+    def test_scan_matches_polars_filter(self):
+        for country in self.countries:
+            for start_month, end_month in self.windows:
+                with self.subTest(country=country, start=start_month, end=end_month):
+                    expected = baseline_filter(self.df, country, start_month, end_month)
+                    result = scan_partitioned(self.path, start_month, end_month, country).collect()
+                    self.assertEqual(result.columns, self.df.columns)
+                    self.assertTrue(comparable(result).equals(comparable(expected)))
+
+    def test_non_matching_partitions_are_not_read(self):
+        # Un archivo ilegible en otra partición no afecta a las consultas que
+        # lo descartan por mes o por país
+        (self.path / 'year_month=2011-03' / 'country=France' / 'part-0.parquet').write_bytes(b'no es parquet')
+        for country, start_month, end_month in [
+            ('France', '2011-01', '2011-02'),
+            ('France', '2011-04', None),
+            ('Germany', None, None),
+            (None, '2011-04', '2011-06'),
+        ]:
+            with self.subTest(country=country, start=start_month, end=end_month):
+                expected = baseline_filter(self.df, country, start_month, end_month)
+                result = scan_partitioned(self.path, start_month, end_month, country).collect()
+                self.assertTrue(comparable(result).equals(comparable(expected)))
+        with self.assertRaises(Exception):
+            scan_partitioned(self.path, '2011-03', '2011-03', 'France').collect()
+
+    def test_new_version_replaces_old_store(self):
+        self.assertEqual(ensure_partitioned(self.df, self.cache_dir, 'a' * 64), self.path)
+        other = ensure_partitioned(self.df.head(100), self.cache_dir, 'b' * 64)
+        self.assertEqual([path.name for path in self.cache_dir.glob('retail-*.parts')], [other.name])
+        self.assertEqual(scan_partitioned(other).collect().height, 100)
+
+
+MONTH_WINDOWS = [
+    (None, None),
+    ('2010-12', '2010-12'),  # Primer mes del dataset
+    ('2011-06', '2011-06'),  # Último mes
+    ('2010-12', '2011-06'),
+    ('2011-02', '2011-04'),
+    (None, '2011-01'),
+    ('2011-05', None),
+    ('2009-01', '2010-12'),  # Ventanas que empiezan o terminan fuera de los datos
+    ('2011-06', '2012-03'),
+    ('2012-01', None),  # Sin datos
+]
+
+
+def exact_upper_bound(series):
+    """Q3 + 1.5 * IQR con la interpolación por defecto de Polars ('nearest')"""
+    if series.drop_nulls().is_empty():
+        return None
+    q1 = series.quantile(0.25, interpolation='nearest')
+    q3 = series.quantile(0.75, interpolation='nearest')
+    return q3 + 1.5 * (q3 - q1)
+
+
+class QuantileSummaryTests(SimpleTestCase):
+    """Resúmenes de cuantiles combinados por (país, mes) frente a Polars"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.df = data_loader.parse_csv(retail_csv())
+
+    def test_merged_bounds_match_exact_quantiles(self):
+        index = build_quantile_index(self.df, 0.001, 65536)
+        for subset in (SUBSET_ALL, SUBSET_VALID):
+            for country in (None, 'United Kingdom', 'France', 'Spain', 'Iceland'):
+                for start_month, end_month in MONTH_WINDOWS:
+                    with self.subTest(subset=subset, country=country, start=start_month, end=end_month):
+                        rows = baseline_filter(self.df, country, start_month, end_month)
+                        if subset == SUBSET_VALID:
+                            rows = rows.filter(
+                                pl.col('CustomerID').is_not_null() & (pl.col('Total') > 0) & (pl.col('Quantity') > 0)
+                            )
+                        total_upper, price_upper, relative_error = merged_upper_bounds(
+                            index, subset, country, start_month, end_month
+                        )
+                        self.assertEqual(total_upper, exact_upper_bound(rows['Total']))
+                        self.assertEqual(price_upper, exact_upper_bound(rows['UnitPrice']))
+                        self.assertEqual(relative_error, 0.0)
+
+    def test_merge_equals_summary_of_union(self):
+        rng = random.Random(3)
+        values = [round(rng.lognormvariate(0, 1), 2) for _ in range(2000)]
+        parts = [values[i::5] for i in range(5)]
+
+        def summary(data):
+            counts = pl.Series('value', data, dtype=pl.Float64).value_counts().sort('value')
+            return QuantileSummary.from_counts(counts['value'].to_numpy(), counts['count'].to_numpy(), 0.01, 10 ** 6)
+
+        merged = QuantileSummary.merge([summary(part) for part in parts] + [summary([])])
+        whole = summary(values)
+        np.testing.assert_array_equal(merged.values, whole.values)
+        np.testing.assert_array_equal(merged.weights, whole.weights)
+        self.assertTrue(merged.exact)
+        series = pl.Series(values)
+        for q in (0.0, 0.1, 0.25, 0.5, 0.75, 0.99, 1.0):
+            self.assertEqual(merged.quantile(q), series.quantile(q, interpolation='nearest'))
+        self.assertIsNone(QuantileSummary.merge([]).quantile(0.5))
+
+    def test_compressed_summaries_stay_within_rank_error(self):
+        rng = random.Random(5)
+        parts = [sorted(rng.uniform(0, 1000) for _ in range(3000)) for _ in range(4)]
+        epsilon = 0.01
+        summaries = [
+            QuantileSummary.from_counts(part, np.ones(len(part), dtype=np.int64), epsilon, exact_limit=100)
+            for part in parts
+        ]
+        for part, summary in zip(parts, summaries):
+            self.assertFalse(summary.exact)
+            self.assertLessEqual(len(summary.values), 100)
+            self.assertLessEqual(summary.rank_error, math.ceil(epsilon * len(part)))
+
+        merged = QuantileSummary.merge(summaries)
+        self.assertEqual(merged.count, 12000)
+        self.assertEqual(merged.rank_error, sum(s.rank_error for s in summaries))
+        self.assertLessEqual(merged.relative_error, epsilon + 1e-9)
+        data = np.sort(np.concatenate(parts))
+        for q in (0.05, 0.25, 0.5, 0.75, 0.95):
+            rank = math.floor((len(data) - 1) * q + 0.5)
+            value = merged.quantile(q)
+            low = np.searchsorted(data, value, side='left')
+            high = np.searchsorted(data, value, side='right') - 1
+            # El rango del valor devuelto está a lo sumo a rank_error del pedido
+            self.assertLessEqual(max(low - rank, rank - high, 0), merged.rank_error)
+
+
+def day(text):
+    return datetime.date.fromisoformat(text)
+
+
+class TimeIndexTests(RetailDataMixin, SimpleTestCase):
+    """Ventanas de meses y días como slice del DataFrame ordenado frente a filter()"""
+
+    def setUp(self):
+        super().setUp()
+        self.df = data_loader.load_online_retail_data()
+        self.month_index = data_loader.get_month_index()
+
+    def sliced(self, window):
+        if window is None:
+            return self.df
+        return self.df.slice(window[0], window[1] - window[0])
+
+    def test_month_index_covers_sorted_rows(self):
+        self.assertTrue(self.df['InvoiceDate'].is_sorted())
+        self.assertEqual(list(self.month_index), [f'{year}-{month:02d}' for year, month in MONTHS])
+        previous_end = 0
+        for year_month, (start, end) in self.month_index.items():
+            self.assertEqual(start, previous_end)
+            months = self.df['InvoiceDate'].slice(start, end - start).dt.strftime('%Y-%m').unique().to_list()
+            self.assertEqual(months, [year_month])
+            previous_end = end
+        self.assertEqual(previous_end, self.df.height)
+
+    def test_month_windows_match_filter(self):
+        for start_month, end_month in [*MONTH_WINDOWS, ('2011-04', '2011-02'), ('2011-03', '2011-03')]:
+            with self.subTest(start=start_month, end=end_month):
+                window = month_window(self.month_index, start_month, end_month)
+                expected = baseline_filter(self.df, None, start_month, end_month)
+                self.assertTrue(self.sliced(window).equals(expected))
+        self.assertIsNone(month_window(self.month_index))
+        self.assertEqual(month_window(self.month_index, '2011-04', '2011-02'), (0, 0))
+        self.assertEqual(month_window({}, '2011-01', '2011-02'), (0, 0))
+
+    def test_day_windows_match_filter(self):
+        dates = self.df['InvoiceDate']
+        for first, last in DailySalesIndexTests.ranges:
+            first_day = day(first) if first else None
+            last_day = day(last) if last else None
+            with self.subTest(first_day=first_day, last_day=last_day):
+                expected = self.df
+                if first_day is not None:
+                    expected = expected.filter(pl.col('InvoiceDate').dt.date() >= first_day)
+                if last_day is not None:
+                    expected = expected.filter(pl.col('InvoiceDate').dt.date() <= last_day)
+                self.assertTrue(self.sliced(day_window(dates, first_day, last_day)).equals(expected))
+
+    def test_month_days_and_intersections(self):
+        self.assertEqual(month_days('2011-02', '2011-02'), (day('2011-02-01'), day('2011-02-28')))
+        self.assertEqual(month_days('2010-12', '2010-12'), (day('2010-12-01'), day('2010-12-31')))
+        self.assertEqual(month_days(None, '2012-02'), (None, day('2012-02-29')))
+        self.assertEqual(month_days(), (None, None))
+        self.assertIsNone(intersect_windows(None, None))
+        self.assertEqual(intersect_windows((10, 50), None, (20, 80)), (20, 50))
+        # Ventanas disjuntas: vacía, sin inicio mayor que el fin
+        self.assertEqual(intersect_windows((10, 20), (30, 40)), (30, 30))
+
+
+class DailySalesIndexTests(RetailDataMixin, SimpleTestCase):
+    """Rangos de días desde las sumas acumuladas frente a filter().sum()"""
+
+    ranges = [
+        (None, None),
+        ('2010-12-01', '2010-12-01'),  # Primer día
+        ('2011-06-28', '2011-06-28'),  # Último día
+        ('2010-12-05', '2010-12-05'),  # Domingo: sin ventas
+        ('2010-12-05', '2010-12-06'),
+        ('2011-01-01', '2011-01-31'),
+        ('2011-02-10', '2011-04-20'),
+        ('2009-01-01', '2010-12-03'),  # Empieza antes de los datos
+        ('2011-06-20', '2012-01-01'),  # Termina después
+        ('2009-01-01', '2009-12-31'),  # Fuera de los datos
+        ('2012-01-01', '2012-02-01'),
+        ('2011-03-10', '2011-03-01'),  # Invertido
+        (None, '2011-01-15'),
+        ('2011-05-15', None),
+    ]
+
+    def expected(self, df, first_day, last_day):
+        dates = df.with_columns(pl.col('InvoiceDate').dt.date().alias('Fecha'))
+        if first_day is not None:
+            dates = dates.filter(pl.col('Fecha') >= first_day)
+        if last_day is not None:
+            dates = dates.filter(pl.col('Fecha') <= last_day)
+        return dates['Total'].sum(), dates['Fecha'].n_unique()
+
+    def assertRangesMatch(self, index, df):
+        for first, last in self.ranges:
+            first_day = day(first) if first else None
+            last_day = day(last) if last else None
+            with self.subTest(first_day=first_day, last_day=last_day):
+                total, days = self.expected(df, first_day, last_day)
+                self.assertAlmostEqual(index.range_total(first_day, last_day), total, places=6)
+                self.assertEqual(index.range_days(first_day, last_day), days)
+                if days:
+                    self.assertAlmostEqual(index.range_mean(first_day, last_day), total / days, places=6)
+                else:
+                    self.assertIsNone(index.range_mean(first_day, last_day))
+
+    def test_ranges_match_transactions(self):
+        df = data_loader.load_online_retail_data()
+        daily = (
+            df.group_by(pl.col('InvoiceDate').dt.date().alias('Fecha'))
+            .agg(pl.col('Total').sum().alias('Sales'))
+            .sort('Fecha')
+        )
+        index = DailySalesIndex(daily)
+        self.assertEqual(index.first_day, day('2010-12-01'))
+        self.assertAlmostEqual(index.total(), df['Total'].sum(), places=6)
+        self.assertIsNone(index.day_sales(day('2010-12-05')))
+        self.assertIsNone(index.day_sales(day('2009-01-01')))
+        first_total, _ = self.expected(df, day('2010-12-01'), day('2010-12-01'))
+        self.assertAlmostEqual(index.day_sales(day('2010-12-01')), first_total)
+        self.assertRangesMatch(index, df)
+
+    def test_filtered_indexes_match_transactions(self):
+        df = data_loader.load_online_retail_data()
+        for country, start_date, end_date, profile in FILTER_CASES:
+            with self.subTest(country=country, start_date=start_date, end_date=end_date, profile=profile):
+                spec = FilterSpec.from_params(
+                    country=country, start_date=start_date, end_date=end_date, customer_profile=profile
+                )
+                index = get_daily_sales_index(spec)
+                self.assertRangesMatch(index, baseline_filter(df, country, start_date, end_date, profile))
+
+    def test_empty_index(self):
+        index = DailySalesIndex(pl.DataFrame(
+            {'Fecha': [], 'Sales': []}, schema={'Fecha': pl.Date, 'Sales': pl.Float64}
+        ))
+        self.assertIsNone(index.first_day)
+        self.assertEqual(index.range_total(day('2011-01-01'), day('2011-12-31')), 0.0)
+        self.assertEqual(index.range_days(), 0)
+        self.assertIsNone(index.range_mean())
+        self.assertIsNone(index.day_sales(day('2011-01-01')))
+        self.assertEqual(index.total(), 0.0)
+
+
+class SalesCubeTests(RetailDataMixin, SimpleTestCase):
+    """Cubos diarios preagregados frente a agregar las transacciones filtradas"""
+
+    category_cases = [(None, None), ('Toys', None), ('Home', 'Decor')]
+
+    def filtered(self, df, country, start_date, end_date, category, subcategory):
+        rows = baseline_filter(df, country, start_date, end_date)
+        if category:
+            rows = rows.filter(pl.col('Category') == category)
+        if subcategory:
+            rows = rows.filter(pl.col('Subcategory') == subcategory)
+        return rows
+
+    def assertSameTotals(self, result, expected, keys):
+        result = result.with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.Utf8)).sort(keys)
+        expected = expected.with_columns(pl.col(pl.Categorical, pl.Enum).cast(pl.Utf8)).sort(keys)
+        self.assertEqual(result.select(keys).rows(), expected.select(keys).rows())
+        np.testing.assert_allclose(result['Sales'].to_numpy(), expected['Sales'].to_numpy(), rtol=1e-9)
+        self.assertEqual(result['Quantity'].to_list(), expected['Quantity'].to_list())
+
+    def test_cubes_match_transactions(self):
+        df = data_loader.load_online_retail_data()
+        for name, dimensions in CUBE_DIMENSIONS.items():
+            with self.subTest(cube=name):
+                cube = data_loader.get_sales_cube(name)
+                self.assertTrue(cube['Fecha'].is_sorted())
+                expected = (
+                    df.group_by([pl.col('InvoiceDate').dt.date().alias('Fecha'), *dimensions[1:]])
+                    .agg([pl.col('Total').sum().alias('Sales'), pl.col('Quantity').cast(pl.Int64).sum()])
+                )
+                self.assertSameTotals(cube, expected, dimensions)
+
+    def test_compiled_cube_matches_filter(self):
+        df = data_loader.load_online_retail_data()
+        for country, start_date, end_date, profile in FILTER_CASES:
+            for category, subcategory in self.category_cases:
+                with self.subTest(country=country, start=start_date, end=end_date, profile=profile,
+                                  category=category, subcategory=subcategory):
+                    spec = FilterSpec.from_params(
+                        country=country, start_date=start_date, end_date=end_date,
+                        customer_profile=profile, category=category, subcategory=subcategory
+                    )
+                    lf = spec.compile_cube(CUBE_DAILY)
+                    if profile:
+                        # La clasificación por perfil necesita las transacciones
+                        self.assertIsNone(lf)
+                        continue
+                    result = lf.group_by('Fecha').agg([pl.col('Sales').sum(), pl.col('Quantity').sum()]).collect()
+                    expected = (
+                        self.filtered(df, country, start_date, end_date, category, subcategory)
+                        .group_by(pl.col('InvoiceDate').dt.date().alias('Fecha'))
+                        .agg([pl.col('Total').sum().alias('Sales'), pl.col('Quantity').cast(pl.Int64).sum()])
+                    )
+                    self.assertSameTotals(result, expected, ['Fecha'])
+
+    def test_endpoints_data_match_transactions(self):
+        df = data_loader.load_online_retail_data()
+        for country, start_date, end_date, _ in FILTER_CASES:
+            for category, subcategory in self.category_cases:
+                with self.subTest(country=country, start=start_date, end=end_date,
+                                  category=category, subcategory=subcategory):
+                    rows = self.filtered(df, country, start_date, end_date, category, subcategory)
+                    top = get_top_products_data(country, None, start_date, end_date, category, subcategory)
+                    expected = (
+                        rows.group_by(pl.col('Description').cast(pl.Utf8))
+                        .agg([pl.col('Total').sum().alias('Sales'), pl.col('Quantity').sum()])
+                        .top_k(5, by='Sales')
+                        .reverse()
+                    )
+                    self.assertEqual(top['products'], expected['Description'].to_list())
+                    np.testing.assert_allclose(top['sales'], expected['Sales'].to_list(), rtol=1e-9)
+                    self.assertEqual(top['quantities'], expected['Quantity'].to_list())
+
+                    if category:
+                        continue
+                    trend = get_sales_trend_data(country, None, start_date, end_date)
+                    daily = (
+                        rows.group_by(pl.col('InvoiceDate').dt.date().alias('Fecha'))
+                        .agg(pl.col('Total').sum().alias('Sales'))
+                        .sort('Fecha')
+                    )
+                    dates = [date for year in trend['years'] for date in trend['data_by_year'][year]['dates']]
+                    sales = [value for year in trend['years'] for value in trend['data_by_year'][year]['sales']]
+                    self.assertEqual(dates, [str(value) for value in daily['Fecha'].to_list()])
+                    np.testing.assert_allclose(sales, daily['Sales'].to_list(), rtol=1e-9)
+                    self.assertAlmostEqual(trend['total_sales'], rows['Total'].sum(), places=6)
+
+    def test_cubes_rebuilt_when_dataset_version_changes(self):
+        data_loader.load_online_retail_data()
+        old_paths = [cube_path(self.cache_dir, self.fingerprint, name) for name in CUBE_DIMENSIONS]
+        self.assertTrue(all(path.exists() for path in old_paths))
+        old_total = get_sales_trend_data()['total_sales']
+
+        # Otro proceso con un dataset nuevo: cubos nuevos y los anteriores se eliminan
+        reset_dataset_state()
+        self.raw = retail_csv(seed=8)
+        self.fingerprint = hashlib.sha256(self.raw).hexdigest()
+        df = data_loader.load_online_retail_data()
+        self.assertEqual(data_loader.get_dataset_version(), self.fingerprint)
+        self.assertFalse(any(path.exists() for path in old_paths))
+        self.assertEqual(
+            sorted(path.name for path in Path(self.cache_dir).glob('retail-*.cube-*.arrow')),
+            sorted(cube_path(self.cache_dir, self.fingerprint, name).name for name in CUBE_DIMENSIONS)
+        )
+
+        total = get_sales_trend_data()['total_sales']
+        self.assertNotAlmostEqual(total, old_total)
+        self.assertAlmostEqual(total, df['Total'].sum(), places=6)
+        products = data_loader.get_sales_cube(CUBE_PRODUCTS)
+        self.assertAlmostEqual(products['Sales'].sum(), df['Total'].sum(), places=6)
+
+
+class TopProductsIndexTests(SimpleTestCase):
+    """Top N desde los resúmenes por partición frente a la agregación completa"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.df = data_loader.parse_csv(retail_csv())
+
+    def exact_top(self, rows, n):
+        return (
+            rows.group_by(pl.col('Description').cast(pl.Utf8))
+            .agg([pl.col('Total').sum().alias('TotalSales'), pl.col('Quantity').sum().alias('TotalQuantity')])
+            .top_k(n, by='TotalSales')
+        )
+
+    def test_matches_exact_top_k(self):
+        index = build_top_products_index(self.df, 5)
+        resolved = 0
+        cases = 0
+        for country, start_month, end_month, _ in FILTER_CASES:
+            for category in (None, 'Toys'):
+                rows = baseline_filter(self.df, country, start_month, end_month)
+                equals = {'Country': country} if country else {}
+                if category:
+                    rows = rows.filter(pl.col('Category') == category)
+                    equals['Category'] = category
+                if rows.is_empty():
+                    continue
+                cases += 1
+                with self.subTest(country=country, start=start_month, end=end_month, category=category):
+                    lf = rows.lazy().select(['Description', pl.col('Total').alias('Sales'), 'Quantity'])
+                    result = top_products(index, lf, 5, start_month, end_month, equals)
+                    if result is None:
+                        continue
+                    resolved += 1
+                    expected = self.exact_top(rows, 5)
+                    self.assertEqual(
+                        result['Description'].cast(pl.Utf8).to_list(), expected['Description'].to_list()
+                    )
+                    np.testing.assert_allclose(result['TotalSales'].to_numpy(), expected['TotalSales'].to_numpy())
+                    self.assertEqual(result['TotalQuantity'].to_list(), expected['TotalQuantity'].to_list())
+        # Con 5 productos por partición casi todas las consultas se resuelven sin la agregación completa
+        self.assertGreaterEqual(resolved, cases - 2)
+
+    def test_loose_bounds_return_none(self):
+        # En cada mes el producto guardado es distinto y el que queda fuera
+        # ('SHARED') vende casi lo mismo: sumando meses es el más vendido, pero
+        # solo aparece en los residuales
+        rows = []
+        for month in range(1, 7):
+            for description, total in ((f'ONLY {month}', 100.0), ('SHARED', 90.0)):
+                rows.append({
+                    'InvoiceDate': datetime.datetime(2011, month, 3, 10), 'Country': 'France',
+                    'Category': 'Toys', 'Subcategory': 'Games', 'Description': description,
+                    'Quantity': 1, 'Total': total,
+                })
+        df = pl.DataFrame(rows)
+        index = build_top_products_index(df, 1)
+        self.assertEqual(index.residuals['Residual'].to_list(), [90.0] * 6)
+
+        lf = df.lazy().select(['Description', pl.col('Total').alias('Sales'), 'Quantity'])
+        self.assertEqual(self.exact_top(df, 1)['Description'].to_list(), ['SHARED'])
+        self.assertIsNone(top_products(index, lf, 1))
+
+        # Un solo mes: el residual no alcanza al guardado y el resultado es exacto
+        one_month = (
+            df.lazy().filter(pl.col('InvoiceDate').dt.month() == 2)
+            .select(['Description', pl.col('Total').alias('Sales'), 'Quantity'])
+        )
+        result = top_products(index, one_month, 1, '2011-02', '2011-02')
+        self.assertEqual(result['Description'].to_list(), ['ONLY 2'])
+        self.assertEqual(result['TotalSales'].to_list(), [100.0])
+
+
+def cache_entry(size, cost):
+    return result_cache._Entry(200, 'application/json', b'x' * size, cost)
+
+
+@override_settings(STORAGES={
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+class IndexPayloadTests(RetailDataMixin, SimpleTestCase):
+    """Contenido precalculado de la página inicial por versión del dataset"""
+
+    def setUp(self):
+        super().setUp()
+        index_payload.clear_index_payload()
+        self.addCleanup(index_payload.clear_index_payload)
+        self.build = self.enterContext(mock.patch.object(
+            index_payload, 'build_index_payload', wraps=index_payload.build_index_payload
+        ))
+
+    def render(self):
+        """Contexto de la plantilla de la página inicial (el HTML incluye el token CSRF)"""
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'worldMapData')
+        return {key: response.context[key] for key in index_payload.PAYLOAD_KEYS}
+
+    def test_payload_is_built_once_per_version(self):
+        first = self.render()
+        self.assertIn('United Kingdom', first['dataset_countries'])
+        self.assertEqual(json.loads(first['date_range']), {'min': '2010-12', 'max': '2011-06'})
+        self.assertEqual(self.build.call_count, 1)
+        self.assertTrue(index_payload.payload_path(self.cache_dir, self.fingerprint).exists())
+        self.assertEqual(self.render(), first)
+        self.assertEqual(self.build.call_count, 1)
+
+        # Otro worker (sin contenido en memoria) lo lee del disco
+        index_payload.clear_index_payload()
+        self.assertEqual(self.render(), first)
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_new_dataset_version_rebuilds_payload(self):
+        first = self.render()
+        old_path = index_payload.payload_path(self.cache_dir, self.fingerprint)
+
+        reset_dataset_state()
+        self.raw = retail_csv(seed=8, rows=2000)
+        self.fingerprint = hashlib.sha256(self.raw).hexdigest()
+        second = self.render()
+        self.assertEqual(self.build.call_count, 2)
+        self.assertNotEqual(second, first)
+        self.assertEqual(
+            json.loads(second['salesTrendJSON']),
+            json.loads(dumps(build_sales_trend_figure(get_sales_trend_data())))
+        )
+        self.assertFalse(old_path.exists())
+        self.assertTrue(index_payload.payload_path(self.cache_dir, self.fingerprint).exists())
+
+    def test_page_renders_after_failed_warm_up(self):
+        self.build.side_effect = [RuntimeError('fallo simulado'), mock.DEFAULT]
+        stderr = io.StringIO()
+        with mock.patch('sys.stderr', stderr):
+            index_payload.warm_up_index_payload()
+        self.assertIn('No se pudo precalcular la página inicial', stderr.getvalue())
+        self.assertFalse(index_payload.payload_path(self.cache_dir, self.fingerprint).exists())
+
+        # El fallo no queda guardado: la visita vuelve a calcular el contenido
+        self.assertIn('United Kingdom', self.render()['dataset_countries'])
+        self.assertEqual(self.build.call_count, 2)
+
+    def test_page_renders_when_payload_cannot_be_saved(self):
+        with mock.patch.object(index_payload, 'write_atomic', side_effect=OSError('disco lleno')):
+            self.render()
+        self.assertFalse(index_payload.payload_path(self.cache_dir, self.fingerprint).exists())
+        self.render()
+        self.assertEqual(self.build.call_count, 1)
+
+
+@override_settings(DASHBOARD_RESULT_CACHE_MAX_BYTES=1000, DASHBOARD_RESULT_CACHE_TTL=900)
+class ResultCacheTests(SimpleTestCase):
+    """Admisión y desalojo GreedyDual-Size de la caché de resultados"""
+
+    def test_cheap_large_entry_does_not_evict_costly_small_ones(self):
+        cache = result_cache.ResultCache()
+        self.assertTrue(cache.put('costly', cache_entry(300, cost=2.0)))
+        self.assertTrue(cache.put('medium', cache_entry(400, cost=0.5)))
+        self.assertFalse(cache.put('cheap', cache_entry(600, cost=0.001)))
+        self.assertEqual(set(cache.entries), {'costly', 'medium'})
+        self.assertEqual(cache.stats()['rejections'], 1)
+        self.assertEqual(cache.stats()['evictions'], 0)
+
+    def test_costly_small_entry_evicts_cheap_large_one(self):
+        cache = result_cache.ResultCache()
+        self.assertTrue(cache.put('cheap', cache_entry(900, cost=0.001)))
+        self.assertTrue(cache.put('costly', cache_entry(200, cost=2.0)))
+        self.assertEqual(set(cache.entries), {'costly'})
+        self.assertEqual(cache.bytes, 200)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        # La inflación sube a la prioridad de la entrada desalojada
+        self.assertAlmostEqual(cache.inflation, 0.001 / 900)
+
+    def test_entries_larger_than_budget_are_rejected(self):
+        cache = result_cache.ResultCache()
+        self.assertFalse(cache.put('huge', cache_entry(1001, cost=100.0)))
+        self.assertEqual(cache.bytes, 0)
+        with override_settings(DASHBOARD_RESULT_CACHE_MAX_BYTES=0):
+            self.assertFalse(cache.put('tiny', cache_entry(1, cost=100.0)))
+
+    def test_expired_entries_are_evicted_first(self):
+        cache = result_cache.ResultCache()
+        self.assertTrue(cache.put('costly', cache_entry(400, cost=1.0)))
+        self.assertTrue(cache.put('expired', cache_entry(400, cost=50.0)))
+        cache.entries['expired'].expires_at = time.monotonic() - 1
+
+        # Aunque la entrada vencida es la de mayor prioridad, se desaloja antes
+        self.assertTrue(cache.put('new', cache_entry(400, cost=0.5)))
+        self.assertEqual(set(cache.entries), {'costly', 'new'})
+
+        cache.entries['new'].expires_at = time.monotonic() - 1
+        self.assertIsNone(cache.get('new'))
+        self.assertEqual(set(cache.entries), {'costly'})
+        self.assertEqual(cache.bytes, 400)
+
+
+class CacheResultDecoratorTests(SimpleTestCase):
+    """X-Result-Cache y qué respuestas se guardan"""
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(override_settings(
+            DASHBOARD_RESULT_CACHE_MAX_BYTES=10000,
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'results': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'decorator'},
+            },
+        ))
+        self.version = 'v1'
+        self.enterContext(mock.patch.object(result_cache, 'get_dataset_version', lambda: self.version))
+        result_cache.clear_result_cache()
+        self.addCleanup(result_cache.clear_result_cache)
+        self.factory = RequestFactory()
+        self.calls = 0
+
+    def view(self, status=200, size=10, during=None):
+        @result_cache.cache_result('test-endpoint', {'country': 'country', 'start_date': 'start_date'})
+        def view(request):
+            self.calls += 1
+            if during:
+                during()
+            return JsonResponse({'data': 'x' * size, 'calls': self.calls}, status=status)
+        return view
+
+    def get(self, view, **params):
+        return view(self.factory.get('/api/test/', params))
+
+    def test_hit_miss_shared_hit_and_bypass(self):
+        view = self.view()
+        first = self.get(view, country='France')
+        self.assertEqual(first['X-Result-Cache'], 'miss')
+        self.assertEqual(self.get(view, country=' France ')['X-Result-Cache'], 'hit')
+        self.assertEqual(self.calls, 1)
+
+        # Otro worker (primer nivel vacío) lo encuentra en la caché compartida
+        result_cache._cache.clear()
+        shared = self.get(view, country='France')
+        self.assertEqual(shared['X-Result-Cache'], 'shared-hit')
+        self.assertEqual(shared.content, first.content)
+        self.assertEqual(self.calls, 1)
+
+        # Otra versión del dataset es otra clave
+        self.version = 'v2'
+        self.assertEqual(self.get(view, country='France')['X-Result-Cache'], 'miss')
+        self.assertEqual(self.calls, 2)
+
+        # No cabe en el presupuesto: se calcula y no se guarda en memoria
+        large = self.get(self.view(size=20000), country='Spain')
+        self.assertEqual(large['X-Result-Cache'], 'bypass')
+        self.assertEqual(self.calls, 3)
+
+    def test_no_cache_without_dataset_or_valid_params(self):
+        view = self.view()
+        self.version = None
+        self.assertNotIn('X-Result-Cache', self.get(view))
+        self.assertNotIn('X-Result-Cache', self.get(view))
+        self.version = 'v1'
+        self.assertNotIn('X-Result-Cache', self.get(view, country='France', start_date='2011-13'))
+        self.assertEqual(self.calls, 3)
+
+    def test_non_200_responses_are_never_stored(self):
+        for status in (400, 404, 500):
+            with self.subTest(status=status):
+                view = self.view(status=status)
+                calls = self.calls
+                for _ in range(2):
+                    response = self.get(view, country='Nowhere')
+                    self.assertEqual(response.status_code, status)
+                    self.assertNotIn('X-Result-Cache', response)
+                self.assertEqual(self.calls, calls + 2)
+        self.assertEqual(result_cache._cache.entries, {})
+
+    def test_version_change_during_compute_is_not_stored(self):
+        def reload_dataset():
+            self.version = 'v2'
+
+        view = self.view(during=reload_dataset)
+        self.assertNotIn('X-Result-Cache', self.get(view))
+        self.assertEqual(result_cache._cache.entries, {})
+        self.assertEqual(self.get(view)['X-Result-Cache'], 'miss')
+
+
+SIMILARITY_METRICS = ('euclidean', 'cosine', 'pearson')
+
+
+def continuous_features(n=150, seed=11):
+    """Características sin empates (valores continuos)"""
+    return np.random.default_rng(seed).normal(size=(n, 7)).astype(np.float32)
+
+
+def tied_features(n=60, seed=13):
+    """Características con muchos empates: valores enteros y clientes repetidos"""
+    rng = np.random.default_rng(seed)
+    X = rng.integers(0, 3, size=(n, 7)).astype(np.float32)
+    X[n // 2:n // 2 + 10] = X[:10]
+    return X
+
+
+class NeighborAssertions:
+    """Comparación de vecinos con la búsqueda original sobre la matriz completa"""
+
+    def assertSameNeighbors(self, result, expected, row_distances, customer_idx):
+        """
+        Mismas distancias (con tolerancia) y mismos vecinos; entre distancias
+        empatadas la búsqueda original no fija el orden, así que solo se exige
+        que el vecino esté a esa distancia y que los empates se desempaten por
+        índice
+        """
+        indices = result['neighbor_indices']
+        distances = np.asarray(result['neighbor_distances'])
+        np.testing.assert_allclose(distances, expected['neighbor_distances'], rtol=1e-5, atol=1e-6)
+        self.assertEqual(len(indices), len(expected['neighbor_indices']))
+        self.assertNotIn(customer_idx, indices)
+        self.assertEqual(len(set(indices)), len(indices))
+
+        others = np.delete(row_distances, customer_idx)
+        for rank, (index, expected_index) in enumerate(zip(indices, expected['neighbor_indices'])):
+            distance = expected['neighbor_distances'][rank]
+            tied = np.sum(np.abs(others - distance) <= 1e-5) > 1
+            if tied:
+                self.assertAlmostEqual(float(row_distances[index]), distance, delta=1e-5)
+            else:
+                self.assertEqual(index, expected_index)
+            if rank and distances[rank] == distances[rank - 1]:
+                self.assertLess(indices[rank - 1], index)
+
+
+class BlockedNeighborsTests(NeighborAssertions, SimpleTestCase):
+    """Vecinos por bloques frente a find_k_nearest_neighbors + compute_distance_matrix"""
+
+    def test_identical_without_ties(self):
+        X = continuous_features()
+        for metric in SIMILARITY_METRICS:
+            expected = find_k_nearest_neighbors(compute_distance_matrix(X, metric), k=10)
+            for block_size in (1, 7, 64, None):
+                with self.subTest(metric=metric, block_size=block_size):
+                    result = find_k_nearest_neighbors_blocked(X, k=10, metric=metric, block_size=block_size)
+                    self.assertEqual(sorted(result), sorted(expected))
+                    for i, neighbors in expected.items():
+                        self.assertEqual(result[i]['neighbor_indices'], neighbors['neighbor_indices'])
+                        np.testing.assert_allclose(
+                            result[i]['neighbor_distances'], neighbors['neighbor_distances'], rtol=1e-5, atol=1e-6
+                        )
+
+    def test_single_customer_and_large_k(self):
+        X = continuous_features()
+        for metric in SIMILARITY_METRICS:
+            matrix = compute_distance_matrix(X, metric)
+            for customer_idx, k in ((0, 10), (77, 1), (149, 500)):
+                with self.subTest(metric=metric, customer_idx=customer_idx, k=k):
+                    expected = find_k_nearest_neighbors(matrix, k=k, customer_idx=customer_idx)
+                    result = find_k_nearest_neighbors_blocked(X, k=k, customer_idx=customer_idx, metric=metric)
+                    self.assertEqual(len(result['neighbor_indices']), min(k, len(X) - 1))
+                    self.assertSameNeighbors(result, expected, matrix[customer_idx], customer_idx)
+
+    def test_tied_distances(self):
+        X = tied_features()
+        for metric in SIMILARITY_METRICS:
+            matrix = compute_distance_matrix(X, metric)
+            expected = find_k_nearest_neighbors(matrix, k=8)
+            for block_size in (1, 9, None):
+                with self.subTest(metric=metric, block_size=block_size):
+                    result = find_k_nearest_neighbors_blocked(X, k=8, metric=metric, block_size=block_size)
+                    for i in range(len(X)):
+                        self.assertSameNeighbors(result[i], expected[i], matrix[i], i)
+            # Los clientes repetidos son vecinos a distancia 0
+            result = find_k_nearest_neighbors_blocked(X, k=1, customer_idx=0, metric=metric)
+            self.assertAlmostEqual(result['neighbor_distances'][0], 0.0, places=5)
+
+
+class NeighborIndexTests(NeighborAssertions, SimpleTestCase):
+    """NeighborIndex frente a la búsqueda por bloques y su caché por versión del dataset"""
+
+    def setUp(self):
+        super().setUp()
+        nn_index.clear_neighbor_indexes()
+        self.addCleanup(nn_index.clear_neighbor_indexes)
+
+    def test_matches_blocked_search(self):
+        for name, X in (('continuous', continuous_features()), ('tied', tied_features())):
+            customer_ids = [str(12000 + i) for i in range(len(X))]
+            for metric in SIMILARITY_METRICS:
+                index = nn_index.NeighborIndex(customer_ids, X, metric)
+                matrix = compute_distance_matrix(X, metric)
+                expected = find_k_nearest_neighbors_blocked(X, k=10, metric=metric)
+                with self.subTest(features=name, metric=metric):
+                    for i in range(len(X)):
+                        result = index.neighbors(i, 10)
+                        if name == 'continuous':
+                            self.assertEqual(result['neighbor_indices'], expected[i]['neighbor_indices'])
+                            np.testing.assert_allclose(
+                                result['neighbor_distances'], expected[i]['neighbor_distances'],
+                                rtol=1e-5, atol=1e-5
+                            )
+                        else:
+                            self.assertSameNeighbors(result, expected[i], matrix[i], i)
+
+    def test_position_and_small_indexes(self):
+        X = continuous_features(n=3)
+        index = nn_index.NeighborIndex([12001, 12002, 12003], X)
+        self.assertEqual(index.position('12002'), 1)
+        self.assertEqual(index.position(12003), 2)
+        self.assertIsNone(index.position('99999'))
+        self.assertEqual(len(index.neighbors(0, 50)['neighbor_indices']), 2)
+        single = nn_index.NeighborIndex([12001], X[:1], 'cosine')
+        self.assertEqual(single.neighbors(0, 5), {'neighbor_indices': [], 'neighbor_distances': []})
+        with self.assertRaises(ValueError):
+            nn_index.NeighborIndex([12001], X[:1], 'manhattan')
+
+    def test_rebuilt_when_dataset_version_changes(self):
+        X = continuous_features(n=20)
+        builds = []
+        version = ['v1']
+
+        def build():
+            builds.append(version[0])
+            return nn_index.NeighborIndex(range(len(X)), X)
+
+        with mock.patch.object(nn_index, 'get_dataset_version', lambda: version[0]):
+            first = nn_index.get_neighbor_index(('config',), build)
+            self.assertIs(nn_index.get_neighbor_index(('config',), build), first)
+            self.assertEqual(builds, ['v1'])
+
+            version[0] = 'v2'
+            second = nn_index.get_neighbor_index(('config',), build)
+            self.assertIsNot(second, first)
+            self.assertEqual(builds, ['v1', 'v2'])
+            self.assertIs(nn_index.get_neighbor_index(('config',), build), second)
+
+            # Otra configuración es otro índice
+            nn_index.get_neighbor_index(('other',), build)
+            self.assertEqual(builds, ['v1', 'v2', 'v2'])
+
+            # Sin dataset cargado no se guarda nada
+            version[0] = None
+            nn_index.get_neighbor_index(('config',), build)
+            nn_index.get_neighbor_index(('config',), build)
+            self.assertEqual(builds, ['v1', 'v2', 'v2', None, None])
+
+
+class KNNGraphTests(NeighborAssertions, SimpleTestCase):
+    """Grafo CSR guardado en disco frente a NeighborIndex"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+
+    def test_saved_graph_matches_neighbor_index(self):
+        fingerprint = 'f' * 64
+        for name, X in (('continuous', continuous_features()), ('tied', tied_features())):
+            customer_ids = [str(12000 + i) for i in range(len(X))]
+            for metric in SIMILARITY_METRICS:
+                with self.subTest(features=name, metric=metric):
+                    graph = knn_graph.build_knn_graph(X, k=10, metric=metric, block_size=16, workers=4)
+                    path = knn_graph.graph_path(self.cache_dir, fingerprint, f'{name}-{metric}')
+                    knn_graph.save_knn_graph(path, graph, customer_ids, {'k': 10, 'metric': metric})
+
+                    saved = knn_graph.open_knn_graph(path)
+                    self.assertIs(knn_graph.open_knn_graph(path), saved)
+                    self.assertEqual(len(saved), len(X))
+                    np.testing.assert_array_equal(saved.indptr, np.arange(len(X) + 1) * 10)
+                    self.assertEqual(saved.position('12005'), 5)
+                    self.assertIsNone(saved.position('99999'))
+
+                    index = nn_index.NeighborIndex(customer_ids, X, metric)
+                    matrix = compute_distance_matrix(X, metric)
+                    for i in range(len(X)):
+                        row = saved.neighbors(i)
+                        np.testing.assert_array_equal(
+                            row['neighbor_indices'], saved.indices[saved.indptr[i]:saved.indptr[i + 1]]
+                        )
+                        self.assertSameNeighbors(row, index.neighbors(i, 10), matrix[i], i)
+                        self.assertEqual(saved.neighbors(i, k=3)['neighbor_indices'], row['neighbor_indices'][:3])
+                    self.assertEqual(sum(1 for _ in saved.iter_edges()), len(X) * 10)
+
+    def test_graph_and_index_report_same_distances(self):
+        X = continuous_features()
+        customer_ids = [str(12000 + i) for i in range(len(X))]
+        for metric in SIMILARITY_METRICS:
+            with self.subTest(metric=metric):
+                path = knn_graph.graph_path(self.cache_dir, 'f' * 64, metric)
+                knn_graph.save_knn_graph(
+                    path, knn_graph.build_knn_graph(X, k=10, metric=metric, block_size=32), customer_ids,
+                    {'k': 10, 'metric': metric}
+                )
+                saved = knn_graph.open_knn_graph(path)
+                index = nn_index.NeighborIndex(customer_ids, X, metric)
+                for i in range(len(X)):
+                    self.assertEqual(saved.neighbors(i, k=7), index.neighbors(i, 7))
+
+    def test_rebuilt_graph_is_reopened(self):
+        X = continuous_features(n=40)
+        customer_ids = [str(12000 + i) for i in range(len(X))]
+        path = knn_graph.graph_path(self.cache_dir, 'f' * 64, 'config')
+        knn_graph.save_knn_graph(path, knn_graph.build_knn_graph(X, k=3), customer_ids, {'k': 3})
+        first = knn_graph.open_knn_graph(path)
+        self.assertEqual(first.k, 3)
+        self.assertIs(knn_graph.open_knn_graph(path), first)
+
+        # Otra construcción (más vecinos) en la misma ruta reemplaza la abierta
+        knn_graph.save_knn_graph(path, knn_graph.build_knn_graph(X, k=8), customer_ids, {'k': 8})
+        second = knn_graph.open_knn_graph(path)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.k, 8)
+        self.assertEqual(len(second.neighbors(0)['neighbor_indices']), 8)
+        self.assertIs(knn_graph.open_knn_graph(path), second)
+
+    def test_workers_do_not_change_the_graph(self):
+        X = continuous_features()
+        single = knn_graph.build_knn_graph(X, k=5, metric='cosine', block_size=7, workers=1)
+        pooled = knn_graph.build_knn_graph(X, k=5, metric='cosine', block_size=7, workers=8)
+        for expected, result in zip(single, pooled):
+            np.testing.assert_array_equal(result, expected)
+
+    def test_missing_graph_is_not_opened(self):
+        self.assertIsNone(knn_graph.open_knn_graph(self.cache_dir / 'knn' / 'retail-missing'))
+
+
+class BuildKNNGraphCommandTests(RetailDataMixin, SimpleTestCase):
+    """Comando build_knn_graph sobre el dataset sintético"""
+
+    def test_command_builds_graph_and_edge_list(self):
+        edges = Path(self.cache_dir) / 'edges.csv'
+        out = io.StringIO()
+        call_command(
+            'build_knn_graph', k=4, metric='cosine', country='United Kingdom',
+            start_date='2011-01', end_date='2011-06', workers=3, block_size=8,
+            edges=str(edges), stdout=out
+        )
+
+        config_key = similarity_config_key('cosine', 'zscore', 'United Kingdom', '2011-01', '2011-06')
+        path = knn_graph.graph_path(self.cache_dir, self.fingerprint, config_key)
+        saved = knn_graph.open_knn_graph(path)
+        self.assertIsNotNone(saved)
+        self.assertEqual(saved.meta['config_key'], config_key)
+        self.assertEqual(saved.meta['dataset_version'], self.fingerprint)
+        self.assertEqual(saved.k, 4)
+
+        customer_ids, features, _ = prepare_customer_features('United Kingdom', '2011-01', '2011-06')
+        self.assertEqual(saved.customer_ids.tolist(), customer_ids)
+        index = nn_index.NeighborIndex(customer_ids, normalize_features(features, 'zscore'), 'cosine')
+        for i in range(len(saved)):
+            self.assertEqual(saved.neighbors(i), index.neighbors(i, 4))
+
+        with open(edges, encoding='utf-8') as f:
+            rows = f.read().splitlines()
+        self.assertEqual(rows[0], 'source,target,distance')
+        self.assertEqual(len(rows), 1 + 4 * len(saved))
+        self.assertIn(f'{len(saved) * 4} aristas exportadas', out.getvalue())
+
+    def test_neighbors_do_not_depend_on_the_graph(self):
+        nn_index.clear_neighbor_indexes()
+        self.addCleanup(nn_index.clear_neighbor_indexes)
+        config = {'metric': 'euclidean', 'normalization': 'zscore', 'country': 'United Kingdom'}
+        customer_ids = data_processor.get_all_customer_ids('United Kingdom')[:10]
+        from_index = {cid: data_processor.find_customer_neighbors(cid, 5, **config) for cid in customer_ids}
+        self.assertIsNone(data_processor.get_knn_graph(**config))
+
+        call_command('build_knn_graph', k=3, country='United Kingdom', stdout=io.StringIO())
+        self.assertEqual(data_processor.get_knn_graph(**config).k, 3)
+        # Con menos vecinos de los pedidos se sigue usando el índice
+        for cid in customer_ids:
+            self.assertEqual(data_processor.find_customer_neighbors(cid, 5, **config), from_index[cid])
+
+        # El grafo reconstruido con más vecinos se usa sin reiniciar el proceso
+        call_command('build_knn_graph', k=8, country='United Kingdom', stdout=io.StringIO())
+        self.assertEqual(data_processor.get_knn_graph(**config).k, 8)
+        with mock.patch.object(data_processor, 'get_customer_neighbor_index') as index:
+            for cid in customer_ids:
+                self.assertEqual(data_processor.find_customer_neighbors(cid, 5, **config), from_index[cid])
+        index.assert_not_called()
+
+    def test_command_rejects_invalid_k(self):
+        with self.assertRaises(CommandError):
+            call_command('build_knn_graph', k=0, stdout=io.StringIO())
+
+
+class StageCacheTests(RetailDataMixin, SimpleTestCase):
+    """Claves de las etapas de similitud y presupuesto de memoria de su caché"""
+
+    def setUp(self):
+        super().setUp()
+        stage_cache.clear_stage_cache()
+        self.addCleanup(stage_cache.clear_stage_cache)
+        data_loader.load_online_retail_data()
+
+    def test_changed_inputs_change_keys(self):
+        features_key, _ = data_processor.customer_features_stage('United Kingdom', '2011-01', '2011-03')
+        same_key, _ = data_processor.customer_features_stage(' United Kingdom ', '2011-1', '2011-03')
+        self.assertEqual(features_key, same_key)
+        for country, start_date, end_date in [
+            ('France', '2011-01', '2011-03'),
+            ('United Kingdom', '2011-02', '2011-03'),
+            ('United Kingdom', '2011-01', None),
+            (None, '2011-01', '2011-03'),
+        ]:
+            with self.subTest(country=country, start_date=start_date, end_date=end_date):
+                key, _ = data_processor.customer_features_stage(country, start_date, end_date)
+                self.assertNotEqual(key, features_key)
+
+        # Otra versión del dataset invalida la etapa raíz (y con ella toda la cadena)
+        with mock.patch.object(data_processor, 'get_dataset_version', return_value='otra-version'):
+            key, _ = data_processor.customer_features_stage('United Kingdom', '2011-01', '2011-03')
+        self.assertNotEqual(key, features_key)
+
+        _, (_, features, _) = data_processor.customer_features_stage('United Kingdom', '2011-01', '2011-03')
+        zscore_key, _ = data_processor.normalized_features_stage(features_key, features, 'zscore')
+        minmax_key, _ = data_processor.normalized_features_stage(features_key, features, 'minmax_01')
+        other_key, _ = data_processor.normalized_features_stage(key, features, 'zscore')
+        self.assertEqual(len({zscore_key, minmax_key, other_key}), 3)
+        self.assertNotEqual(
+            data_processor.clusters_stage(zscore_key, normalize_features(features, 'zscore'))[0],
+            data_processor.outliers_stage(zscore_key, normalize_features(features, 'zscore'))[0]
+        )
+
+        # La métrica no interviene en las etapas, sí en la configuración (grafo e índice de vecinos)
+        base = similarity_config_key('euclidean', 'zscore', 'United Kingdom', '2011-01', '2011-03')
+        self.assertEqual(base, similarity_config_key('euclidean', 'zscore', ' United Kingdom', '2011-1', '2011-03'))
+        for other in [
+            similarity_config_key('cosine', 'zscore', 'United Kingdom', '2011-01', '2011-03'),
+            similarity_config_key('euclidean', 'minmax_01', 'United Kingdom', '2011-01', '2011-03'),
+            similarity_config_key('euclidean', 'zscore', 'France', '2011-01', '2011-03'),
+            similarity_config_key('euclidean', 'zscore', 'United Kingdom', '2011-01', '2011-04'),
+        ]:
+            self.assertNotEqual(other, base)
+
+    def test_stages_are_computed_once_per_key(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return np.zeros(10)
+
+        key = stage_cache.stage_key('test', 'a', 1)
+        first = stage_cache.cached_stage(key, compute)
+        self.assertIs(stage_cache.cached_stage(key, compute), first)
+        self.assertEqual(len(calls), 1)
+        stage_cache.cached_stage(stage_cache.stage_key('test', 'a', 2), compute)
+        self.assertEqual(len(calls), 2)
+
+        # Sin dataset cargado, o si cambia durante el cálculo, no se guarda
+        with mock.patch.object(stage_cache, 'get_dataset_version', return_value=None):
+            stage_cache.cached_stage(stage_cache.stage_key('test', 'b'), compute)
+        versions = iter(['v1', 'v2'])
+        with mock.patch.object(stage_cache, 'get_dataset_version', lambda: next(versions)):
+            stage_cache.cached_stage(stage_cache.stage_key('test', 'c'), compute)
+        stage_cache.cached_stage(stage_cache.stage_key('test', 'b'), compute)
+        stage_cache.cached_stage(stage_cache.stage_key('test', 'c'), compute)
+        self.assertEqual(len(calls), 6)
+
+    @override_settings(DASHBOARD_SIMILARITY_STAGE_MAX_BYTES=10000, DASHBOARD_SIMILARITY_STAGE_CACHE_SIZE=100)
+    def test_byte_budget_evicts(self):
+        keys = [stage_cache.stage_key('block', i) for i in range(4)]
+        for key in keys:
+            stage_cache.cached_stage(key, lambda: np.zeros(400))  # 3200 bytes
+        stats = stage_cache.get_stage_cache_stats()
+        self.assertEqual(stats['entries'], 3)
+        self.assertEqual(stats['bytes'], 9600)
+        self.assertEqual(stats['evictions'], 1)
+
+        # La más antigua se desalojó y se vuelve a calcular
+        calls = []
+        stage_cache.cached_stage(keys[0], lambda: calls.append(1) or np.zeros(400))
+        self.assertEqual(calls, [1])
+        stage_cache.cached_stage(keys[3], lambda: calls.append(1) or np.zeros(400))
+        self.assertEqual(calls, [1])
+
+        # Una salida mayor que el presupuesto no se guarda
+        big = stage_cache.stage_key('big')
+        stage_cache.cached_stage(big, lambda: calls.append(1) or np.zeros(2000))
+        stage_cache.cached_stage(big, lambda: calls.append(1) or np.zeros(2000))
+        self.assertEqual(calls, [1, 1, 1])
+        self.assertLessEqual(stage_cache.get_stage_cache_stats()['bytes'], 10000)
+
+    def test_estimate_nbytes(self):
+        self.assertEqual(stage_cache.estimate_nbytes(np.zeros(100)), 800)
+        nested = {'a': np.zeros(10, dtype=np.float32), 'b': [np.zeros(5), 'texto']}
+        self.assertGreater(stage_cache.estimate_nbytes(nested), 40 + 40)
+
+
+class SimilarityNeighborsEndpointTests(RetailDataMixin, SimpleTestCase):
+    """Endpoint de vecinos por config_key"""
+
+    url = '/api/client-similarity/neighbors/'
+
+    def setUp(self):
+        super().setUp()
+        for clear in (
+            similarity_configs.clear_similarity_configs,
+            nn_index.clear_neighbor_indexes,
+            stage_cache.clear_stage_cache,
+            result_cache.clear_result_cache,
+        ):
+            clear()
+            self.addCleanup(clear)
+        data_loader.load_online_retail_data()
+        self.config = {
+            'metric': 'euclidean',
+            'normalization': 'zscore',
+            'country': 'United Kingdom',
+            'start_date': '2011-01',
+            'end_date': '2011-04',
+        }
+        self.config_key = similarity_configs.register_similarity_config(**self.config)
+        self.customer_id = data_processor.get_all_customer_ids(
+            self.config['country'], self.config['start_date'], self.config['end_date']
+        )[0]
+
+    def get(self, **params):
+        return self.client.get(self.url, params)
+
+    def test_known_config_returns_only_neighbors(self):
+        response = self.get(config_key=self.config_key, customer_id=self.customer_id, k=5)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(set(body), {'config_key', 'customer_id', 'k', 'neighbors', 'edges'})
+        expected = data_processor.find_customer_neighbors(self.customer_id, 5, **self.config)
+        self.assertEqual(body['neighbors'], expected['neighbors'])
+        self.assertEqual(len(body['neighbors']), 5)
+        self.assertNotIn(str(self.customer_id), [n['id'] for n in body['neighbors']])
+
+    def test_config_from_shared_cache(self):
+        # Registrada por otro worker: solo está en la caché compartida
+        similarity_configs.clear_similarity_configs()
+        response = self.get(config_key=self.config_key, customer_id=self.customer_id, k=3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['neighbors']), 3)
+
+    def test_unknown_config_returns_404(self):
+        response = self.get(config_key='0' * 16, customer_id=self.customer_id, k=5)
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+
+    def test_invalid_parameters_return_400(self):
+        for params in [
+            {'customer_id': self.customer_id},
+            {'config_key': self.config_key},
+            {'config_key': self.config_key, 'customer_id': 'abc'},
+            {'config_key': self.config_key, 'customer_id': '12.5.1'},
+            {'config_key': self.config_key, 'customer_id': self.customer_id, 'k': 'x'},
+            {'config_key': self.config_key, 'customer_id': self.customer_id, 'k': 0},
+            {'config_key': self.config_key, 'customer_id': self.customer_id, 'k': 501},
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+    def test_customer_outside_config_returns_404(self):
+        response = self.get(config_key=self.config_key, customer_id=999999, k=5)
+        self.assertEqual(response.status_code, 404)
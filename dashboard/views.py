@@ -3,71 +3,50 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
 import json
-import plotly.utils
-from .visualizations.world_map.plot import create_world_map_plot
 from .visualizations.customer_profiles.plot import create_customer_profiles_plot
 from .visualizations.sales.plot import create_sales_trend_plot
-from .visualizations.products.plot import create_top_products_plot
-from .visualizations.shared.data_loader import load_online_retail_data
+from .visualizations.products.plot import (
+    build_products_by_customers_figure,
+    create_top_products_plot
+)
+from .visualizations.shared.data_loader import (
+    load_online_retail_data,
+    get_dataset_status,
+    ensure_loading
+)
+from .visualizations.shared.filters import FilterSpec
+from .index_payload import get_index_payload
+from .result_cache import cache_result, get_result_cache_stats
+from .serialization import dumps, figure_bytes, json_response
+from .similarity_configs import get_similarity_config, register_similarity_config
 from .visualizations.client_similarity.data_processor import (
     compute_client_similarity_graph,
+    find_customer_neighbors,
     get_all_customer_ids
 )
 from .visualizations.client_similarity.plot import create_client_similarity_plot
+from .visualizations.client_similarity.nn_index import get_neighbor_index_stats
+from .visualizations.client_similarity.stage_cache import get_stage_cache_stats
 from .visualizations.products.data_processor import get_categories_and_subcategories
 from .visualizations.sales.detail_analyzer import get_daily_sales_detail
 import polars as pl
 
+# Parámetros de filtro de las peticiones (nombre en la API → campo de FilterSpec)
+DATE_PARAMS = {'start_date': 'start_date', 'end_date': 'end_date'}
+COUNTRY_DATE_PARAMS = {'country': 'country', **DATE_PARAMS}
+PROFILE_PARAMS = {**COUNTRY_DATE_PARAMS, 'profile': 'customer_profile'}
+PRODUCT_PARAMS = {**PROFILE_PARAMS, 'category': 'category', 'subcategory': 'subcategory'}
+
 @ensure_csrf_cookie
 def index(request):
-    # 1. Crear el mapa mundial desde nuestra nueva función de visualización
-    world_map_fig, dataset_countries = create_world_map_plot()
-
-    # 2. Crear el gráfico de perfiles de cliente (global inicialmente)
-    customer_profiles_fig = create_customer_profiles_plot()
-
-    # 3. Crear el gráfico de tendencia de ventas (global inicialmente)
-    sales_trend_fig = create_sales_trend_plot()
-
-    # 4. Crear el gráfico de top productos (global inicialmente)
-    top_products_fig = create_top_products_plot()
-
-    # 5. Obtener el rango de fechas del dataset
-    df = load_online_retail_data()
-    date_range = {'min': None, 'max': None}
-    
-    if df is not None and df.height > 0:
-        df = df.with_columns([
-            pl.col('InvoiceDate').str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S").alias('InvoiceDate')
-        ])
-        min_date = df['InvoiceDate'].min()
-        max_date = df['InvoiceDate'].max()
-        
-        if min_date and max_date:
-            date_range = {
-                'min': min_date.strftime('%Y-%m'),
-                'max': max_date.strftime('%Y-%m')
-            }
-
-    # 6. Convertir las figuras de Plotly a strings JSON para el frontend
-    world_map_json = json.dumps(world_map_fig, cls=plotly.utils.PlotlyJSONEncoder)
-    customer_profiles_json = json.dumps(customer_profiles_fig, cls=plotly.utils.PlotlyJSONEncoder)
-    sales_trend_json = json.dumps(sales_trend_fig, cls=plotly.utils.PlotlyJSONEncoder)
-    top_products_json = json.dumps(top_products_fig, cls=plotly.utils.PlotlyJSONEncoder)
-
-    # 7. Pasar los JSONs al contexto de la plantilla
-    context = {
-        'worldMapJSON': world_map_json,
-        'customerProfilesJSON': customer_profiles_json,
-        'salesTrendJSON': sales_trend_json,
-        'topProductsJSON': top_products_json,
-        'dataset_countries': json.dumps(dataset_countries),
-        'date_range': json.dumps(date_range)
-    }
+    # Figuras globales, países y rango de fechas precalculados por versión del
+    # dataset (ver index_payload): solo queda renderizar la plantilla
+    context = get_index_payload()
 
     return render(request, 'index.html', context)
 
 
+@cache_result('customer-profiles', COUNTRY_DATE_PARAMS)
 def get_customer_profiles_by_country(request, country):
     """
     API endpoint para obtener perfiles de cliente por país
@@ -76,22 +55,22 @@ def get_customer_profiles_by_country(request, country):
     start_date = request.GET.get('start_date', None)
     end_date = request.GET.get('end_date', None)
     
-    # Crear el gráfico filtrado por país y fechas
-    customer_profiles_fig = create_customer_profiles_plot(
+    try:
+        spec = FilterSpec.from_params(country=country, start_date=start_date, end_date=end_date)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # Crear el gráfico filtrado por país y fechas (serializado una sola vez)
+    customer_profiles_json = figure_bytes('customer-profiles', spec.key, lambda: create_customer_profiles_plot(
         country=country, 
         start_date=start_date, 
         end_date=end_date
-    )
+    ))
     
-    # Convertir a JSON
-    customer_profiles_json = json.dumps(customer_profiles_fig, cls=plotly.utils.PlotlyJSONEncoder)
-    
-    return JsonResponse({
-        'graph': customer_profiles_json,
-        'country': country
-    })
+    return json_response({'country': country}, graph=customer_profiles_json)
 
 
+@cache_result('customer-profiles-global', DATE_PARAMS)
 def get_customer_profiles_global(request):
     """
     API endpoint para obtener perfiles de cliente globales con filtros de fecha
@@ -99,21 +78,22 @@ def get_customer_profiles_global(request):
     start_date = request.GET.get('start_date', None)
     end_date = request.GET.get('end_date', None)
     
-    # Crear el gráfico con filtros de fecha
-    customer_profiles_fig = create_customer_profiles_plot(
+    try:
+        spec = FilterSpec.from_params(start_date=start_date, end_date=end_date)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # Crear el gráfico con filtros de fecha (serializado una sola vez)
+    customer_profiles_json = figure_bytes('customer-profiles', spec.key, lambda: create_customer_profiles_plot(
         country=None,
         start_date=start_date, 
         end_date=end_date
-    )
-    
-    # Convertir a JSON
-    customer_profiles_json = json.dumps(customer_profiles_fig, cls=plotly.utils.PlotlyJSONEncoder)
+    ))
     
-    return JsonResponse({
-        'graph': customer_profiles_json
-    })
+    return json_response({}, graph=customer_profiles_json)
 
 
+@cache_result('sales-trend', PROFILE_PARAMS)
 def get_sales_trend(request):
     """
     API endpoint para obtener tendencia de ventas con filtros opcionales
@@ -125,24 +105,28 @@ def get_sales_trend(request):
     
     print(f"DEBUG - get_sales_trend: country={country}, profile={customer_profile}, dates={start_date} to {end_date}")
     
-    # Crear el gráfico con los filtros aplicados
-    sales_trend_fig = create_sales_trend_plot(
+    try:
+        spec = FilterSpec.from_params(
+            country=country, customer_profile=customer_profile, start_date=start_date, end_date=end_date
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # Crear el gráfico con los filtros aplicados (serializado una sola vez)
+    sales_trend_json = figure_bytes('sales-trend', spec.key, lambda: create_sales_trend_plot(
         country=country, 
         customer_profile=customer_profile,
         start_date=start_date,
         end_date=end_date
-    )
+    ))
     
-    # Convertir a JSON
-    sales_trend_json = json.dumps(sales_trend_fig, cls=plotly.utils.PlotlyJSONEncoder)
-    
-    return JsonResponse({
-        'graph': sales_trend_json,
+    return json_response({
         'country': country,
         'profile': customer_profile
-    })
+    }, graph=sales_trend_json)
 
 
+@cache_result('top-products', PRODUCT_PARAMS)
 def get_top_products(request):
     """
     API endpoint para obtener top 5 productos con filtros opcionales
@@ -156,27 +140,32 @@ def get_top_products(request):
 
     print(f"DEBUG - get_top_products: country={country}, profile={customer_profile}, dates={start_date} to {end_date}, category={category}, subcategory={subcategory}")
 
-    # Crear el gráfico con los filtros aplicados
-    top_products_fig = create_top_products_plot(
+    try:
+        spec = FilterSpec.from_params(
+            country=country, customer_profile=customer_profile, start_date=start_date,
+            end_date=end_date, category=category, subcategory=subcategory
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Crear el gráfico con los filtros aplicados (serializado una sola vez)
+    top_products_json = figure_bytes('top-products', spec.key, lambda: create_top_products_plot(
         country=country,
         customer_profile=customer_profile,
         start_date=start_date,
         end_date=end_date,
         category=category,
         subcategory=subcategory
-    )
-    
-    # Convertir a JSON
-    top_products_json = json.dumps(top_products_fig, cls=plotly.utils.PlotlyJSONEncoder)
+    ))
     
-    return JsonResponse({
-        'graph': top_products_json,
+    return json_response({
         'country': country,
         'profile': customer_profile
-    })
+    }, graph=top_products_json)
 
 
 @require_http_methods(["POST"])
+@cache_result('client-similarity', COUNTRY_DATE_PARAMS)
 def compute_client_similarity(request):
     """
     API endpoint para calcular el gráfico de similitud de clientes
@@ -222,6 +211,11 @@ def compute_client_similarity(request):
         if dimred not in ['pca']:
             return JsonResponse({'error': 'Solo PCA está soportado'}, status=400)
         
+        try:
+            FilterSpec.from_params(country=country, start_date=start_date, end_date=end_date)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
         print("Iniciando cálculo...", file=sys.stderr)
         
         # Calcular el gráfico
@@ -252,8 +246,14 @@ def compute_client_similarity(request):
                 }
             }, status=404)
         
+        # Clave de la configuración para pedir después solo los vecinos de
+        # otro cliente (ver get_similarity_neighbors)
+        result['config_key'] = register_similarity_config(
+            metric, normalization, country, start_date, end_date
+        )
+        
         print("=== FIN compute_client_similarity (éxito) ===", file=sys.stderr)
-        return JsonResponse(result)
+        return json_response(result)
     
     except json.JSONDecodeError as e:
         print(f"ERROR JSON: {e}", file=sys.stderr)
@@ -265,6 +265,58 @@ def compute_client_similarity(request):
         return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
 
 
+@require_http_methods(["GET"])
+@cache_result('client-similarity-neighbors')
+def get_similarity_neighbors(request):
+    """
+    API endpoint para obtener solo los vecinos de un cliente en una
+    configuración de similitud ya calculada (config_key devuelto por
+    compute_client_similarity), sin volver a enviar el embedding
+    """
+    import sys
+    config_key = request.GET.get('config_key')
+    customer_id = request.GET.get('customer_id', None)
+    try:
+        k = int(request.GET.get('k', 10))
+    except ValueError:
+        return JsonResponse({'error': 'K debe ser un número entero'}, status=400)
+    
+    if not config_key or not customer_id:
+        return JsonResponse({'error': 'Faltan config_key o customer_id'}, status=400)
+    
+    if k < 1 or k > 500:
+        return JsonResponse({'error': 'K debe estar entre 1 y 500'}, status=400)
+    
+    # Mismo tipo que CustomerID en el dataset
+    try:
+        customer_id = str(int(customer_id))
+    except ValueError:
+        return JsonResponse({'error': 'customer_id debe ser un número entero'}, status=400)
+    
+    config = get_similarity_config(config_key)
+    if config is None:
+        # La interfaz vuelve a pedir el gráfico completo
+        return JsonResponse({'error': 'Configuración de similitud desconocida'}, status=404)
+    
+    try:
+        neighbors = find_customer_neighbors(customer_id, k, **config)
+    except Exception as e:
+        print(f"ERROR en get_similarity_neighbors: {type(e).__name__}: {e}", file=sys.stderr)
+        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
+    
+    if neighbors is None:
+        return JsonResponse({'error': 'Cliente no encontrado para esta configuración'}, status=404)
+    
+    return json_response({
+        'config_key': config_key,
+        'customer_id': customer_id,
+        'k': k,
+        'neighbors': neighbors['neighbors'],
+        'edges': neighbors['edges']
+    })
+
+
+@cache_result('customer-ids', COUNTRY_DATE_PARAMS)
 def get_customer_ids(request):
     """
     API endpoint para obtener todos los IDs de clientes disponibles
@@ -275,6 +327,11 @@ def get_customer_ids(request):
         start_date = request.GET.get('start_date', None)
         end_date = request.GET.get('end_date', None)
 
+        try:
+            FilterSpec.from_params(country=country, start_date=start_date, end_date=end_date)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
         customer_ids = get_all_customer_ids(
             country=country,
             start_date=start_date,
@@ -289,6 +346,7 @@ def get_customer_ids(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@cache_result('categories')
 def get_categories(request):
     """
     API endpoint para obtener categorías y subcategorías disponibles
@@ -302,6 +360,7 @@ def get_categories(request):
 
 
 @require_http_methods(["POST"])
+@cache_result('products-by-customers', {'category': 'category', 'subcategory': 'subcategory'})
 def get_products_by_customers(request):
     """
     API endpoint para obtener el Top 5 de productos comprados por una lista de clientes
@@ -321,59 +380,40 @@ def get_products_by_customers(request):
         if not customer_ids:
             return JsonResponse({'error': 'No se proporcionaron CustomerIDs'}, status=400)
 
-        # Convertir customer_ids a strings en el mismo formato que el dataset
-        customer_ids_str = []
+        # Convertir customer_ids a enteros (mismo tipo que CustomerID en el dataset)
+        customer_ids_int = []
         for cid in customer_ids:
             try:
-                # Convertir a int primero (para limpiar), luego a string
-                customer_ids_str.append(str(int(float(str(cid)))))
+                customer_ids_int.append(int(float(str(cid))))
             except (ValueError, TypeError):
                 print(f"Error convirtiendo CustomerID: {cid}", file=sys.stderr)
                 continue
 
-        print(f"CustomerIDs convertidos: {customer_ids_str[:5]}...", file=sys.stderr)
+        print(f"CustomerIDs convertidos: {customer_ids_int[:5]}...", file=sys.stderr)
 
-        # Cargar datos
-        df = load_online_retail_data()
+        # Filtrar por CustomerIDs (comparación de enteros), categoría y subcategoría
+        spec = FilterSpec.from_params(
+            customer_ids=customer_ids_int,
+            category=category,
+            subcategory=subcategory
+        )
+        lf = spec.compile()
 
-        if df.is_empty():
+        if lf is None:
             return JsonResponse({'error': 'No hay datos disponibles'}, status=404)
 
-        print(f"Dataset cargado, shape: {df.shape}", file=sys.stderr)
-        print(f"CustomerID type en dataset: {df['CustomerID'].dtype}", file=sys.stderr)
-
-        # Convertir CustomerID del dataset: String -> Float -> Int -> String (para remover .0)
-        df = df.with_columns([
-            pl.col('CustomerID').cast(pl.Float64).cast(pl.Int64).cast(pl.Utf8).alias('CustomerID')
-        ])
-
-        print(f"CustomerID convertido a string en dataset (sin .0)", file=sys.stderr)
-
-        # Filtrar por CustomerIDs usando comparación de strings
-        filters = [
-            (pl.col('CustomerID').is_not_null()),
-            (pl.col('CustomerID').is_in(customer_ids_str)),
-            (pl.col('Description').is_not_null()),
-            (pl.col('Description') != ''),
+        # Solo productos con descripción y cantidad positiva
+        df_filtered = lf.filter(
+            (pl.col('Description').is_not_null()) &
+            (pl.col('Description') != '') &
             (pl.col('Quantity') > 0)
-        ]
-
-        # Agregar filtros de categoría si existen
-        if category:
-            filters.append(pl.col('Category') == category)
-            print(f"Filtro de categoría aplicado: {category}", file=sys.stderr)
-
-        if subcategory:
-            filters.append(pl.col('Subcategory') == subcategory)
-            print(f"Filtro de subcategoría aplicado: {subcategory}", file=sys.stderr)
+        ).collect()
 
-        # Aplicar todos los filtros
-        df_filtered = df.filter(pl.all_horizontal(filters))
-
-        print(f"Filas después de filtrar: {df_filtered.height}", file=sys.stderr)
+        print(f"Filas después de filtrar ({spec.key}): {df_filtered.height}", file=sys.stderr)
 
         if df_filtered.is_empty():
             print(f"No hay productos. Verificando CustomerIDs en dataset...", file=sys.stderr)
+            df = load_online_retail_data()
             unique_customers = df.filter(pl.col('CustomerID').is_not_null())['CustomerID'].unique().to_list()
             print(f"CustomerIDs únicos en dataset (primeros 10): {unique_customers[:10]}", file=sys.stderr)
             return JsonResponse({'error': 'No hay productos para los clientes seleccionados'}, status=404)
@@ -390,84 +430,16 @@ def get_products_by_customers(request):
         products = top_products['Description'].to_list()
         quantities = top_products['TotalQuantity'].to_list()
 
-        # Crear gráfico de barras horizontales (como el original)
-        import plotly.graph_objects as go
-
-        fig = go.Figure()
-
-        fig.add_trace(go.Bar(
-            x=quantities,
-            y=products,
-            orientation='h',
-            marker=dict(color='#FF5722'),  # Naranja para indicar que es filtrado
-            text=[f'{q:,}' for q in quantities],
-            textposition='outside',
-            hovertemplate='<b>%{y}</b><br>Cantidad: %{x:,}<extra></extra>'
-        ))
-
-        # Calcular total de cantidad vendida
-        total_quantity = sum(quantities)
-
-        # Construir título dinámico
-        title_parts = []
-        if category and subcategory:
-            title_parts.append(f'{subcategory}')
-        elif category:
-            title_parts.append(f'{category}')
-
-        if title_parts:
-            title_text = f'{" - ".join(title_parts)}: Top Compras de {len(customer_ids)} Clientes'
-        else:
-            title_text = f'Productos Más Comprados por {len(customer_ids)} Clientes Seleccionados'
-
-        # Layout del gráfico
-        fig.update_layout(
-            title={
-                'text': title_text,
-                'x': 0.5,
-                'xanchor': 'center',
-                'font': {'size': 18, 'color': '#FF5722', 'family': 'Arial, sans-serif'}
-            },
-            xaxis=dict(
-                title='Cantidad Vendida',
-                showgrid=True,
-                gridcolor='rgba(200, 200, 200, 0.2)'
-            ),
-            yaxis=dict(
-                title='',
-                autorange='reversed'
-            ),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=200, r=50, t=100, b=50),  # Aumentado margen superior de 80 a 100
-            height=400,
-            annotations=[
-                dict(
-                    text=f'Total vendido: {total_quantity:,} unidades',
-                    xref='paper',
-                    yref='paper',
-                    x=0.5,
-                    y=1.05,  # Ajustado de 1.08 a 1.05 para evitar solapamiento
-                    xanchor='center',
-                    yanchor='bottom',
-                    showarrow=False,
-                    font=dict(
-                        size=11,
-                        color='#666666',
-                        family='Arial, sans-serif'
-                    )
-                )
-            ]
+        # Gráfico de barras horizontales (como el original)
+        fig = build_products_by_customers_figure(
+            products, quantities, len(customer_ids), category, subcategory
         )
 
-        # Convertir a JSON
-        graph_json = json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
-
-        return JsonResponse({
-            'graph': graph_json,
+        # Serializar la figura como objeto anidado (una sola pasada)
+        return json_response({
             'total_products': len(products),
             'total_customers': len(customer_ids)
-        })
+        }, graph=dumps(fig))
 
     except json.JSONDecodeError as e:
         print(f"ERROR JSON en get_products_by_customers: {e}")
@@ -479,6 +451,7 @@ def get_products_by_customers(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+@cache_result('sales-detail', PROFILE_PARAMS)
 def get_sales_detail(request, date):
     """
     API endpoint para obtener análisis detallado de ventas de un día específico
@@ -527,3 +500,29 @@ def get_sales_detail(request, date):
         traceback.print_exc()
         return JsonResponse({'error': str(e)}, status=500)
 
+
+
+def healthz(request):
+    """
+    Endpoint de liveness: el proceso responde y reporta el estado de carga
+    del dataset (estado, filas, tiempo de carga y versión) y las estadísticas
+    de la caché de resultados y de los índices de vecinos
+    """
+    status = get_dataset_status()
+    status['result_cache'] = get_result_cache_stats()
+    status['neighbor_index'] = get_neighbor_index_stats()
+    status['similarity_stages'] = get_stage_cache_stats()
+    return JsonResponse(status)
+
+
+def readyz(request):
+    """
+    Endpoint de readiness: 200 solo cuando el dataset está cargado.
+    Si no lo está, inicia la carga en segundo plano y responde 503 para que
+    el balanceador retenga el tráfico hasta que el worker esté listo.
+    """
+    status = get_dataset_status()
+    if not status['ready']:
+        ensure_loading()
+        return JsonResponse(status, status=503)
+    return JsonResponse(status)
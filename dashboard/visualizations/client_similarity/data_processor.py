@@ -1,17 +1,31 @@
 """
 Procesador principal que integra todos los módulos de similitud de clientes
 """
+import hashlib
+
 import polars as pl
 import numpy as np
-from dashboard.visualizations.shared.data_loader import load_online_retail_data
-from dashboard.visualizations.customer_profiles.data_processor import detectar_outliers_iqr
+from dashboard.visualizations.shared.data_loader import get_cache_dir, get_dataset_version
+from dashboard.visualizations.shared.filters import FilterSpec
 from .preprocessing import apply_normalization
-from .distances import compute_distance_matrix
-from .knn import find_k_nearest_neighbors, create_edges_list
+from .distances import METRICS
+from .knn_graph import graph_path, open_knn_graph
+from .nn_index import NeighborIndex, get_neighbor_index
+from .stage_cache import cached_stage, stage_key
 from .dimensionality import apply_dimensionality_reduction
 from .clustering import apply_kmeans_clustering, detect_outliers_statistical
 
 
+def similarity_filter_spec(country=None, start_date=None, end_date=None):
+    """Filtro de las transacciones que entran en la similitud de clientes"""
+    return FilterSpec.from_params(
+        country=country,
+        start_date=start_date,
+        end_date=end_date,
+        valid_only=True
+    )
+
+
 def prepare_customer_features(country=None, start_date=None, end_date=None):
     """
     Prepara las características de clientes desde el dataset
@@ -28,71 +42,26 @@ def prepare_customer_features(country=None, start_date=None, end_date=None):
             - feature_matrix: matriz numpy (n_customers, n_features)
             - customer_info: diccionario con información adicional de cada cliente
     """
-    df = load_online_retail_data()
-    
-    if df.is_empty():
+    # Filtrar país, fechas y transacciones válidas, y clasificar transacciones
+    # usando la MISMA lógica que customer_profiles
+    spec = similarity_filter_spec(country, start_date, end_date)
+    lf = spec.compile([
+        'InvoiceDate', 'InvoiceNo', 'StockCode', 'CustomerID', 'Country',
+        'Quantity', 'UnitPrice', 'Total'
+    ], classify=True)
+    
+    if lf is None:
         return [], np.array([]), {}
     
-    # Convertir InvoiceDate a datetime
-    df = df.with_columns([
-        pl.col('InvoiceDate').str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S").alias('InvoiceDate')
-    ])
-    
-    # Aplicar filtro de país si se especifica
-    if country:
-        df = df.filter(pl.col('Country') == country)
-    
-    # Aplicar filtro de fechas si se especifica
-    if start_date:
-        start_datetime = pl.datetime(int(start_date[:4]), int(start_date[5:7]), 1)
-        df = df.filter(pl.col('InvoiceDate') >= start_datetime)
-    
-    if end_date:
-        # Último día del mes especificado
-        year = int(end_date[:4])
-        month = int(end_date[5:7])
-        if month == 12:
-            end_datetime = pl.datetime(year + 1, 1, 1)
-        else:
-            end_datetime = pl.datetime(year, month + 1, 1)
-        df = df.filter(pl.col('InvoiceDate') < end_datetime)
-    
-    # Crear columna Total
-    df = df.with_columns(
-        (pl.col('Quantity') * pl.col('UnitPrice')).alias('Total')
-    )
-    
-    # Filtrar transacciones válidas
-    df = df.filter(
-        (pl.col('CustomerID').is_not_null()) &
-        (pl.col('Total') > 0) &
-        (pl.col('Quantity') > 0)
-    )
-    
-    # Clasificar transacciones usando la MISMA lógica que customer_profiles
-    total_lower, total_upper = detectar_outliers_iqr(df, 'Total')
-    price_lower, price_upper = detectar_outliers_iqr(df, 'UnitPrice')
-    
-    # Agregar columna Perfil a nivel de transacción (igual que customer_profiles)
-    df = df.with_columns(
-        pl.when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') <= price_upper))
-        .then(pl.lit('Mayorista Estándar'))
-        .when((pl.col('Total') <= total_upper) & (pl.col('UnitPrice') > price_upper))
-        .then(pl.lit('Minorista Lujo'))
-        .when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') > price_upper))
-        .then(pl.lit('Mayorista Lujo'))
-        .otherwise(pl.lit('Minorista Estándar'))
-        .alias('Perfil')
+    # Calcular fecha de referencia (última fecha + 1 día) dentro del plan
+    lf = lf.with_columns(
+        (pl.col('InvoiceDate').max() + pl.duration(days=1)).alias('_ReferenceDate')
     )
     
-    # Calcular fecha de referencia (última fecha + 1 día)
-    max_date = df['InvoiceDate'].max()
-    reference_date = max_date + pl.duration(days=1)
-    
     # Calcular métricas RFM por cliente
-    customer_metrics = df.group_by('CustomerID').agg([
+    customer_metrics = lf.group_by('CustomerID').agg([
         # Recency: días desde la última compra
-        ((reference_date - pl.col('InvoiceDate').max()).dt.total_days()).alias('Recency'),
+        ((pl.col('_ReferenceDate').first() - pl.col('InvoiceDate').max()).dt.total_days()).alias('Recency'),
         # Frequency: número de transacciones únicas
         pl.col('InvoiceNo').n_unique().alias('Frequency'),
         # Monetary: total gastado
@@ -105,7 +74,7 @@ def prepare_customer_features(country=None, start_date=None, end_date=None):
         pl.col('Country').first().alias('Country'),
         # Usar el perfil más frecuente del cliente
         pl.col('Perfil').mode().first().alias('CustomerType')
-    ])
+    ]).collect()
     
     # Filtrar clientes con datos válidos
     customer_metrics = customer_metrics.filter(
@@ -117,11 +86,15 @@ def prepare_customer_features(country=None, start_date=None, end_date=None):
     if customer_metrics.is_empty():
         return [], np.array([]), {}
     
+    # group_by no conserva el orden: se fija por CustomerID para que la
+    # normalización (y las distancias) no dependan del orden de las filas
+    customer_metrics = customer_metrics.sort('CustomerID')
+    
     # La clasificación CustomerType ya viene del aggregation (perfil más frecuente)
     # No necesitamos recalcularla aquí
     
-    # Extraer IDs de clientes (convertir a float primero, luego a int y finalmente a string)
-    customer_ids = [str(int(float(cid))) for cid in customer_metrics['CustomerID'].to_list()]
+    # Extraer IDs de clientes (CustomerID ya es entero en el dataset canónico)
+    customer_ids = [str(cid) for cid in customer_metrics['CustomerID'].to_list()]
     
     # Crear matriz de características usando to_numpy() de Polars (más eficiente)
     features = customer_metrics.select([
@@ -137,7 +110,7 @@ def prepare_customer_features(country=None, start_date=None, end_date=None):
     ]).to_dicts()
     
     for row in info_data:
-        cid = str(int(float(row['CustomerID'])))
+        cid = str(row['CustomerID'])
         customer_info[cid] = {
             'customer_type': row['CustomerType'],
             'total_spent': round(row['Monetary'], 2),
@@ -151,12 +124,235 @@ def prepare_customer_features(country=None, start_date=None, end_date=None):
     return customer_ids, features, customer_info
 
 
+def normalize_features(features, normalization='zscore'):
+    """
+    Normaliza la matriz de características para las distancias y la
+    reducción dimensional
+
+    Returns:
+        matriz float32 sin NaN ni Inf
+    """
+    features_normalized = apply_normalization(features, method=normalization)
+    
+    # Convertir a float32 para ahorrar memoria (50% menos que float64)
+    features_normalized = features_normalized.astype(np.float32)
+    
+    # Verificar que no haya NaN o Inf después de la normalización
+    if np.any(np.isnan(features_normalized)) or np.any(np.isinf(features_normalized)):
+        # Reemplazar NaN/Inf con valores seguros
+        features_normalized = np.nan_to_num(features_normalized, nan=0.0, posinf=1.0, neginf=-1.0)
+    
+    return features_normalized
+
+
+def checked_metric(metric):
+    """Métrica de distancia a usar: la pedida o, si no existe, la euclidiana"""
+    if metric in METRICS:
+        return metric
+    print(f"Error al calcular distancias con métrica {metric}: Métrica de distancia desconocida")
+    # Fallback a euclidiana
+    return 'euclidean'
+
+
+def get_customer_neighbor_index(metric='euclidean', normalization='zscore',
+                                country=None, start_date=None, end_date=None,
+                                customer_ids=None, features_normalized=None):
+    """
+    Índice de vecinos de una configuración de similitud, memorizado por
+    (filtros, normalización, métrica) y versión del dataset.
+
+    Si el llamador ya calculó las características normalizadas de esos
+    filtros (customer_ids, features_normalized) se usan para construirlo;
+    si no, se preparan aquí.
+
+    Returns:
+        NeighborIndex, o None si no hay clientes
+    """
+    spec = similarity_filter_spec(country, start_date, end_date)
+
+    def build():
+        ids, features = customer_ids, features_normalized
+        if ids is None:
+            features_key, (ids, raw_features, _) = customer_features_stage(country, start_date, end_date)
+            if len(ids) == 0:
+                return None
+            _, features = normalized_features_stage(features_key, raw_features, normalization)
+        return NeighborIndex(ids, features, metric)
+
+    return get_neighbor_index((spec.key, normalization, metric), build)
+
+
+def similarity_config_key(metric='euclidean', normalization='zscore',
+                          country=None, start_date=None, end_date=None):
+    """
+    Clave estable (hex) de una configuración de similitud: filtros,
+    normalización y métrica
+    """
+    spec = similarity_filter_spec(country, start_date, end_date)
+    return hashlib.sha256(repr((spec.key, normalization, metric)).encode('utf-8')).hexdigest()[:16]
+
+
+def get_knn_graph(metric='euclidean', normalization='zscore',
+                  country=None, start_date=None, end_date=None):
+    """
+    Grafo de vecinos precalculado (manage.py build_knn_graph) de una
+    configuración para la versión actual del dataset, o None si no existe
+    """
+    version = get_dataset_version()
+    if version is None:
+        return None
+    config_key = similarity_config_key(metric, normalization, country, start_date, end_date)
+    return open_knn_graph(graph_path(get_cache_dir(), version, config_key))
+
+
+def find_customer_neighbors(customer_id, k=10, metric='euclidean', normalization='zscore',
+                            country=None, start_date=None, end_date=None,
+                            customer_ids=None, features_normalized=None):
+    """
+    Vecinos más cercanos de un cliente: desde el grafo precalculado de su
+    configuración si existe (y tiene al menos k vecinos por cliente) o desde
+    el índice de vecinos, que se construye la primera vez; después cada
+    consulta toma milisegundos.
+
+    Si la métrica no es válida se usa la distancia euclidiana.
+
+    Returns:
+        dict con 'neighbors' (id, distance, rank) y 'edges', o None si el
+        cliente no está entre los clientes de esos filtros
+    """
+    metric = checked_metric(metric)
+    source = get_knn_graph(metric, normalization, country, start_date, end_date)
+    if source is None or source.k < min(k, len(source) - 1):
+        source = get_customer_neighbor_index(
+            metric, normalization, country, start_date, end_date,
+            customer_ids=customer_ids, features_normalized=features_normalized
+        )
+    if source is None:
+        return None
+
+    customer_idx = source.position(customer_id)
+    if customer_idx is None:
+        return None
+
+    result = source.neighbors(customer_idx, k=k)
+    ids = source.customer_ids
+    neighbors_data = [
+        {
+            'id': str(ids[neighbor_idx]),
+            'distance': float(distance),
+            'rank': rank
+        }
+        for rank, (neighbor_idx, distance) in enumerate(
+            zip(result['neighbor_indices'], result['neighbor_distances']), start=1
+        )
+    ]
+    edges_data = [
+        {'source': str(ids[customer_idx]), 'target': str(ids[neighbor_idx])}
+        for neighbor_idx in result['neighbor_indices']
+    ]
+    return {'neighbors': neighbors_data, 'edges': edges_data}
+
+
+FEATURE_NAMES = ['Recency', 'Frequency', 'Monetary', 'TotalQuantity',
+                 'AvgUnitPrice', 'AvgOrderValue', 'UniqueProducts']
+
+
+def customer_features_stage(country=None, start_date=None, end_date=None):
+    """
+    Etapa 1 (memorizada): características de los clientes de unos filtros
+
+    Returns:
+        tuple (clave de la etapa, (customer_ids, features, customer_info))
+    """
+    spec = similarity_filter_spec(country, start_date, end_date)
+    key = stage_key('features', get_dataset_version(), spec.key)
+    value = cached_stage(key, lambda: prepare_customer_features(country, start_date, end_date))
+    return key, value
+
+
+def normalized_features_stage(features_key, features, normalization='zscore'):
+    """
+    Etapa 2 (memorizada): características normalizadas
+
+    Returns:
+        tuple (clave de la etapa, matriz float32)
+    """
+    key = stage_key('normalization', features_key, normalization)
+    return key, cached_stage(key, lambda: normalize_features(features, normalization))
+
+
+def _top_features(component):
+    """Las 3 características más influyentes de un componente principal"""
+    top_indices = np.argsort(np.abs(component))[::-1][:3]
+    return [FEATURE_NAMES[i] for i in top_indices]
+
+
+def embedding_stage(normalized_key, features_normalized, dimred='pca', x_axis=None, y_axis=None):
+    """
+    Etapa 3 (memorizada): coordenadas 2D de los clientes, con PCA o con dos
+    características elegidas como ejes (si ambos índices son válidos)
+
+    Returns:
+        tuple (clave de la etapa, dict con 'embedding_2d', 'use_pca',
+        'explained_variance', 'total_variance_explained', 'pc1_top_features'
+        y 'pc2_top_features')
+    """
+    # Índices de ejes inválidos usan PCA (la clave no depende de ellos)
+    if x_axis is not None and y_axis is not None and 0 <= x_axis < 7 and 0 <= y_axis < 7:
+        key = stage_key('embedding', normalized_key, 'axes', x_axis, y_axis)
+    else:
+        key = stage_key('embedding', normalized_key, dimred)
+        x_axis = y_axis = None
+
+    def compute():
+        if x_axis is not None:
+            # Usar características seleccionadas directamente
+            return {
+                'embedding_2d': features_normalized[:, [x_axis, y_axis]],
+                'use_pca': False,
+                'explained_variance': None,
+                'total_variance_explained': None,
+                'pc1_top_features': None,
+                'pc2_top_features': None,
+            }
+
+        embedding_2d, explained_variance, pca_object, _ = apply_dimensionality_reduction(features_normalized, method=dimred)
+
+        # Características más influyentes de PC1 y PC2 (si existe)
+        components = pca_object.components_
+        return {
+            'embedding_2d': embedding_2d,
+            'use_pca': True,
+            'explained_variance': explained_variance,
+            'total_variance_explained': sum(explained_variance) * 100,
+            'pc1_top_features': _top_features(components[0]),
+            'pc2_top_features': _top_features(components[1]) if len(components) > 1 else None,
+        }
+
+    return key, cached_stage(key, compute)
+
+
+def clusters_stage(normalized_key, features_normalized, n_clusters=4):
+    """Etapa 4 (memorizada): etiquetas de KMeans"""
+    key = stage_key('kmeans', normalized_key, n_clusters)
+    return key, cached_stage(key, lambda: apply_kmeans_clustering(features_normalized, n_clusters=n_clusters))
+
+
+def outliers_stage(normalized_key, features_normalized, threshold=3):
+    """Etapa 5 (memorizada): máscara de outliers por Z-score"""
+    key = stage_key('outliers', normalized_key, threshold)
+    return key, cached_stage(key, lambda: detect_outliers_statistical(features_normalized, threshold=threshold))
+
+
 def compute_client_similarity_graph(customer_id=None, k=10, metric='euclidean', 
                                     normalization='zscore', dimred='pca',
                                     x_axis=None, y_axis=None,
                                     country=None, start_date=None, end_date=None):
     """
-    Calcula el gráfico de similitud de clientes con todos los componentes
+    Calcula el gráfico de similitud de clientes con todos los componentes.
+
+    Cada etapa se memoriza por sus entradas (ver stage_cache.py): cambiar k o
+    el cliente seleccionado solo vuelve a buscar vecinos.
     
     Args:
         customer_id: ID del cliente a resaltar (opcional)
@@ -173,10 +369,8 @@ def compute_client_similarity_graph(customer_id=None, k=10, metric='euclidean',
     Returns:
         dict con toda la información para visualización
     """
-    import gc
-    
     # 1. Preparar características de clientes con filtros
-    customer_ids, features, customer_info = prepare_customer_features(
+    features_key, (customer_ids, features, customer_info) = customer_features_stage(
         country=country,
         start_date=start_date,
         end_date=end_date
@@ -191,154 +385,61 @@ def compute_client_similarity_graph(customer_id=None, k=10, metric='euclidean',
         }
     
     # 2. Normalizar características
-    features_normalized = apply_normalization(features, method=normalization)
-    
-    # Convertir a float32 para ahorrar memoria (50% menos que float64)
-    features_normalized = features_normalized.astype(np.float32)
-    
-    # Verificar que no haya NaN o Inf después de la normalización
-    if np.any(np.isnan(features_normalized)) or np.any(np.isinf(features_normalized)):
-        # Reemplazar NaN/Inf con valores seguros
-        features_normalized = np.nan_to_num(features_normalized, nan=0.0, posinf=1.0, neginf=-1.0)
+    normalized_key, features_normalized = normalized_features_stage(features_key, features, normalization)
     
-    # 3. Calcular matriz de distancias
-    try:
-        distance_matrix = compute_distance_matrix(features_normalized, metric=metric)
-    except Exception as e:
-        print(f"Error al calcular distancias con métrica {metric}: {e}")
-        # Fallback a euclidiana si falla
-        distance_matrix = compute_distance_matrix(features_normalized, metric='euclidean')
+    # 3. Las distancias se calculan solo para el cliente seleccionado (más
+    # abajo), con el índice de vecinos de esta configuración
     
     # 4. Aplicar reducción dimensional O usar características directas
-    feature_names = ['Recency', 'Frequency', 'Monetary', 'TotalQuantity', 
-                     'AvgUnitPrice', 'AvgOrderValue', 'UniqueProducts']
-    
-    # Inicializar variables
-    explained_variance = None
-    total_variance_explained = None
-    pc1_top_features = None
-    pc2_top_features = None
-    
-    # Si se especifican ejes personalizados, usar características directas
-    if x_axis is not None and y_axis is not None:
-        # Validar índices
-        if not (0 <= x_axis < 7 and 0 <= y_axis < 7):
-            # Fallback a PCA si los índices son inválidos
-            embedding_2d, explained_variance, pca_object, _ = apply_dimensionality_reduction(features_normalized, method=dimred)
-            total_variance_explained = sum(explained_variance) * 100
-            components = pca_object.components_
-            pc1_importance = np.abs(components[0])
-            pc1_top_indices = np.argsort(pc1_importance)[::-1][:3]
-            pc1_top_features = [feature_names[i] for i in pc1_top_indices]
-            if len(components) > 1:
-                pc2_importance = np.abs(components[1])
-                pc2_top_indices = np.argsort(pc2_importance)[::-1][:3]
-                pc2_top_features = [feature_names[i] for i in pc2_top_indices]
-            else:
-                pc2_top_features = None
-            use_pca = True
-        else:
-            # Usar características seleccionadas directamente
-            embedding_2d = features_normalized[:, [x_axis, y_axis]]
-            use_pca = False
-    else:
-        # Usar PCA (comportamiento por defecto)
-        embedding_2d, explained_variance, pca_object, _ = apply_dimensionality_reduction(features_normalized, method=dimred)
-        total_variance_explained = sum(explained_variance) * 100
-        
-        # Obtener los componentes principales y determinar las características más importantes
-        components = pca_object.components_
-        
-        # Para PC1 (primera fila): encontrar las 3 características más influyentes
-        pc1_importance = np.abs(components[0])
-        pc1_top_indices = np.argsort(pc1_importance)[::-1][:3]
-        pc1_top_features = [feature_names[i] for i in pc1_top_indices]
-        
-        # Para PC2 (segunda fila): encontrar las 3 características más influyentes (si existe)
-        if len(components) > 1:
-            pc2_importance = np.abs(components[1])
-            pc2_top_indices = np.argsort(pc2_importance)[::-1][:3]
-            pc2_top_features = [feature_names[i] for i in pc2_top_indices]
-        else:
-            pc2_top_features = None
-        use_pca = True
+    # (PCA si no se especifican ejes personalizados o si son inválidos)
+    embedding_key, embedding = embedding_stage(normalized_key, features_normalized, dimred, x_axis, y_axis)
+    use_pca = embedding['use_pca']
+    explained_variance = embedding['explained_variance']
     
     # 5. Clustering (usar 4 clusters para coincidir con los 4 tipos de cliente)
-    cluster_labels = apply_kmeans_clustering(features_normalized, n_clusters=4)
+    clusters_key, cluster_labels = clusters_stage(normalized_key, features_normalized, n_clusters=4)
     
     # 6. Detectar outliers
-    outlier_mask = detect_outliers_statistical(features_normalized, threshold=3)
+    outliers_key, outlier_mask = outliers_stage(normalized_key, features_normalized, threshold=3)
     
-    # Copiar vecinos antes de liberar distance_matrix si se necesita
-    neighbors_indices = None
-    neighbors_distances = None
+    # Vecinos del cliente seleccionado desde el grafo precalculado o el índice
+    # de esta configuración (se reutiliza en las siguientes selecciones)
+    neighbors = None
     if customer_id is not None:
-        customer_id_str = str(customer_id)
-        try:
-            customer_idx = customer_ids.index(customer_id_str)
-        except ValueError:
-            try:
-                customer_idx = customer_ids.index(customer_id)
-            except ValueError:
-                customer_idx = None
-        
-        if customer_idx is not None:
-            neighbors_result = find_k_nearest_neighbors(distance_matrix, k=k, customer_idx=customer_idx)
-            neighbors_indices = neighbors_result['neighbor_indices']
-            neighbors_distances = neighbors_result['neighbor_distances']
-    
-    # Liberar matriz de distancias AHORA (puede ser muy grande)
-    del distance_matrix
-    gc.collect()
-    
-    # 7. Preparar datos de embedding
-    embedding_data = []
-    for i, cust_id in enumerate(customer_ids):
-        embedding_data.append({
-            'id': str(cust_id),
-            'x': float(embedding_2d[i, 0]),
-            'y': float(embedding_2d[i, 1]),
-            'cluster': int(cluster_labels[i]),
-            'outlier': bool(outlier_mask[i]),
-            'customer_type': customer_info[cust_id]['customer_type'],
-            'total_spent': customer_info[cust_id]['total_spent'],
-            'frequency': customer_info[cust_id]['frequency'],
-            'recency': customer_info[cust_id]['recency'],
-            'avg_order_value': customer_info[cust_id]['avg_order_value'],
-            'unique_products': customer_info[cust_id]['unique_products'],
-            'country': customer_info[cust_id]['country']
-        })
-    
-    # 8. Preparar vecinos si se calcularon anteriormente
-    neighbors_data = []
-    edges_data = []
-    
-    if neighbors_indices is not None and neighbors_distances is not None:
-        # Preparar datos de vecinos usando los índices precalculados
-        for i, (neighbor_idx, distance) in enumerate(zip(neighbors_indices, neighbors_distances)):
-            neighbor_id = customer_ids[neighbor_idx]
-            neighbors_data.append({
-                'id': str(neighbor_id),
-                'distance': float(distance),
-                'rank': i + 1
+        neighbors = find_customer_neighbors(
+            customer_id, k, metric, normalization, country, start_date, end_date,
+            customer_ids=customer_ids, features_normalized=features_normalized
+        )
+    
+    # 7. Preparar datos de embedding (memorizados por las etapas de las que dependen)
+    def build_embedding_data():
+        embedding_2d = embedding['embedding_2d']
+        embedding_data = []
+        for i, cust_id in enumerate(customer_ids):
+            embedding_data.append({
+                'id': str(cust_id),
+                'x': float(embedding_2d[i, 0]),
+                'y': float(embedding_2d[i, 1]),
+                'cluster': int(cluster_labels[i]),
+                'outlier': bool(outlier_mask[i]),
+                'customer_type': customer_info[cust_id]['customer_type'],
+                'total_spent': customer_info[cust_id]['total_spent'],
+                'frequency': customer_info[cust_id]['frequency'],
+                'recency': customer_info[cust_id]['recency'],
+                'avg_order_value': customer_info[cust_id]['avg_order_value'],
+                'unique_products': customer_info[cust_id]['unique_products'],
+                'country': customer_info[cust_id]['country']
             })
-        
-        # Crear edges (conexiones)
-        customer_id_str = str(customer_id)
-        try:
-            customer_idx = customer_ids.index(customer_id_str)
-        except ValueError:
-            try:
-                customer_idx = customer_ids.index(customer_id)
-            except ValueError:
-                customer_idx = None
-        
-        if customer_idx is not None:
-            edges_data = create_edges_list(customer_idx, neighbors_indices, customer_ids)
+        return embedding_data
+
+    embedding_data = cached_stage(
+        stage_key('embedding_data', features_key, embedding_key, clusters_key, outliers_key),
+        build_embedding_data
+    )
     
-    # Liberar memoria de matrices grandes
-    del features_normalized
-    gc.collect()
+    # 8. Vecinos y conexiones (edges) del cliente seleccionado
+    neighbors_data = neighbors['neighbors'] if neighbors else []
+    edges_data = neighbors['edges'] if neighbors else []
     
     return {
         'embedding': embedding_data,
@@ -350,15 +451,15 @@ def compute_client_similarity_graph(customer_id=None, k=10, metric='euclidean',
             'use_pca': use_pca,
             'x_axis_index': x_axis if x_axis is not None else None,
             'y_axis_index': y_axis if y_axis is not None else None,
-            'x_axis_name': feature_names[x_axis] if x_axis is not None else None,
-            'y_axis_name': feature_names[y_axis] if y_axis is not None else None
+            'x_axis_name': FEATURE_NAMES[x_axis] if x_axis is not None else None,
+            'y_axis_name': FEATURE_NAMES[y_axis] if y_axis is not None else None
         },
         'pca_variance': {
             'pc1_variance': float(explained_variance[0] * 100) if use_pca else None,
             'pc2_variance': float(explained_variance[1] * 100) if use_pca and len(explained_variance) > 1 else None,
-            'total_variance': float(total_variance_explained) if use_pca else None,
-            'pc1_features': pc1_top_features if use_pca else None,
-            'pc2_features': pc2_top_features if use_pca else None
+            'total_variance': float(embedding['total_variance_explained']) if use_pca else None,
+            'pc1_features': embedding['pc1_top_features'] if use_pca else None,
+            'pc2_features': embedding['pc2_top_features'] if use_pca else None
         }
     }
 
@@ -375,7 +476,7 @@ def get_all_customer_ids(country=None, start_date=None, end_date=None):
     Returns:
         lista de CustomerIDs
     """
-    customer_ids, _, _ = prepare_customer_features(
+    _, (customer_ids, _, _) = customer_features_stage(
         country=country,
         start_date=start_date,
         end_date=end_date
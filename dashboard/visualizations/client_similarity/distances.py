@@ -137,3 +137,162 @@ def compute_distance_matrix(X, metric='euclidean'):
         return compute_pearson_distance(X)
     else:
         raise ValueError(f"Métrica de distancia desconocida: {metric}")
+
+
+# Memoria máxima (bytes) de un bloque de distancias en el modo por bloques
+BLOCK_BYTES = 32 * 1024 * 1024
+
+METRICS = ('euclidean', 'cosine', 'pearson')
+
+
+def prepare_vectors(X, metric='euclidean'):
+    """
+    Prepara las filas de X una sola vez para calcular distancias por consulta
+    o por bloques, con la misma aritmética (float32) que las matrices
+    completas de arriba.
+
+    Args:
+        X: matriz numpy de forma (n_samples, n_features)
+        metric: 'euclidean', 'cosine', o 'pearson'
+
+    Returns:
+        dict con la métrica, los vectores preparados y, para euclidiana, la
+        norma al cuadrado de cada fila
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Métrica de distancia desconocida: {metric}")
+
+    if X.dtype != np.float32:
+        X = X.astype(np.float32)
+
+    prepared = {'metric': metric, 'n_features': X.shape[1], 'sum_squares': None}
+    if metric == 'euclidean':
+        prepared['vectors'] = X
+        prepared['sum_squares'] = np.sum(X**2, axis=1).astype(np.float32)
+    elif metric == 'cosine':
+        norms = np.linalg.norm(X, axis=1, keepdims=True).astype(np.float32)
+        norms[norms == 0] = 1
+        prepared['vectors'] = (X / norms).astype(np.float32)
+    else:
+        X_centered = (X - np.mean(X, axis=1, keepdims=True)).astype(np.float32)
+        X_std = np.std(X, axis=1, keepdims=True).astype(np.float32)
+        X_std[X_std == 0] = 1
+        prepared['vectors'] = (X_centered / X_std).astype(np.float32)
+    return prepared
+
+
+def distance_block(prepared, start, stop):
+    """
+    Distancias de las filas [start, stop) a todas las filas.
+
+    Args:
+        prepared: resultado de prepare_vectors
+        start, stop: rango de filas del bloque
+
+    Returns:
+        matriz float32 (stop - start, n_samples)
+    """
+    vectors = prepared['vectors']
+    metric = prepared['metric']
+    products = np.dot(vectors[start:stop], vectors.T).astype(np.float32)
+
+    if metric == 'euclidean':
+        sum_squares = prepared['sum_squares']
+        distances = sum_squares[start:stop, None] + sum_squares[None, :] - 2 * products
+        del products
+        np.maximum(distances, 0, out=distances)
+        np.sqrt(distances, out=distances)
+    else:
+        if metric == 'pearson':
+            products = (products / prepared['n_features']).astype(np.float32)
+        np.clip(products, -1, 1, out=products)
+        np.subtract(1, products, out=products)
+        distances = products
+
+    # Distancia de cada fila a sí misma exactamente 0
+    rows = np.arange(start, stop)
+    distances[rows - start, rows] = 0
+    return distances
+
+
+def compute_query_distances(X, query_idx, metric='euclidean', prepared=None):
+    """
+    Distancias de un solo cliente a todos los demás, sin construir la matriz
+    completa (memoria O(n) además de X).
+
+    Args:
+        X: matriz numpy de forma (n_samples, n_features)
+        query_idx: índice de la fila de consulta
+        metric: 'euclidean', 'cosine', o 'pearson'
+        prepared: resultado de prepare_vectors (opcional, para reutilizarlo)
+
+    Returns:
+        vector de distancias de forma (n_samples,)
+    """
+    if prepared is None:
+        prepared = prepare_vectors(X, metric)
+    return distance_block(prepared, query_idx, query_idx + 1)[0]
+
+
+def iter_distance_blocks(X, metric='euclidean', block_size=None, prepared=None):
+    """
+    Recorre la matriz de distancias por bloques de filas sin materializarla:
+    la memoria máxima es la de un bloque (block_size × n_samples float32).
+
+    Args:
+        X: matriz numpy de forma (n_samples, n_features)
+        metric: 'euclidean', 'cosine', o 'pearson'
+        block_size: filas por bloque (por defecto, las que caben en BLOCK_BYTES)
+        prepared: resultado de prepare_vectors (opcional, para reutilizarlo)
+
+    Yields:
+        tuple (start, distancias de las filas start..start+len(bloque))
+    """
+    if prepared is None:
+        prepared = prepare_vectors(X, metric)
+    n_samples = prepared['vectors'].shape[0]
+    if block_size is None:
+        block_size = max(1, BLOCK_BYTES // (4 * max(n_samples, 1)))
+
+    for start in range(0, n_samples, block_size):
+        stop = min(start + block_size, n_samples)
+        yield start, distance_block(prepared, start, stop)
+
+
+def exact_distances(X, rows, neighbor_indices, metric='euclidean'):
+    """
+    Distancias en float64 de cada fila a sus vecinos ya seleccionados.
+
+    Los productos matriciales float32 de distance_block sirven para elegir
+    los vecinos, pero su redondeo depende de la forma del bloque. Las
+    distancias que se devuelven se recalculan aquí, par a par y con la misma
+    aritmética para cualquier origen (grafo precalculado o índice de
+    vecinos), de modo que una misma consulta da las mismas distancias.
+
+    Args:
+        X: matriz numpy de forma (n_samples, n_features)
+        rows: índices de las filas consultadas, forma (m,)
+        neighbor_indices: vecinos de cada fila, forma (m, k)
+        metric: 'euclidean', 'cosine', o 'pearson'
+
+    Returns:
+        matriz float32 (m, k)
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Métrica de distancia desconocida: {metric}")
+    X = np.asarray(X, dtype=np.float32)
+    queries = X[np.asarray(rows, dtype=np.int64)].astype(np.float64)[:, None, :]
+    others = X[np.asarray(neighbor_indices, dtype=np.int64)].astype(np.float64)
+
+    if metric == 'euclidean':
+        return np.sqrt(np.sum((others - queries) ** 2, axis=-1)).astype(np.float32)
+
+    if metric == 'pearson':
+        queries = queries - np.mean(queries, axis=-1, keepdims=True)
+        others = others - np.mean(others, axis=-1, keepdims=True)
+    query_norms = np.sqrt(np.sum(queries ** 2, axis=-1))
+    other_norms = np.sqrt(np.sum(others ** 2, axis=-1))
+    query_norms[query_norms == 0] = 1
+    other_norms[other_norms == 0] = 1
+    similarity = np.sum(queries * others, axis=-1) / (query_norms * other_norms)
+    return (1 - np.clip(similarity, -1, 1)).astype(np.float32)
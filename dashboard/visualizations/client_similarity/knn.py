@@ -3,6 +3,8 @@ Módulo de búsqueda de K vecinos más cercanos
 """
 import numpy as np
 
+from .distances import compute_query_distances, exact_distances, iter_distance_blocks, prepare_vectors
+
 
 def find_k_nearest_neighbors(distance_matrix, k=10, customer_idx=None):
     """
@@ -56,6 +58,112 @@ def find_k_nearest_neighbors(distance_matrix, k=10, customer_idx=None):
         return all_neighbors
 
 
+def _nearest(distances, k):
+    """
+    Índices de las k menores distancias de cada fila, ordenados de menor a
+    mayor (empates por índice), con argpartition en lugar de ordenar la fila
+    completa.
+
+    Args:
+        distances: matriz (n_rows, n_samples) ya sin la distancia a sí mismo
+        k: número de vecinos (0 < k < n_samples)
+    """
+    candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+    order = np.lexsort((candidates, candidate_distances), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def nearest_neighbors_block(distances, start, k):
+    """
+    K vecinos más cercanos de cada fila de un bloque de distancias que
+    empieza en la fila `start` (se excluye a cada cliente de sus vecinos).
+    Modifica `distances`.
+
+    Returns:
+        tuple (índices int, distancias) de forma (n_rows, k)
+    """
+    rows = np.arange(distances.shape[0])
+    distances[rows, rows + start] = np.inf
+    if k <= 0:
+        empty = np.empty((len(rows), 0))
+        return empty.astype(np.int64), empty.astype(distances.dtype)
+
+    neighbor_indices = _nearest(distances, k)
+    return neighbor_indices, np.take_along_axis(distances, neighbor_indices, axis=1)
+
+
+def exact_neighbors(X, rows, neighbor_indices, metric='euclidean'):
+    """
+    Distancias exactas (ver distances.exact_distances) de los vecinos ya
+    seleccionados de cada fila, reordenados de menor a mayor (empates por
+    índice).
+
+    Args:
+        X: matriz numpy de características (n_samples, n_features)
+        rows: índices de las filas consultadas, forma (m,)
+        neighbor_indices: vecinos de cada fila, forma (m, k)
+        metric: 'euclidean', 'cosine', o 'pearson'
+
+    Returns:
+        tuple (índices int64, distancias float32) de forma (m, k)
+    """
+    neighbor_indices = np.asarray(neighbor_indices, dtype=np.int64).reshape(len(rows), -1)
+    distances = exact_distances(X, rows, neighbor_indices, metric)
+    order = np.lexsort((neighbor_indices, distances), axis=-1)
+    return np.take_along_axis(neighbor_indices, order, axis=-1), np.take_along_axis(distances, order, axis=-1)
+
+
+def _neighbors_of_rows(distances, start, k):
+    """Vecinos de un bloque de filas en el formato de find_k_nearest_neighbors"""
+    neighbor_indices, neighbor_distances = nearest_neighbors_block(distances, start, k)
+    return [
+        {
+            'neighbor_indices': indices.tolist(),
+            'neighbor_distances': row_distances.tolist()
+        }
+        for indices, row_distances in zip(neighbor_indices, neighbor_distances)
+    ]
+
+
+def find_k_nearest_neighbors_blocked(X, k=10, customer_idx=None, metric='euclidean', block_size=None,
+                                     prepared=None):
+    """
+    Igual que find_k_nearest_neighbors, pero a partir de las características
+    y sin materializar la matriz de distancias: con customer_idx solo se
+    calcula su fila (memoria O(n)); sin él, la matriz se recorre por bloques
+    de filas (memoria O(block_size·n)).
+
+    Args:
+        X: matriz numpy de características (n_samples, n_features)
+        k: número de vecinos más cercanos a encontrar
+        customer_idx: índice del cliente (opcional). Si es None, devuelve para todos
+        metric: 'euclidean', 'cosine', o 'pearson'
+        block_size: filas por bloque (opcional, ver iter_distance_blocks)
+        prepared: resultado de prepare_vectors (opcional, para reutilizarlo)
+
+    Returns:
+        el mismo formato que find_k_nearest_neighbors
+    """
+    n_samples = X.shape[0]
+
+    # Ajustar k si es mayor que el número de muestras
+    k = min(k, n_samples - 1)
+
+    if prepared is None:
+        prepared = prepare_vectors(X, metric)
+
+    if customer_idx is not None:
+        distances = compute_query_distances(X, customer_idx, prepared=prepared)
+        return _neighbors_of_rows(distances[None, :], customer_idx, k)[0]
+
+    all_neighbors = {}
+    for start, block in iter_distance_blocks(X, block_size=block_size, prepared=prepared):
+        for offset, neighbors in enumerate(_neighbors_of_rows(block, start, k)):
+            all_neighbors[start + offset] = neighbors
+    return all_neighbors
+
+
 def create_edges_list(customer_idx, neighbor_indices, customer_ids):
     """
     Crea una lista de conexiones (edges) entre el cliente y sus vecinos
@@ -0,0 +1,257 @@
+"""
+Grafo completo de K vecinos más cercanos precalculado en disco.
+
+Para una configuración de similitud (filtros, normalización, métrica) se
+calculan los k vecinos de todos los clientes recorriendo la matriz de
+distancias por bloques de filas (productos matriciales + argpartition, ver
+distances.distance_block y knn.nearest_neighbors_block), repartidos en un
+pool de hilos: numpy libera el GIL en los productos y las selecciones, y la
+memoria máxima es la de un bloque por hilo. Las distancias guardadas se
+recalculan par a par (knn.exact_neighbors), igual que en NeighborIndex.
+
+El resultado se guarda en formato CSR, con archivos .npy sin comprimir en
+`<DASHBOARD_DATA_CACHE_DIR>/knn/retail-<huella>-<configuración>/`:
+
+- indptr.npy: inicio de los vecinos de cada cliente (int64, n + 1)
+- indices.npy: fila de cada vecino (int32)
+- distances.npy: distancia a cada vecino (float32)
+- customer_ids.npy: ID de cliente de cada fila
+- meta.json: k, métrica, normalización y filtros
+
+Los workers abren esos archivos con np.load(mmap_mode='r'), de modo que las
+páginas del grafo se comparten en la caché de páginas del sistema operativo.
+Se construye con `python manage.py build_knn_graph` y se puede exportar como
+lista de aristas para dibujar la red de similitud completa.
+"""
+import csv
+import json
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .distances import BLOCK_BYTES, distance_block, prepare_vectors
+from .knn import exact_neighbors, nearest_neighbors_block
+
+GRAPH_FILES = ('indptr.npy', 'indices.npy', 'distances.npy', 'customer_ids.npy')
+
+
+def graph_path(cache_dir, fingerprint, config_key):
+    """Directorio del grafo de una configuración para una versión del dataset"""
+    return Path(cache_dir) / 'knn' / f'retail-{fingerprint[:16]}-{config_key}'
+
+
+def build_knn_graph(X, k=10, metric='euclidean', block_size=None, workers=None):
+    """
+    Calcula los k vecinos más cercanos de todas las filas de X.
+
+    Args:
+        X: matriz numpy de características (n_samples, n_features)
+        k: vecinos por cliente (se ajusta a n_samples - 1)
+        metric: 'euclidean', 'cosine', o 'pearson'
+        block_size: filas por bloque (por defecto, las que caben en BLOCK_BYTES)
+        workers: hilos del pool (por defecto, los núcleos disponibles)
+
+    Returns:
+        tuple CSR (indptr, indices, distances)
+    """
+    n_samples = X.shape[0]
+    k = max(0, min(k, n_samples - 1))
+    prepared = prepare_vectors(X, metric)
+    if block_size is None:
+        block_size = max(1, BLOCK_BYTES // (4 * max(n_samples, 1)))
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # Todas las filas tienen exactamente k vecinos
+    indptr = np.arange(n_samples + 1, dtype=np.int64) * k
+    indices = np.empty(n_samples * k, dtype=np.int32)
+    distances = np.empty(n_samples * k, dtype=np.float32)
+
+    def process(start):
+        stop = min(start + block_size, n_samples)
+        block = distance_block(prepared, start, stop)
+        block_indices, _ = nearest_neighbors_block(block, start, k)
+        del block
+        # Mismas distancias que NeighborIndex para los mismos vecinos
+        block_indices, block_distances = exact_neighbors(X, np.arange(start, stop), block_indices, metric)
+        # Cada bloque escribe su propio tramo de los arreglos de salida
+        indices[start * k:stop * k] = block_indices.ravel()
+        distances[start * k:stop * k] = block_distances.ravel()
+
+    starts = range(0, n_samples, block_size)
+    if workers <= 1:
+        for start in starts:
+            process(start)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() propaga las excepciones de los hilos
+            list(pool.map(process, starts))
+
+    return indptr, indices, distances
+
+
+def save_knn_graph(path, graph, customer_ids, meta):
+    """
+    Guarda el grafo CSR de forma atómica (directorio temporal + rename) y
+    elimina los grafos de otras versiones del dataset.
+    """
+    path = Path(path)
+    indptr, indices, distances = graph
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.parent / f'.{path.name}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir()
+    try:
+        np.save(tmp_path / 'indptr.npy', indptr)
+        np.save(tmp_path / 'indices.npy', indices)
+        np.save(tmp_path / 'distances.npy', distances)
+        np.save(tmp_path / 'customer_ids.npy', np.asarray(customer_ids, dtype=str))
+        with open(tmp_path / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+        # Reemplazar la versión anterior de esta configuración, si existe
+        old_path = path.parent / f'.{path.name}.{os.getpid()}.old'
+        if path.exists():
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    # Eliminar grafos de otras versiones del dataset
+    version_prefix = path.name[:len('retail-') + 16]
+    for other in path.parent.glob('retail-*'):
+        if not other.name.startswith(version_prefix):
+            shutil.rmtree(other, ignore_errors=True)
+
+
+class KNNGraph:
+    """
+    Grafo de vecinos guardado en disco, mapeado en memoria.
+
+    Args:
+        path: directorio del grafo (ver graph_path)
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / 'meta.json', 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.k = self.meta['k']
+        self.indptr = np.load(self.path / 'indptr.npy', mmap_mode='r')
+        self.indices = np.load(self.path / 'indices.npy', mmap_mode='r')
+        self.distances = np.load(self.path / 'distances.npy', mmap_mode='r')
+        self.customer_ids = np.load(self.path / 'customer_ids.npy', mmap_mode='r')
+        self._positions = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    def position(self, customer_id):
+        """Fila del cliente en el grafo, o None si no está"""
+        if self._positions is None:
+            with self._lock:
+                if self._positions is None:
+                    self._positions = {str(cid): i for i, cid in enumerate(self.customer_ids.tolist())}
+        return self._positions.get(str(customer_id))
+
+    def neighbors(self, customer_idx, k=None):
+        """
+        Vecinos de un cliente (los k primeros si se indica k).
+
+        Returns:
+            dict con 'neighbor_indices' y 'neighbor_distances' (mismo formato
+            que find_k_nearest_neighbors)
+        """
+        start, stop = int(self.indptr[customer_idx]), int(self.indptr[customer_idx + 1])
+        if k is not None:
+            stop = min(stop, start + k)
+        return {
+            'neighbor_indices': self.indices[start:stop].tolist(),
+            'neighbor_distances': self.distances[start:stop].tolist()
+        }
+
+    def iter_edges(self):
+        """Aristas (id origen, id destino, distancia) de todo el grafo"""
+        customer_ids = self.customer_ids.tolist()
+        for row, source_id in enumerate(customer_ids):
+            start, stop = int(self.indptr[row]), int(self.indptr[row + 1])
+            for neighbor_idx, distance in zip(self.indices[start:stop].tolist(),
+                                              self.distances[start:stop].tolist()):
+                yield source_id, customer_ids[neighbor_idx], distance
+
+
+def export_edge_list(graph, output):
+    """
+    Exporta el grafo como lista de aristas CSV (source,target,distance).
+
+    Args:
+        graph: KNNGraph
+        output: ruta del archivo o archivo de texto abierto
+
+    Returns:
+        número de aristas escritas
+    """
+    if isinstance(output, (str, Path)):
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            return export_edge_list(graph, f)
+
+    writer = csv.writer(output)
+    writer.writerow(['source', 'target', 'distance'])
+    count = 0
+    for source_id, target_id, distance in graph.iter_edges():
+        writer.writerow([source_id, target_id, f'{distance:.6g}'])
+        count += 1
+    return count
+
+
+_graphs = {}
+_graphs_lock = threading.Lock()
+
+
+def _graph_signature(path):
+    """
+    Identifica la construcción del grafo guardada en `path`: save_knn_graph
+    reemplaza el directorio completo, así que un meta.json nuevo es otro grafo
+    """
+    stat = os.stat(path / 'meta.json')
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def open_knn_graph(path):
+    """
+    Grafo precalculado en `path`, abierto una sola vez por construcción y
+    proceso, o None si no existe (o está incompleto). Si el grafo se vuelve
+    a construir (por ejemplo, con otro k) se abre la versión nueva.
+    """
+    path = Path(path)
+    if not all((path / name).exists() for name in (*GRAPH_FILES, 'meta.json')):
+        return None
+    try:
+        signature = _graph_signature(path)
+    except OSError:
+        return None
+    cached = _graphs.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with _graphs_lock:
+        cached = _graphs.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        try:
+            graph = KNNGraph(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"No se pudo abrir el grafo de vecinos {path.name}: {e}", file=sys.stderr)
+            return None
+        # Solo se conservan los grafos de la versión actual del dataset
+        version_prefix = path.name[:len('retail-') + 16]
+        for other in [p for p in _graphs if not p.name.startswith(version_prefix)]:
+            del _graphs[other]
+        _graphs[path] = (signature, graph)
+    return graph
@@ -0,0 +1,151 @@
+"""
+Índice de vecinos más cercanos por configuración de similitud.
+
+Al seleccionar un cliente en el panel de similitud solo cambia el cliente
+consultado: las características normalizadas y la estructura de búsqueda son
+las mismas para cada combinación de (filtros, normalización, métrica). El
+índice se construye una vez por combinación y versión del dataset y se
+reutiliza entre peticiones:
+
+- euclidiana: KD-tree (scipy.spatial.cKDTree) sobre las 7 características,
+  con consultas en O(log n)
+- coseno y Pearson: vectores normalizados una sola vez, con productos punto
+  de la fila consultada contra todas (ver distances.prepare_vectors)
+
+Los índices se guardan en una caché LRU limitada por número de entradas
+(DASHBOARD_NEIGHBOR_INDEX_CACHE_SIZE) y por memoria
+(DASHBOARD_NEIGHBOR_INDEX_MAX_BYTES).
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+from dashboard.visualizations.shared.data_loader import get_dataset_version
+from dashboard.visualizations.shared.lru import LRUCache
+from .distances import prepare_vectors
+from .knn import exact_neighbors, find_k_nearest_neighbors_blocked
+
+DEFAULT_INDEX_CACHE_SIZE = 16
+DEFAULT_INDEX_MAX_BYTES = 256 * 1024 * 1024
+
+
+class NeighborIndex:
+    """
+    Índice de búsqueda de vecinos sobre las características normalizadas de
+    un conjunto de clientes.
+
+    Args:
+        customer_ids: lista de IDs de clientes (en el orden de las filas)
+        features: matriz float32 (n_customers, n_features) ya normalizada
+        metric: 'euclidean', 'cosine', o 'pearson'
+    """
+
+    def __init__(self, customer_ids, features, metric='euclidean'):
+        self.customer_ids = list(customer_ids)
+        self.positions = {str(cid): i for i, cid in enumerate(self.customer_ids)}
+        self.features = features
+        self.metric = metric
+        self.tree = None
+        self.prepared = None
+        if metric == 'euclidean':
+            self.tree = cKDTree(features)
+        else:
+            # Lanza ValueError si la métrica no existe
+            self.prepared = prepare_vectors(features, metric)
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    @property
+    def nbytes(self):
+        """Memoria aproximada del índice (para el presupuesto de la caché)"""
+        n_samples, n_features = self.features.shape
+        total = self.features.nbytes
+        if self.tree is not None:
+            # Copia float64 de los datos, permutación de índices y nodos
+            total += n_samples * n_features * 8 + n_samples * 8 + (n_samples // 8 + 1) * 96
+        if self.prepared is not None:
+            total += self.prepared['vectors'].nbytes
+        return total
+
+    def position(self, customer_id):
+        """Fila del cliente en el índice, o None si no está"""
+        return self.positions.get(str(customer_id))
+
+    def neighbors(self, customer_idx, k=10):
+        """
+        K vecinos más cercanos de un cliente del índice.
+
+        Returns:
+            dict con 'neighbor_indices' y 'neighbor_distances' (mismo formato
+            que find_k_nearest_neighbors)
+        """
+        k = min(k, len(self) - 1)
+        if k <= 0:
+            return {'neighbor_indices': [], 'neighbor_distances': []}
+
+        if self.tree is None:
+            result = find_k_nearest_neighbors_blocked(
+                self.features, k=k, customer_idx=customer_idx, prepared=self.prepared
+            )
+            return self._exact(customer_idx, result['neighbor_indices'])
+
+        # Se pide un vecino más para descartar al propio cliente (que puede no
+        # ser el primero si hay clientes con características idénticas)
+        query = self.features[customer_idx]
+        distances, _ = self.tree.query(query, k=k + 1)
+        # El KD-tree no fija cuáles de los clientes empatados con el último
+        # vecino devuelve: se recogen todos los que están a esa distancia y se
+        # desempata por fila, como en la búsqueda por bloques
+        radius = distances[-1]
+        indices = np.asarray(self.tree.query_ball_point(query, radius * (1 + 1e-9) + 1e-12), dtype=np.int64)
+        return self._exact(customer_idx, indices[indices != customer_idx], k)
+
+    def _exact(self, customer_idx, candidates, k=None):
+        """
+        Los k candidatos más cercanos, con las distancias exactas que guarda
+        también el grafo precalculado (ver knn.exact_neighbors)
+        """
+        indices, distances = exact_neighbors(self.features, [customer_idx], [candidates], self.metric)
+        return {
+            'neighbor_indices': indices[0][:k].tolist(),
+            'neighbor_distances': distances[0][:k].tolist()
+        }
+
+
+_index_cache = LRUCache(
+    'DASHBOARD_NEIGHBOR_INDEX_CACHE_SIZE', DEFAULT_INDEX_CACHE_SIZE,
+    'DASHBOARD_NEIGHBOR_INDEX_MAX_BYTES', DEFAULT_INDEX_MAX_BYTES
+)
+
+
+def get_neighbor_index(key, build):
+    """
+    Índice de vecinos de una configuración, desde la caché o construyéndolo.
+
+    Args:
+        key: clave hashable de la configuración (filtros, normalización, métrica)
+        build: función sin argumentos que construye el NeighborIndex (o None
+            si no hay clientes)
+
+    Returns:
+        NeighborIndex, o None si build() no produjo índice
+    """
+    version = get_dataset_version()
+    cache_key = (key, version)
+    index = _index_cache.get(cache_key) if version is not None else None
+    if index is None:
+        index = build()
+        # Solo se guarda si el dataset estaba (y sigue) cargado
+        if index is not None and version is not None and get_dataset_version() == version:
+            _index_cache.put(cache_key, index, index.nbytes)
+    return index
+
+
+def get_neighbor_index_stats():
+    """Estadísticas de la caché de índices de vecinos"""
+    return _index_cache.stats()
+
+
+def clear_neighbor_indexes():
+    """Descarta todos los índices de vecinos"""
+    _index_cache.clear()
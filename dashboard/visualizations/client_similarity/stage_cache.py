@@ -0,0 +1,81 @@
+"""
+Caché de las etapas del pipeline de similitud de clientes, direccionada por
+contenido.
+
+Cada etapa (características, normalización, embedding 2D, clusters,
+outliers...) se guarda bajo un hash de su nombre, sus parámetros y las claves
+de las etapas de las que depende. La etapa raíz (características) incluye la
+versión del dataset, así que un cambio del dataset invalida toda la cadena; y
+cambiar un parámetro solo invalida las etapas que lo usan: cambiar k o el
+cliente seleccionado no vuelve a ajustar PCA ni KMeans, y cambiar los ejes no
+vuelve a calcular los clusters.
+
+Las salidas guardadas se comparten entre peticiones: no deben modificarse.
+"""
+import hashlib
+import sys
+
+import numpy as np
+
+from dashboard.visualizations.shared.data_loader import get_dataset_version
+from dashboard.visualizations.shared.lru import LRUCache
+
+DEFAULT_STAGE_CACHE_SIZE = 128
+DEFAULT_STAGE_MAX_BYTES = 128 * 1024 * 1024
+
+_stage_cache = LRUCache(
+    'DASHBOARD_SIMILARITY_STAGE_CACHE_SIZE', DEFAULT_STAGE_CACHE_SIZE,
+    'DASHBOARD_SIMILARITY_STAGE_MAX_BYTES', DEFAULT_STAGE_MAX_BYTES
+)
+
+
+def stage_key(stage, *inputs):
+    """
+    Clave (hex) de una etapa: hash de su nombre y sus entradas (parámetros
+    y claves de las etapas previas)
+    """
+    return hashlib.sha256(repr((stage, inputs)).encode('utf-8')).hexdigest()
+
+
+def estimate_nbytes(value):
+    """Memoria aproximada de la salida de una etapa (arreglos, listas, dicts)"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_nbytes(k) + estimate_nbytes(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def cached_stage(key, compute):
+    """
+    Salida de una etapa desde la caché o calculándola.
+
+    Args:
+        key: clave de la etapa (ver stage_key)
+        compute: función sin argumentos que calcula la salida
+
+    Returns:
+        salida de la etapa
+    """
+    version = get_dataset_version()
+    value = _stage_cache.get(key) if version is not None else None
+    if value is None:
+        value = compute()
+        # Solo se guarda si el dataset estaba (y sigue) cargado
+        if value is not None and version is not None and get_dataset_version() == version:
+            _stage_cache.put(key, value, estimate_nbytes(value))
+    return value
+
+
+def get_stage_cache_stats():
+    """Estadísticas de la caché de etapas de similitud"""
+    return _stage_cache.stats()
+
+
+def clear_stage_cache():
+    """Descarta todas las etapas memorizadas"""
+    _stage_cache.clear()
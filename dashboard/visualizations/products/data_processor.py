@@ -2,17 +2,10 @@
 Procesador de datos para la visualización de Top 5 productos más vendidos.
 """
 import polars as pl
-from dashboard.visualizations.shared.data_loader import load_online_retail_data
-
-
-def detectar_outliers_iqr(df, columna):
-    """Detecta outliers usando el método IQR"""
-    Q1 = df[columna].quantile(0.25)
-    Q3 = df[columna].quantile(0.75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    return lower_bound, upper_bound
+from dashboard.visualizations.shared.data_loader import load_online_retail_data, get_top_products_index
+from dashboard.visualizations.shared.cubes import CUBE_PRODUCTS
+from dashboard.visualizations.shared.heavy_hitters import top_products
+from dashboard.visualizations.shared.filters import FilterSpec
 
 
 def get_top_products_data(country=None, customer_profile=None, start_date=None, end_date=None, category=None, subcategory=None):
@@ -32,97 +25,41 @@ def get_top_products_data(country=None, customer_profile=None, start_date=None,
     """
     print(f"DEBUG - get_top_products_data: country={country}, profile={customer_profile}, dates={start_date} to {end_date}, category={category}, subcategory={subcategory}")
     
-    df = load_online_retail_data()
-    
-    if df is None or df.height == 0:
-        print("DEBUG - DataFrame vacío o None")
-        return None
-    
-    print(f"DEBUG - DataFrame inicial: {df.height} filas")
-    
-    # Asegurar que InvoiceDate sea datetime
-    df = df.with_columns([
-        pl.col('InvoiceDate').str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S").alias('InvoiceDate')
-    ])
-    
-    # Filtrar por rango de fechas si se especifica
-    if start_date:
-        start_datetime = pl.lit(start_date + "-01").str.strptime(pl.Datetime, "%Y-%m-%d")
-        df = df.filter(pl.col('InvoiceDate') >= start_datetime)
-        print(f"DEBUG - Después de filtrar por fecha inicio {start_date}: {df.height} filas")
-    
-    if end_date:
-        # Calcular el último día del mes
-        import datetime
-        year, month = map(int, end_date.split('-'))
-        if month == 12:
-            next_month = datetime.datetime(year + 1, 1, 1)
-        else:
-            next_month = datetime.datetime(year, month + 1, 1)
-        last_day = next_month - datetime.timedelta(days=1)
-        end_datetime = pl.lit(last_day.strftime("%Y-%m-%d") + " 23:59:59").str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S")
-        df = df.filter(pl.col('InvoiceDate') <= end_datetime)
-        print(f"DEBUG - Después de filtrar por fecha fin {end_date}: {df.height} filas")
-    
-    # Filtrar por país si se especifica
-    if country:
-        df = df.filter(pl.col('Country') == country)
-        print(f"DEBUG - Después de filtrar por país {country}: {df.height} filas")
-    
-    # Filtrar por perfil de cliente si se especifica
-    if customer_profile:
-        # Crear columna Total si no existe
-        if 'Total' not in df.columns:
-            df = df.with_columns(
-                (pl.col('Quantity') * pl.col('UnitPrice')).alias('Total')
-            )
-        
-        # Detectar outliers en Total y UnitPrice
-        total_lower, total_upper = detectar_outliers_iqr(df, 'Total')
-        price_lower, price_upper = detectar_outliers_iqr(df, 'UnitPrice')
-        
-        # Clasificar cada transacción
-        df = df.with_columns(
-            pl.when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') <= price_upper))
-            .then(pl.lit('Mayorista Estándar'))
-            .when((pl.col('Total') <= total_upper) & (pl.col('UnitPrice') > price_upper))
-            .then(pl.lit('Minorista Lujo'))
-            .when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') > price_upper))
-            .then(pl.lit('Mayorista Lujo'))
-            .otherwise(pl.lit('Minorista Estándar'))
-            .alias('Perfil')
-        )
-        
-        # Filtrar por el perfil especificado
-        df = df.filter(pl.col('Perfil') == customer_profile)
-        print(f"DEBUG - Después de filtrar por perfil {customer_profile}: {df.height} filas")
-
-    # Filtrar por categoría si se especifica
-    if category:
-        df = df.filter(pl.col('Category') == category)
-        print(f"DEBUG - Después de filtrar por categoría {category}: {df.height} filas")
-
-    # Filtrar por subcategoría si se especifica
-    if subcategory:
-        df = df.filter(pl.col('Subcategory') == subcategory)
-        print(f"DEBUG - Después de filtrar por subcategoría {subcategory}: {df.height} filas")
-
-    # Calcular ventas totales por producto
-    if 'Sales' not in df.columns:
-        df = df.with_columns([
-            (pl.col('Quantity') * pl.col('UnitPrice')).alias('Sales')
-        ])
-    
-    # Agrupar por descripción del producto
-    productos_ventas = (
-        df.group_by('Description')
-        .agg([
-            pl.col('Sales').sum().alias('TotalSales'),
-            pl.col('Quantity').sum().alias('TotalQuantity')
-        ])
-        .sort('TotalSales', descending=True)
-        .head(5)  # Top 5
+    spec = FilterSpec.from_params(
+        country=country,
+        start_date=start_date,
+        end_date=end_date,
+        customer_profile=customer_profile,
+        category=category,
+        subcategory=subcategory
     )
+    # Sin filtro de perfil se suma el cubo de productos; si no, las transacciones
+    productos_ventas = None
+    lf = spec.compile_cube(CUBE_PRODUCTS)
+    if lf is not None:
+        # Candidatos de los resúmenes por partición y pasada exacta solo sobre ellos
+        index = get_top_products_index()
+        if index is not None:
+            productos_ventas = top_products(index, lf, 5, spec.start_date, spec.end_date, spec.equals())
+    else:
+        lf = spec.compile(['Description', 'Quantity', 'Total'])
+        if lf is None:
+            print("DEBUG - DataFrame vacío o None")
+            return None
+        lf = lf.rename({'Total': 'Sales'})
+
+    if productos_ventas is None:
+        # Agrupar por descripción del producto
+        productos_ventas = (
+            lf.group_by('Description')
+            .agg([
+                pl.col('Sales').sum().alias('TotalSales'),
+                pl.col('Quantity').sum().alias('TotalQuantity')
+            ])
+            .sort('TotalSales', descending=True)
+            .head(5)  # Top 5
+            .collect()
+        )
     
     print(f"DEBUG - Productos encontrados: {productos_ventas.height}")
     
@@ -167,7 +104,7 @@ def get_categories_and_subcategories():
         return {'categories': [], 'subcategories_by_category': {}}
 
     # Obtener categorías únicas ordenadas
-    categories = df['Category'].unique().sort().to_list()
+    categories = df['Category'].unique().cast(pl.Utf8).sort().to_list()
 
     # Obtener subcategorías por categoría
     subcategories_by_category = {}
@@ -175,6 +112,7 @@ def get_categories_and_subcategories():
         subcategories = (
             df.filter(pl.col('Category') == category)['Subcategory']
             .unique()
+            .cast(pl.Utf8)
             .sort()
             .to_list()
         )
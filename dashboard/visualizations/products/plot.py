@@ -1,8 +1,87 @@
 """
 Generador de gráfico de Top 5 productos más vendidos.
 """
-import plotly.graph_objects as go
 from dashboard.visualizations.products.data_processor import get_top_products_data
+from dashboard.visualizations.shared.figures import make_figure, paper_annotation, title
+
+_LABEL_FONT = {'size': 12, 'color': '#2c3e50'}
+
+# Figura sin datos: solo el título y un mensaje
+_EMPTY_LAYOUT = {
+    'title': title('Top 5 Productos Más Vendidos', 20),
+    'xaxis': {'visible': False},
+    'yaxis': {'visible': False},
+    'annotations': [{
+        'text': 'No hay datos disponibles',
+        'xref': 'paper',
+        'yref': 'paper',
+        'x': 0.5,
+        'y': 0.5,
+        'xanchor': 'center',
+        'yanchor': 'middle',
+        'showarrow': False,
+        'font': {'size': 14, 'color': '#666'}
+    }],
+    'margin': {'r': 20, 't': 60, 'l': 20, 'b': 20}
+}
+
+# Partes fijas del layout; solo cambian el título y el total
+_LAYOUT = {
+    'xaxis': {
+        'title': {'text': 'Ventas (£)', 'font': _LABEL_FONT},
+        'showgrid': True,
+        'gridcolor': 'lightgray',
+        'tickfont': {'size': 11, 'color': '#2c3e50'},
+        'fixedrange': True
+    },
+    'yaxis': {
+        'title': {'text': '', 'font': _LABEL_FONT},
+        'showgrid': False,
+        'tickfont': {'size': 10, 'color': '#2c3e50'},
+        'fixedrange': True
+    },
+    'plot_bgcolor': 'white',
+    'paper_bgcolor': 'rgba(0,0,0,0)',
+    'margin': {'r': 80, 't': 100, 'l': 180, 'b': 60},  # Aumentado margen superior de 60 a 100
+    'hovermode': 'closest',
+    'dragmode': False,
+}
+_BAR = {
+    'type': 'bar',
+    'orientation': 'h',
+    'marker': {'color': '#0824a4', 'line': {'color': 'white', 'width': 1.5}},
+    'textposition': 'outside',
+    'textfont': {'size': 11, 'color': '#2c3e50'},
+    'hovertemplate': '<b>%{y}</b><br>' +
+                     'Ventas: £%{x:,.2f}<br>' +
+                     'Cantidad: %{customdata:,}<br>' +
+                     '<extra></extra>',
+}
+
+# Top 5 de productos de los clientes seleccionados (barras en naranja para
+# indicar que es un resultado filtrado)
+_CUSTOMERS_LAYOUT = {
+    'xaxis': {
+        'title': {'text': 'Cantidad Vendida'},
+        'showgrid': True,
+        'gridcolor': 'rgba(200, 200, 200, 0.2)'
+    },
+    'yaxis': {
+        'title': {'text': ''},
+        'autorange': 'reversed'
+    },
+    'plot_bgcolor': 'rgba(0,0,0,0)',
+    'paper_bgcolor': 'rgba(0,0,0,0)',
+    'margin': {'l': 200, 'r': 50, 't': 100, 'b': 50},  # Aumentado margen superior de 80 a 100
+    'height': 400,
+}
+_CUSTOMERS_BAR = {
+    'type': 'bar',
+    'orientation': 'h',
+    'marker': {'color': '#FF5722'},
+    'textposition': 'outside',
+    'hovertemplate': '<b>%{y}</b><br>Cantidad: %{x:,}<extra></extra>',
+}
 
 
 def create_top_products_plot(country=None, customer_profile=None, start_date=None, end_date=None, category=None, subcategory=None):
@@ -18,7 +97,7 @@ def create_top_products_plot(country=None, customer_profile=None, start_date=Non
         subcategory: Subcategoría para filtrar (opcional)
 
     Returns:
-        Figura de Plotly
+        Figura de Plotly (dict)
     """
     print(f"DEBUG - create_top_products_plot: country={country}, profile={customer_profile}, dates={start_date} to {end_date}, category={category}, subcategory={subcategory}")
 
@@ -26,62 +105,34 @@ def create_top_products_plot(country=None, customer_profile=None, start_date=Non
     
     print(f"DEBUG - data received: {data}")
     
+    return build_top_products_figure(data, country, customer_profile)
+
+
+def build_top_products_figure(data, country=None, customer_profile=None):
+    """
+    Arma la figura del Top 5 de productos a partir de los datos de
+    get_top_products_data.
+
+    Returns:
+        Figura de Plotly (dict)
+    """
     if not data or data['total_products'] == 0:
         print("DEBUG - No hay datos, retornando figura vacía")
         # Retornar una figura con mensaje en lugar de figura vacía
-        fig = go.Figure()
-        fig.update_layout(
-            title={
-                'text': 'Top 5 Productos Más Vendidos',
-                'x': 0.5,
-                'xanchor': 'center',
-                'font': {
-                    'size': 20,
-                    'color': '#0824a4',
-                    'family': 'Arial, sans-serif'
-                }
-            },
-            xaxis={'visible': False},
-            yaxis={'visible': False},
-            annotations=[{
-                'text': 'No hay datos disponibles',
-                'xref': 'paper',
-                'yref': 'paper',
-                'x': 0.5,
-                'y': 0.5,
-                'xanchor': 'center',
-                'yanchor': 'middle',
-                'showarrow': False,
-                'font': {'size': 14, 'color': '#666'}
-            }],
-            margin={"r": 20, "t": 60, "l": 20, "b": 20}
-        )
-        return fig
+        return make_figure(layout=_EMPTY_LAYOUT)
     
     products = data['products']
     sales = data['sales']
     quantities = data['quantities']
     
-    # Crear el gráfico de barras horizontales
-    fig = go.Figure(data=[
-        go.Bar(
-            y=products,
-            x=sales,
-            orientation='h',
-            marker=dict(
-                color='#0824a4',
-                line=dict(color='white', width=1.5)
-            ),
-            text=[f'£{s:,.0f}' for s in sales],
-            textposition='outside',
-            textfont=dict(size=11, color='#2c3e50'),
-            hovertemplate='<b>%{y}</b><br>' +
-                         'Ventas: £%{x:,.2f}<br>' +
-                         'Cantidad: %{customdata:,}<br>' +
-                         '<extra></extra>',
-            customdata=quantities
-        )
-    ])
+    # Barras horizontales
+    bar = {
+        **_BAR,
+        'y': products,
+        'x': sales,
+        'text': [f'£{s:,.0f}' for s in sales],
+        'customdata': quantities
+    }
     
     # Determinar el título según los filtros aplicados
     if country and customer_profile:
@@ -96,59 +147,58 @@ def create_top_products_plot(country=None, customer_profile=None, start_date=Non
     # Calcular el total de ventas para el subtítulo
     total_sales = sum(sales)
     
-    # Configurar el layout
-    fig.update_layout(
-        title={
-            'text': title_text,
-            'x': 0.5,
-            'xanchor': 'center',
-            'font': {
-                'size': 20,
-                'color': '#0824a4',
-                'family': 'Arial, sans-serif'
-            }
-        },
-        xaxis={
-            'title': {
-                'text': 'Ventas (£)',
-                'font': {'size': 12, 'color': '#2c3e50'}
-            },
-            'showgrid': True,
-            'gridcolor': 'lightgray',
-            'tickfont': {'size': 11, 'color': '#2c3e50'},
-            'fixedrange': True
-        },
-        yaxis={
-            'title': {
-                'text': '',
-                'font': {'size': 12, 'color': '#2c3e50'}
-            },
-            'showgrid': False,
-            'tickfont': {'size': 10, 'color': '#2c3e50'},
-            'fixedrange': True
-        },
-        plot_bgcolor='white',
-        paper_bgcolor='rgba(0,0,0,0)',
-        margin={"r": 80, "t": 100, "l": 180, "b": 60},  # Aumentado margen superior de 60 a 100
-        hovermode='closest',
-        dragmode=False,
-        annotations=[
-            dict(
-                text=f'Total de ventas (Top 5): £{total_sales:,.2f}',
-                xref='paper',
-                yref='paper',
-                x=0.5,
-                y=1.05,  # Ajustado de 1.08 a 1.05 para evitar solapamiento
-                xanchor='center',
-                yanchor='bottom',
-                showarrow=False,
-                font=dict(
-                    size=11,
-                    color='#666666',  # Color más suave
-                    family='Arial, sans-serif'
-                )
-            )
+    # Completar la plantilla del layout
+    return make_figure([bar], {
+        **_LAYOUT,
+        'title': title(title_text, 20),
+        'annotations': [
+            # Ajustado de 1.08 a 1.05 para evitar solapamiento
+            paper_annotation(f'Total de ventas (Top 5): £{total_sales:,.2f}', y=1.05, color='#666666')
         ]
-    )
-    
-    return fig
+    })
+
+
+def build_products_by_customers_figure(products, quantities, total_customers, category=None, subcategory=None):
+    """
+    Arma la figura del Top 5 de productos comprados por un grupo de clientes.
+
+    Args:
+        products: descripciones de los productos
+        quantities: cantidad total comprada de cada producto
+        total_customers: número de clientes seleccionados
+        category: Categoría filtrada (opcional)
+        subcategory: Subcategoría filtrada (opcional)
+
+    Returns:
+        Figura de Plotly (dict)
+    """
+    bar = {
+        **_CUSTOMERS_BAR,
+        'x': quantities,
+        'y': products,
+        'text': [f'{q:,}' for q in quantities]
+    }
+
+    # Calcular total de cantidad vendida
+    total_quantity = sum(quantities)
+
+    # Construir título dinámico
+    title_parts = []
+    if category and subcategory:
+        title_parts.append(f'{subcategory}')
+    elif category:
+        title_parts.append(f'{category}')
+
+    if title_parts:
+        title_text = f'{" - ".join(title_parts)}: Top Compras de {total_customers} Clientes'
+    else:
+        title_text = f'Productos Más Comprados por {total_customers} Clientes Seleccionados'
+
+    return make_figure([bar], {
+        **_CUSTOMERS_LAYOUT,
+        'title': title(title_text, 18, color='#FF5722'),
+        'annotations': [
+            # Ajustado de 1.08 a 1.05 para evitar solapamiento
+            paper_annotation(f'Total vendido: {total_quantity:,} unidades', y=1.05, color='#666666')
+        ]
+    })
@@ -4,8 +4,9 @@ Genera información completa, comparaciones e insights automáticos para un día
 """
 import polars as pl
 from datetime import datetime, timedelta
-from dashboard.visualizations.shared.data_loader import load_online_retail_data
-from dashboard.visualizations.sales.data_processor import detectar_outliers_iqr
+from dashboard.visualizations.shared.daily_index import get_daily_sales_index
+from dashboard.visualizations.shared.filters import FilterSpec
+from dashboard.visualizations.shared.query import perfil_expr
 
 
 def get_daily_sales_detail(date_str, country=None, customer_profile=None, start_date=None, end_date=None):
@@ -22,74 +23,26 @@ def get_daily_sales_detail(date_str, country=None, customer_profile=None, start_
     Returns:
         dict con análisis completo del día
     """
-    df = load_online_retail_data()
-
-    if df.is_empty():
-        return None
-
-    # Convertir InvoiceDate a datetime
-    df = df.with_columns([
-        pl.col('InvoiceDate').str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S").alias('InvoiceDate')
-    ])
-
-    # Aplicar filtros generales (país, fechas)
-    if country:
-        df = df.filter(pl.col('Country') == country)
-
-    if start_date:
-        start_datetime = pl.lit(start_date + "-01").str.strptime(pl.Datetime, "%Y-%m-%d")
-        df = df.filter(pl.col('InvoiceDate') >= start_datetime)
-
-    if end_date:
-        import datetime as dt
-        year, month = map(int, end_date.split('-'))
-        if month == 12:
-            next_month = dt.datetime(year + 1, 1, 1)
-        else:
-            next_month = dt.datetime(year, month + 1, 1)
-        last_day = next_month - dt.timedelta(days=1)
-        end_datetime = pl.lit(last_day.strftime("%Y-%m-%d") + " 23:59:59").str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S")
-        df = df.filter(pl.col('InvoiceDate') <= end_datetime)
-
-    # Aplicar filtro de perfil si se especifica
-    if customer_profile:
-        if 'Total' not in df.columns:
-            df = df.with_columns(
-                (pl.col('Quantity') * pl.col('UnitPrice')).alias('Total')
-            )
-
-        total_lower, total_upper = detectar_outliers_iqr(df, 'Total')
-        price_lower, price_upper = detectar_outliers_iqr(df, 'UnitPrice')
-
-        df = df.with_columns(
-            pl.when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') <= price_upper))
-            .then(pl.lit('Mayorista Estándar'))
-            .when((pl.col('Total') <= total_upper) & (pl.col('UnitPrice') > price_upper))
-            .then(pl.lit('Minorista Lujo'))
-            .when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') > price_upper))
-            .then(pl.lit('Mayorista Lujo'))
-            .otherwise(pl.lit('Minorista Estándar'))
-            .alias('Perfil')
-        )
-
-        df = df.filter(pl.col('Perfil') == customer_profile)
-
-    # Calcular Sales si no existe
-    if 'Sales' not in df.columns:
-        df = df.with_columns([
-            (pl.col('Quantity') * pl.col('UnitPrice')).alias('Sales')
-        ])
-
-    # Extraer fecha
-    df = df.with_columns([
-        pl.col('InvoiceDate').dt.date().alias('Fecha')
-    ])
+    # Aplicar filtros generales (país, fechas y perfil)
+    spec = FilterSpec.from_params(
+        country=country,
+        start_date=start_date,
+        end_date=end_date,
+        customer_profile=customer_profile
+    )
 
     # Parsear la fecha seleccionada
     target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
 
-    # Filtrar datos del día seleccionado
-    df_day = df.filter(pl.col('Fecha') == target_date)
+    # Filas del día seleccionado: un slice del DataFrame ordenado por fecha
+    lf = spec.compile(days=(target_date, target_date))
+    if lf is None:
+        return None
+    # Reutilizar la columna Total precalculada en la carga y extraer la fecha
+    df_day = lf.with_columns([
+        pl.col('Total').alias('Sales'),
+        pl.col('InvoiceDate').dt.date().alias('Fecha')
+    ]).collect()
 
     if df_day.is_empty():
         return None
@@ -98,7 +51,8 @@ def get_daily_sales_detail(date_str, country=None, customer_profile=None, start_
     summary = _calculate_day_summary(df_day)
 
     # ===== SECCIÓN 2: ANÁLISIS COMPARATIVO =====
-    comparisons = _calculate_comparisons(df, target_date, df_day)
+    # Las comparaciones se leen del índice diario memorizado para estos filtros
+    comparisons = _calculate_comparisons(get_daily_sales_index(spec), target_date, df_day)
 
     # ===== SECCIÓN 3: TOP 5 PRODUCTOS =====
     top_products = _get_top_products(df_day)
@@ -137,48 +91,37 @@ def _calculate_day_summary(df_day):
     }
 
 
-def _calculate_comparisons(df, target_date, df_day):
-    """Calcula comparaciones con períodos anteriores"""
+def _calculate_comparisons(daily_index, target_date, df_day):
+    """Calcula comparaciones con períodos anteriores a partir del índice de ventas diarias"""
     comparisons = {}
     day_sales = df_day['Sales'].sum()
 
     # 1. Comparación con día anterior
-    previous_date = target_date - timedelta(days=1)
-    df_previous = df.filter(pl.col('Fecha') == previous_date)
-    if not df_previous.is_empty():
-        prev_sales = df_previous['Sales'].sum()
+    prev_sales = daily_index.day_sales(target_date - timedelta(days=1))
+    if prev_sales is not None:
         comparisons['vs_previous_day'] = _calculate_change(day_sales, prev_sales)
     else:
         comparisons['vs_previous_day'] = None
 
-    # 2. Comparación con promedio del mes
-    month_start = target_date.replace(day=1)
-    df_month = df.filter(
-        (pl.col('Fecha') >= month_start) &
-        (pl.col('Fecha') < target_date)
+    # 2. Comparación con promedio del mes (días con ventas antes del día seleccionado)
+    month_daily_avg = daily_index.range_mean(
+        target_date.replace(day=1), target_date - timedelta(days=1)
     )
-    if not df_month.is_empty():
-        month_daily_avg = df_month.group_by('Fecha').agg([
-            pl.col('Sales').sum()
-        ])['Sales'].mean()
+    if month_daily_avg is not None:
         comparisons['vs_month_avg'] = _calculate_change(day_sales, month_daily_avg)
     else:
         comparisons['vs_month_avg'] = None
 
     # 3. Comparación con mismo día semana anterior
-    week_before_date = target_date - timedelta(days=7)
-    df_week_before = df.filter(pl.col('Fecha') == week_before_date)
-    if not df_week_before.is_empty():
-        week_before_sales = df_week_before['Sales'].sum()
+    week_before_sales = daily_index.day_sales(target_date - timedelta(days=7))
+    if week_before_sales is not None:
         comparisons['vs_week_before'] = _calculate_change(day_sales, week_before_sales)
     else:
         comparisons['vs_week_before'] = None
 
     # 4. Comparación con mismo día año anterior
-    year_before_date = target_date.replace(year=target_date.year - 1)
-    df_year_before = df.filter(pl.col('Fecha') == year_before_date)
-    if not df_year_before.is_empty():
-        year_before_sales = df_year_before['Sales'].sum()
+    year_before_sales = daily_index.day_sales(target_date.replace(year=target_date.year - 1))
+    if year_before_sales is not None:
         comparisons['vs_year_before'] = _calculate_change(day_sales, year_before_sales)
     else:
         comparisons['vs_year_before'] = None
@@ -240,26 +183,9 @@ def _get_top_customers(df_day):
     if df_day.is_empty():
         return []
 
-    # Asegurar que tenemos columna Total y Perfil
-    if 'Total' not in df_day.columns:
-        df_day = df_day.with_columns(
-            (pl.col('Quantity') * pl.col('UnitPrice')).alias('Total')
-        )
-
+    # Clasificar las transacciones del día si no vienen ya filtradas por perfil
     if 'Perfil' not in df_day.columns:
-        total_lower, total_upper = detectar_outliers_iqr(df_day, 'Total')
-        price_lower, price_upper = detectar_outliers_iqr(df_day, 'UnitPrice')
-
-        df_day = df_day.with_columns(
-            pl.when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') <= price_upper))
-            .then(pl.lit('Mayorista Estándar'))
-            .when((pl.col('Total') <= total_upper) & (pl.col('UnitPrice') > price_upper))
-            .then(pl.lit('Minorista Lujo'))
-            .when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') > price_upper))
-            .then(pl.lit('Mayorista Lujo'))
-            .otherwise(pl.lit('Minorista Estándar'))
-            .alias('Perfil')
-        )
+        df_day = df_day.with_columns(perfil_expr())
 
     customers = (
         df_day.group_by(['CustomerID', 'Perfil'])
@@ -1,8 +1,45 @@
 """
 Generador de gráfico de tendencia de ventas diarias.
 """
-import plotly.graph_objects as go
 from dashboard.visualizations.sales.data_processor import get_sales_trend_data
+from dashboard.visualizations.shared.figures import empty_figure, make_figure, paper_annotation, title
+
+# Colores para cada año
+COLORES_ANUALES = ['#FF7F0E', '#2CA02C', '#E377C2']
+
+_AXIS_TITLE_FONT = {'size': 11, 'color': '#2c3e50'}
+_TICK_FONT = {'size': 9, 'color': '#2c3e50'}
+
+# Partes fijas del layout; solo cambian el título, el rango Y y el total
+_XAXIS = {
+    'title': {'text': 'Fecha', 'font': _AXIS_TITLE_FONT},
+    'showgrid': True,
+    'gridcolor': 'lightgray',
+    'tickfont': _TICK_FONT,
+    'fixedrange': False,  # Permitir zoom con botones
+}
+_YAXIS = {
+    'title': {'text': 'Ventas (£)', 'font': _AXIS_TITLE_FONT},
+    'showgrid': True,
+    'gridcolor': 'lightgray',
+    'tickfont': _TICK_FONT,
+    'autorange': False,
+    'fixedrange': False,
+}
+_LAYOUT = {
+    'xaxis': _XAXIS,
+    'plot_bgcolor': 'white',
+    'paper_bgcolor': 'rgba(0,0,0,0)',
+    'hovermode': 'x unified',
+    'hoverlabel': {
+        'bgcolor': 'white',
+        'font': {'size': 12, 'family': 'Arial'},
+        'bordercolor': '#cccccc'
+    },
+    'showlegend': False,  # Ocultar la leyenda de años
+    'margin': {'r': 5, 't': 95, 'l': 40, 'b': 50},
+    'dragmode': False,  # Deshabilitar drag para permitir clicks
+}
 
 
 def create_sales_trend_plot(country=None, customer_profile=None, start_date=None, end_date=None):
@@ -16,55 +53,60 @@ def create_sales_trend_plot(country=None, customer_profile=None, start_date=None
         end_date: Fecha de fin en formato YYYY-MM (opcional)
     
     Returns:
-        Figura de Plotly
+        Figura de Plotly (dict)
     """
     data = get_sales_trend_data(country, customer_profile, start_date, end_date)
-    
+    return build_sales_trend_figure(data, country, customer_profile)
+
+
+def build_sales_trend_figure(data, country=None, customer_profile=None):
+    """
+    Arma la figura de tendencia de ventas a partir de los datos de
+    get_sales_trend_data.
+
+    Returns:
+        Figura de Plotly (dict)
+    """
     if not data:
-        return go.Figure()
+        return empty_figure()
     
     years = data['years']
     data_by_year = data['data_by_year']
     
-    # Colores para cada año
-    colores_anuales = ['#FF7F0E', '#2CA02C', '#E377C2']
-    
-    fig = go.Figure()
+    traces = []
     
     # Variables para calcular el rango del eje Y
     all_sales = []
     total_points = 0
-    total_sales_amount = 0  # Total acumulado de ventas
+    # Total de ventas precalculado en el índice diario (suma de la serie)
+    total_sales_amount = data['total_sales']
     
     # Agregar una traza por cada año
     for i, year in enumerate(years):
         year_data = data_by_year[year]
         all_sales.extend(year_data['sales'])
-        total_sales_amount += sum(year_data['sales'])  # Sumar ventas de este año
         total_points += len(year_data['sales'])
+        color = COLORES_ANUALES[i % len(COLORES_ANUALES)]
         
         # Si hay pocos datos, mostrar puntos además de líneas
         mode = 'lines+markers' if total_points < 50 else 'lines'
         
-        fig.add_trace(go.Scatter(
-            x=year_data['dates'],
-            y=year_data['sales'],
-            mode=mode,
-            line=dict(
-                color=colores_anuales[i % len(colores_anuales)],
-                width=2.5
-            ),
-            marker=dict(
-                size=8,
-                color=colores_anuales[i % len(colores_anuales)]
-            ) if 'markers' in mode else None,
-            name=f"{year}",
-            hovertemplate='<b>Año:</b> ' + str(year) + 
-                         '<br><b>Fecha:</b> %{x}' +
-                         '<br><b>Ventas:</b> £%{y:,.2f}' +
-                         '<extra></extra>',
-            visible=True
-        ))
+        trace = {
+            'type': 'scatter',
+            'x': year_data['dates'],
+            'y': year_data['sales'],
+            'mode': mode,
+            'line': {'color': color, 'width': 2.5},
+            'name': f"{year}",
+            'hovertemplate': '<b>Año:</b> ' + str(year) +
+                             '<br><b>Fecha:</b> %{x}' +
+                             '<br><b>Ventas:</b> £%{y:,.2f}' +
+                             '<extra></extra>',
+            'visible': True
+        }
+        if 'markers' in mode:
+            trace['marker'] = {'size': 8, 'color': color}
+        traces.append(trace)
     
     # Calcular rango apropiado para el eje Y
     if all_sales:
@@ -100,69 +142,12 @@ def create_sales_trend_plot(country=None, customer_profile=None, start_date=None
     
     print(f"DEBUG - plot.py: country={country}, profile={customer_profile}, title={title_text}")
     
-    # Configurar el layout
-    fig.update_layout(
-        title={
-            'text': title_text,
-            'x': 0.5,
-            'xanchor': 'center',
-            'font': {
-                'size': 18,
-                'color': '#0824a4',
-                'family': 'Arial, sans-serif'
-            }
-        },
-        xaxis={
-            'title': {
-                'text': 'Fecha',
-                'font': {'size': 11, 'color': '#2c3e50'}
-            },
-            'showgrid': True,
-            'gridcolor': 'lightgray',
-            'tickfont': {'size': 9, 'color': '#2c3e50'}
-        },
-        yaxis={
-            'title': {
-                'text': 'Ventas (£)',
-                'font': {'size': 11, 'color': '#2c3e50'}
-            },
-            'showgrid': True,
-            'gridcolor': 'lightgray',
-            'tickfont': {'size': 9, 'color': '#2c3e50'},
-            'range': [y_min, y_max],  # Rango dinámico basado en los datos
-            'autorange': False
-        },
-        plot_bgcolor='white',
-        paper_bgcolor='rgba(0,0,0,0)',
-        hovermode='x unified',
-        hoverlabel=dict(
-            bgcolor='white',
-            font_size=12,
-            font_family='Arial',
-            bordercolor='#cccccc'
-        ),
-        showlegend=False,  # Ocultar la leyenda de años
-        margin={"r": 5, "t": 95, "l": 40, "b": 50},
-        dragmode=False,  # Deshabilitar drag para permitir clicks
-        xaxis_fixedrange=False,  # Permitir zoom con botones
-        yaxis_fixedrange=False,   # Permitir zoom con botones
-        annotations=[
-            dict(
-                text=f'Total de ventas: £{total_sales_amount:,.2f}',
-                xref='paper',
-                yref='paper',
-                x=0.5,
-                y=1.05,
-                xanchor='center',
-                yanchor='bottom',
-                showarrow=False,
-                font=dict(
-                    size=11,
-                    color='#000000',
-                    family='Arial, sans-serif'
-                )
-            )
+    # Completar la plantilla del layout
+    return make_figure(traces, {
+        **_LAYOUT,
+        'title': title(title_text, 18),
+        'yaxis': {**_YAXIS, 'range': [y_min, y_max]},  # Rango dinámico basado en los datos
+        'annotations': [
+            paper_annotation(f'Total de ventas: £{total_sales_amount:,.2f}', y=1.05)
         ]
-    )
-    
-    return fig
+    })
@@ -0,0 +1,95 @@
+"""
+Índices de bits sobre las dimensiones de baja cardinalidad.
+
+Al cargar el dataset se construye, para cada valor de Country, Category y
+Subcategory, un bitmap empaquetado (`np.packbits`, un bit por fila del
+DataFrame canónico). Una combinación de filtros de igualdad se resuelve con
+AND bit a bit solo sobre los bytes de la ventana de fechas, y las filas
+seleccionadas se extraen de una sola vez, sin pasadas de `filter` por cada
+dimensión ni frames intermedios.
+"""
+import numpy as np
+import polars as pl
+
+# Dimensiones indexadas
+BITMAP_COLUMNS = ['Country', 'Category', 'Subcategory']
+
+
+def build_bitmap_index(df, columns=BITMAP_COLUMNS):
+    """
+    Construye los bitmaps empaquetados de cada valor de las columnas indicadas.
+
+    Returns:
+        dict {columna: {valor: np.ndarray[uint8]}}
+    """
+    index = {}
+    height = df.height
+    for column in columns:
+        rows_by_value = (
+            df.select(pl.col(column).cast(pl.Utf8))
+            .with_row_index('row')
+            .group_by(column)
+            .agg(pl.col('row'))
+        )
+        bitmaps = {}
+        for value, rows in rows_by_value.iter_rows():
+            if value is None:
+                continue
+            mask = np.zeros(height, dtype=bool)
+            mask[rows] = True
+            bitmaps[value] = np.packbits(mask)
+        index[column] = bitmaps
+    return index
+
+
+def pack_mask(mask):
+    """Empaqueta una máscara booleana (Series o array) como bitmap"""
+    if isinstance(mask, pl.Series):
+        mask = mask.fill_null(False).to_numpy()
+    return np.packbits(np.asarray(mask, dtype=bool))
+
+
+def select_rows(bitmap_index, equals, masks, window, height):
+    """
+    Filas que cumplen todos los filtros de igualdad y bitmaps adicionales
+    dentro de una ventana de filas.
+
+    Args:
+        bitmap_index: índice de build_bitmap_index
+        equals: dict {columna: valor} con filtros de igualdad indexados
+        masks: bitmaps empaquetados adicionales (por ejemplo, de perfil)
+        window: tupla (fila_inicial, fila_final_exclusiva), o None para todas
+        height: número de filas del DataFrame canónico
+
+    Returns:
+        np.ndarray con las posiciones de las filas seleccionadas (ordenadas)
+    """
+    start, end = window if window is not None else (0, height)
+    if start >= end:
+        return np.empty(0, dtype=np.int64)
+
+    # Solo se combinan los bytes que cubren la ventana
+    byte_start = start // 8
+    byte_end = (end + 7) // 8
+
+    selected = None
+    bitmaps = []
+    for column, value in equals.items():
+        bitmap = bitmap_index[column].get(value)
+        if bitmap is None:
+            return np.empty(0, dtype=np.int64)
+        bitmaps.append(bitmap)
+    bitmaps.extend(masks)
+    if not bitmaps:
+        return np.arange(start, end, dtype=np.int64)
+
+    for bitmap in bitmaps:
+        chunk = bitmap[byte_start:byte_end]
+        if selected is None:
+            selected = chunk.copy()
+        else:
+            np.bitwise_and(selected, chunk, out=selected)
+
+    bits = np.unpackbits(selected)
+    offset = byte_start * 8
+    return np.flatnonzero(bits[start - offset:end - offset]) + start
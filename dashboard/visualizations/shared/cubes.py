@@ -0,0 +1,96 @@
+"""
+Cubos diarios preagregados de ventas.
+
+Las tendencias de ventas y el Top 5 de productos producen resultados pequeños
+(sumas diarias y cinco productos) a partir de todas las transacciones. Para
+evitar recorrerlas en cada petición se materializan dos cubos con la suma de
+ventas (Total) y cantidad:
+
+- 'daily': día × país × categoría × subcategoría
+- 'products': día × país × categoría × subcategoría × producto (Description)
+
+Los cubos se guardan como Arrow IPC junto al snapshot del dataset, con la
+misma huella de contenido, de modo que se reconstruyen solo cuando cambia la
+versión del dataset y los workers los mapean en memoria sin copiarlos. Las
+consultas filtradas por perfil de cliente no se pueden responder desde los
+cubos (la clasificación es por transacción) y usan los datos originales.
+"""
+import sys
+from pathlib import Path
+
+import polars as pl
+
+from .snapshot import SNAPSHOT_FORMAT, build_lock, open_snapshot, write_snapshot
+
+CUBE_DAILY = 'daily'
+CUBE_PRODUCTS = 'products'
+
+CUBE_DIMENSIONS = {
+    CUBE_DAILY: ['Fecha', 'Country', 'Category', 'Subcategory'],
+    CUBE_PRODUCTS: ['Fecha', 'Country', 'Category', 'Subcategory', 'Description'],
+}
+
+
+def cube_path(cache_dir, fingerprint, name):
+    """Ruta del cubo `name` para una huella de contenido"""
+    return Path(cache_dir) / f'retail-{fingerprint[:16]}-v{SNAPSHOT_FORMAT}.cube-{name}.arrow'
+
+
+def build_cube(df, name):
+    """Agrega el DataFrame canónico al grano del cubo, ordenado por día"""
+    return (
+        df.lazy()
+        .with_columns(pl.col('InvoiceDate').dt.date().alias('Fecha'))
+        .group_by(CUBE_DIMENSIONS[name])
+        .agg([
+            pl.col('Total').sum().alias('Sales'),
+            pl.col('Quantity').cast(pl.Int64).sum().alias('Quantity'),
+        ])
+        .sort('Fecha', nulls_last=True, maintain_order=True)
+        .collect()
+    )
+
+
+def ensure_cubes(df, cache_dir, fingerprint):
+    """
+    Abre los cubos de esta versión del dataset, construyéndolos si no existen,
+    y elimina los de versiones anteriores.
+
+    Returns:
+        dict {nombre: DataFrame mapeado en memoria}
+    """
+    cache_dir = Path(cache_dir)
+    paths = {name: cube_path(cache_dir, fingerprint, name) for name in CUBE_DIMENSIONS}
+
+    if not all(path.exists() for path in paths.values()):
+        with build_lock(cache_dir):
+            for name, path in paths.items():
+                if not path.exists():
+                    print(f"Construyendo cubo de ventas: {path.name}", file=sys.stderr)
+                    write_snapshot(build_cube(df, name), path)
+
+            # Eliminar cubos de otras versiones del dataset
+            current = {path.name for path in paths.values()}
+            for old_path in cache_dir.glob('retail-*.cube-*.arrow'):
+                if old_path.name not in current:
+                    try:
+                        old_path.unlink()
+                    except OSError:
+                        pass
+
+    # El orden por día no se conserva en Arrow IPC: se vuelve a marcar
+    return {
+        name: open_snapshot(path).with_columns(pl.col('Fecha').set_sorted())
+        for name, path in paths.items()
+    }
+
+
+def slice_days(cube, first_day=None, last_day=None):
+    """Filas del cubo entre dos días (incluidos) por búsqueda binaria"""
+    start = 0
+    end = cube.height
+    if first_day is not None:
+        start = int(cube['Fecha'].search_sorted(first_day, side='left'))
+    if last_day is not None:
+        end = int(cube['Fecha'].search_sorted(last_day, side='right'))
+    return cube.slice(start, max(0, end - start))
@@ -0,0 +1,142 @@
+"""
+Índice de sumas acumuladas de las ventas diarias.
+
+Para cada clave de filtro (país, ventana de meses, perfil, ...) se guarda la
+serie densa de ventas por día entre el primer y el último día con ventas,
+junto con sus sumas acumuladas y el número acumulado de días con ventas. Así
+el total de cualquier rango de días, su promedio diario o una comparación con
+otro período son dos restas, sin volver a recorrer transacciones.
+
+La serie se obtiene del cubo diario (ver cubes.py) cuando la consulta no
+filtra por perfil, y de las transacciones en caso contrario. Los índices se
+memorizan por clave de filtro y versión del dataset en una caché LRU
+(DASHBOARD_DAILY_INDEX_CACHE_SIZE).
+"""
+import numpy as np
+import polars as pl
+
+from dashboard.visualizations.shared.data_loader import get_dataset_version
+from dashboard.visualizations.shared.cubes import CUBE_DAILY
+from dashboard.visualizations.shared.lru import LRUCache
+
+DEFAULT_CACHE_SIZE = 64
+
+
+class DailySalesIndex:
+    """
+    Serie diaria densa de ventas con sumas acumuladas.
+
+    Attributes:
+        daily: DataFrame (Fecha, Sales) con los días que tienen ventas, ordenado
+        first_day: primer día de la serie densa (None si está vacía)
+    """
+
+    def __init__(self, daily):
+        self.daily = daily
+        self.first_day = daily['Fecha'][0] if daily.height else None
+
+        length = (daily['Fecha'][-1] - self.first_day).days + 1 if daily.height else 0
+        sales = np.zeros(length, dtype=np.float64)
+        has_sales = np.zeros(length, dtype=np.int64)
+        if daily.height:
+            positions = (daily['Fecha'] - self.first_day).dt.total_days().to_numpy()
+            sales[positions] = daily['Sales'].to_numpy()
+            has_sales[positions] = 1
+
+        self.sales = sales
+        self.has_sales = has_sales
+        # Sumas acumuladas con un cero inicial: el rango [i, j) es cum[j] - cum[i]
+        self.cum_sales = np.concatenate([[0.0], np.cumsum(sales)])
+        self.cum_days = np.concatenate([[0], np.cumsum(has_sales)])
+
+    def _bounds(self, first_day, last_day):
+        """Posiciones [inicio, fin) de los días first_day..last_day dentro de la serie"""
+        length = len(self.sales)
+        if self.first_day is None:
+            return 0, 0
+        start = (first_day - self.first_day).days if first_day is not None else 0
+        end = (last_day - self.first_day).days + 1 if last_day is not None else length
+        start = min(max(start, 0), length)
+        end = min(max(end, 0), length)
+        return start, max(start, end)
+
+    def day_sales(self, day):
+        """Ventas de un día, o None si ese día no tuvo ventas"""
+        start, end = self._bounds(day, day)
+        if end == start or not self.has_sales[start]:
+            return None
+        return float(self.sales[start])
+
+    def range_total(self, first_day=None, last_day=None):
+        """Ventas totales de los días first_day..last_day (incluidos)"""
+        start, end = self._bounds(first_day, last_day)
+        return float(self.cum_sales[end] - self.cum_sales[start])
+
+    def range_days(self, first_day=None, last_day=None):
+        """Número de días con ventas entre first_day y last_day (incluidos)"""
+        start, end = self._bounds(first_day, last_day)
+        return int(self.cum_days[end] - self.cum_days[start])
+
+    def range_mean(self, first_day=None, last_day=None):
+        """Promedio diario de ventas (sobre los días con ventas), o None si no hay días"""
+        days = self.range_days(first_day, last_day)
+        if days == 0:
+            return None
+        return self.range_total(first_day, last_day) / days
+
+    def total(self):
+        """Ventas totales de la serie"""
+        return float(self.cum_sales[-1])
+
+
+def _daily_sales(spec):
+    """Ventas por día de una consulta, desde el cubo diario o las transacciones"""
+    lf = spec.compile_cube(CUBE_DAILY)
+    if lf is None:
+        lf = spec.compile(['InvoiceDate', 'Total'])
+        if lf is None:
+            return None
+        lf = lf.select([
+            pl.col('InvoiceDate').dt.date().alias('Fecha'),
+            pl.col('Total').alias('Sales')
+        ])
+
+    return (
+        lf.filter(pl.col('Fecha').is_not_null())
+        .group_by('Fecha')
+        .agg(pl.col('Sales').sum())
+        .sort('Fecha')
+        .collect()
+    )
+
+
+_cache = LRUCache('DASHBOARD_DAILY_INDEX_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+
+
+def get_daily_sales_index(spec):
+    """
+    Obtiene (o construye y memoriza) el índice de ventas diarias de una consulta.
+
+    Args:
+        spec: FilterSpec de la consulta
+
+    Returns:
+        DailySalesIndex, o None si el dataset no está disponible
+    """
+    key = (get_dataset_version(), spec.key)
+    index = _cache.get(key)
+    if index is not None:
+        return index
+
+    daily = _daily_sales(spec)
+    if daily is None:
+        return None
+
+    index = DailySalesIndex(daily)
+    _cache.put(key, index)
+    return index
+
+
+def get_daily_index_cache_stats():
+    """Estadísticas de la caché de índices diarios (aciertos, fallos, entradas)"""
+    return _cache.stats()
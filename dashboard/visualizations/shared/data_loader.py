@@ -1,24 +1,502 @@
 import polars as pl
-import functools
+import datetime
+import io
+import os
 import sys
+import threading
+import time
+from pathlib import Path
+from .snapshot import load_with_snapshot, attach_snapshot, is_url
+from .partitioned import ensure_partitioned
+from .quantiles import build_quantile_index, describe_quantile_index
+from .time_index import sort_by_time, build_month_index
+from .bitmaps import build_bitmap_index
+from .cubes import ensure_cubes
+from .heavy_hitters import build_top_products_index
+from .index_files import ensure_indexes
 
-# URL del dataset
+# URL por defecto del dataset (se puede cambiar con DASHBOARD_DATA_SOURCE)
 DATASET_URL = "https://raw.githubusercontent.com/iamrodrigodev/online-retail/main/dataset/retail_with_categories.csv"
 
-@functools.lru_cache(maxsize=None)
+# Nombre del archivo que se busca cuando el origen es un directorio
+DATASET_FILENAME = "retail_with_categories.csv"
+
+# Directorio por defecto para los snapshots locales (Arrow IPC) del dataset
+DEFAULT_CACHE_DIR = str(Path(__file__).resolve().parents[3] / '.data_cache')
+
+# Columnas que se leen como texto para evitar errores de inferencia
+# (facturas canceladas 'C536379', códigos '85123A', IDs '17850.0')
+CSV_SCHEMA_OVERRIDES = {
+    'InvoiceNo': pl.Utf8,
+    'StockCode': pl.Utf8,
+    'CustomerID': pl.Utf8,
+    'InvoiceDate': pl.Utf8,
+}
+
+# Columnas de baja cardinalidad que se guardan como categóricas
+CATEGORICAL_COLUMNS = ['Country', 'Category', 'Subcategory', 'Description']
+
+
+def get_setting(name, default):
+    """Lee un ajuste de Django si está configurado; si no, de las variables de entorno"""
+    try:
+        from django.conf import settings
+        if settings.configured:
+            return getattr(settings, name, default)
+    except ImportError:
+        pass
+    return os.environ.get(name, default)
+
+
+def get_data_source():
+    """
+    Devuelve el origen configurado del dataset (DASHBOARD_DATA_SOURCE).
+    Puede ser una URL, un archivo CSV local o un directorio que contenga
+    `retail_with_categories.csv` (o, en su defecto, un único CSV).
+    """
+    source = str(get_setting('DASHBOARD_DATA_SOURCE', DATASET_URL))
+    if is_url(source):
+        return source
+
+    path = Path(source).expanduser()
+    if path.is_dir():
+        candidate = path / DATASET_FILENAME
+        if candidate.exists():
+            return str(candidate)
+        csv_files = sorted(path.glob('*.csv'))
+        if not csv_files:
+            raise FileNotFoundError(f"No se encontró ningún CSV en el directorio {path}")
+        return str(csv_files[0])
+    return str(path)
+
+
+def get_cache_dir():
+    """Directorio de snapshots locales (DASHBOARD_DATA_CACHE_DIR)"""
+    return get_setting('DASHBOARD_DATA_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+
+def is_shared_mode():
+    """
+    Indica si el dataset se comparte entre procesos (DASHBOARD_DATA_SHARED).
+    En ese modo los workers mapean el snapshot que materializó el proceso
+    maestro en lugar de validar o cargar el origen por su cuenta.
+    """
+    value = get_setting('DASHBOARD_DATA_SHARED', False)
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+# Almacenes disponibles para las consultas (DASHBOARD_DATA_STORE)
+STORE_MEMORY = 'memory'
+STORE_PARTITIONED = 'partitioned'
+
+
+def get_data_store():
+    """
+    Almacén sobre el que se ejecutan las consultas (DASHBOARD_DATA_STORE):
+    - 'memory': el DataFrame canónico mapeado en memoria (por defecto)
+    - 'partitioned': Parquet particionado por mes y país, con poda de particiones
+    """
+    store = str(get_setting('DASHBOARD_DATA_STORE', STORE_MEMORY)).lower()
+    return STORE_PARTITIONED if store == STORE_PARTITIONED else STORE_MEMORY
+
+
+def _build_partitioned_store(df, fingerprint):
+    """
+    Construye el almacén particionado si está configurado. Un fallo aquí no
+    invalida la carga: las consultas siguen usando el DataFrame en memoria.
+
+    Returns:
+        Path del almacén particionado, o None
+    """
+    if get_data_store() != STORE_PARTITIONED:
+        return None
+    try:
+        return ensure_partitioned(df, get_cache_dir(), fingerprint)
+    except Exception as e:
+        print(f"No se pudo construir el almacén particionado: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+
+
+# Modos de cálculo de los cuantiles de perfil (DASHBOARD_QUANTILE_MODE)
+QUANTILE_MODE_EXACT = 'exact'
+QUANTILE_MODE_APPROXIMATE = 'approximate'
+
+
+def get_quantile_settings():
+    """
+    Configuración de los resúmenes de cuantiles:
+    - mode: 'exact' (solo se usan resúmenes exactos; si no, se recorre la
+      columna) o 'approximate' (se aceptan resúmenes comprimidos)
+    - epsilon: error de rango relativo de los resúmenes comprimidos
+    - exact_limit: valores distintos por resumen a partir de los cuales se comprime
+    """
+    mode = str(get_setting('DASHBOARD_QUANTILE_MODE', QUANTILE_MODE_EXACT)).lower()
+    return {
+        'mode': QUANTILE_MODE_APPROXIMATE if mode == QUANTILE_MODE_APPROXIMATE else QUANTILE_MODE_EXACT,
+        'epsilon': float(get_setting('DASHBOARD_QUANTILE_EPSILON', 0.001)),
+        'exact_limit': int(get_setting('DASHBOARD_QUANTILE_EXACT_LIMIT', 65536)),
+    }
+
+
+def _build_quantile_index(df):
+    """
+    Construye los resúmenes de cuantiles por (país, mes). Un fallo aquí no
+    invalida la carga: los umbrales se calculan recorriendo la columna.
+    """
+    settings = get_quantile_settings()
+    try:
+        start = time.perf_counter()
+        index = build_quantile_index(df, settings['epsilon'], settings['exact_limit'])
+        elapsed = time.perf_counter() - start
+        print(f"Resúmenes de cuantiles construidos en {elapsed:.2f}s", file=sys.stderr)
+        return index
+    except Exception as e:
+        print(f"No se pudieron construir los resúmenes de cuantiles: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+
+
+def _build_cubes(df, fingerprint):
+    """
+    Abre (o construye) los cubos diarios de ventas de esta versión del
+    dataset. Un fallo aquí no invalida la carga: los endpoints agregan los
+    datos originales.
+
+    Returns:
+        dict {nombre: DataFrame} con los cubos, o None
+    """
+    try:
+        return ensure_cubes(df, get_cache_dir(), fingerprint)
+    except Exception as e:
+        print(f"No se pudieron construir los cubos de ventas: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+
+
+def get_top_products_summary_size():
+    """Productos guardados por partición en los resúmenes (DASHBOARD_TOP_PRODUCTS_SUMMARY_SIZE)"""
+    return max(1, int(get_setting('DASHBOARD_TOP_PRODUCTS_SUMMARY_SIZE', 64)))
+
+
+def _build_top_products_index(df):
+    """
+    Construye los resúmenes de productos más vendidos por partición
+    (DASHBOARD_TOP_PRODUCTS_SUMMARY_SIZE productos por partición). Un fallo
+    aquí no invalida la carga: el Top 5 agrega todos los productos.
+    """
+    size = get_top_products_summary_size()
+    try:
+        start = time.perf_counter()
+        index = build_top_products_index(df, size)
+        elapsed = time.perf_counter() - start
+        print(f"Resúmenes de productos más vendidos construidos en {elapsed:.2f}s", file=sys.stderr)
+        return index
+    except Exception as e:
+        print(f"No se pudieron construir los resúmenes de productos: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+
+
+def _build_indexes(df, fingerprint):
+    """
+    Abre (o construye) los índices de esta versión del dataset guardados
+    junto al snapshot (ver index_files.py), para que los workers los mapeen
+    en memoria en lugar de construir cada uno su copia privada. Si no se
+    pueden guardar o abrir, se construyen en memoria.
+
+    Returns:
+        dict con month_index, bitmap_index, quantile_index y top_products_index
+    """
+    settings = get_quantile_settings()
+    try:
+        start = time.perf_counter()
+        indexes = ensure_indexes(
+            df, get_cache_dir(), fingerprint,
+            settings['epsilon'], settings['exact_limit'], get_top_products_summary_size()
+        )
+        elapsed = time.perf_counter() - start
+        print(f"Índices del dataset listos en {elapsed:.2f}s", file=sys.stderr)
+        return indexes
+    except Exception as e:
+        print(f"No se pudieron guardar los índices del dataset, se construyen en memoria: {type(e).__name__}: {e}", file=sys.stderr)
+    return {
+        'month_index': build_month_index(df),
+        'bitmap_index': build_bitmap_index(df),
+        'quantile_index': _build_quantile_index(df),
+        'top_products_index': _build_top_products_index(df),
+    }
+
+
+def to_canonical(df):
+    """
+    Convierte el DataFrame crudo al esquema canónico tipado:
+    - InvoiceDate como Datetime nativo (no se vuelve a parsear por petición)
+    - Country, Category, Subcategory y Description como Categorical
+    - CustomerID entero, Quantity Int32
+    - Columna Total (Quantity * UnitPrice) precalculada
+    - Filas ordenadas por InvoiceDate (ver time_index.py)
+    """
+    df = df.with_columns([
+        pl.col('InvoiceDate').str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S"),
+        pl.col('CustomerID').cast(pl.Float64).cast(pl.Int32),
+        pl.col('Quantity').cast(pl.Int32),
+        pl.col('UnitPrice').cast(pl.Float64),
+        *[pl.col(name).cast(pl.Categorical) for name in CATEGORICAL_COLUMNS],
+    ]).with_columns(
+        (pl.col('Quantity') * pl.col('UnitPrice')).alias('Total')
+    )
+    return sort_by_time(df)
+
+
+def parse_csv(raw):
+    """Parsea los bytes del CSV de origen al DataFrame canónico"""
+    df = pl.read_csv(io.BytesIO(raw), schema_overrides=CSV_SCHEMA_OVERRIDES)
+    return to_canonical(df)
+
+
+# Estados de carga del dataset
+STATUS_IDLE = 'idle'
+STATUS_LOADING = 'loading'
+STATUS_READY = 'ready'
+STATUS_FAILED = 'failed'
+
+
+class _DatasetState:
+    """
+    Estado compartido de la carga del dataset en el proceso.
+
+    Garantiza una sola carga simultánea (single-flight): el primer hilo que
+    encuentra el dataset sin cargar lo carga y el resto espera su resultado.
+    Los fallos no se cachean: la siguiente llamada vuelve a intentarlo.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.status = STATUS_IDLE
+        self.generation = 0
+        self.df = None
+        self.fingerprint = None
+        self.partitioned_path = None
+        self.quantile_index = None
+        self.month_index = None
+        self.bitmap_index = None
+        self.cubes = None
+        self.top_products_index = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.attempts = 0
+        self.last_error = None
+
+
+_state = _DatasetState()
+
+
+def _load_with_retries():
+    """
+    Carga el dataset con reintentos acotados y backoff exponencial.
+
+    Returns:
+        tuple: (DataFrame, fingerprint); lanza la última excepción si se
+        agotan los reintentos
+    """
+    max_attempts = max(1, int(get_setting('DASHBOARD_DATA_LOAD_ATTEMPTS', 3)))
+    backoff = float(get_setting('DASHBOARD_DATA_RETRY_BACKOFF', 1.0))
+
+    for attempt in range(1, max_attempts + 1):
+        _state.attempts = attempt
+        try:
+            source = get_data_source()
+            if is_shared_mode():
+                # Mapear el snapshot ya materializado por el proceso maestro
+                attached = attach_snapshot(source, get_cache_dir())
+                if attached is not None:
+                    return attached
+            print(f"Intentando cargar dataset desde: {source} (intento {attempt}/{max_attempts})", file=sys.stderr)
+            df, fingerprint = load_with_snapshot(source, parse_csv, get_cache_dir())
+            return df, fingerprint
+        except Exception as e:
+            print(f"ERROR al cargar el dataset: {type(e).__name__}: {e}", file=sys.stderr)
+            if attempt == max_attempts:
+                import traceback
+                traceback.print_exc(file=sys.stderr)
+                raise
+            delay = backoff * (2 ** (attempt - 1))
+            print(f"Reintentando en {delay:.1f}s...", file=sys.stderr)
+            time.sleep(delay)
+
+
 def load_online_retail_data():
     """
-    Carga el dataset de online retail desde la URL de GitHub.
-    Utiliza un caché para evitar descargas repetidas.
+    Carga el dataset de online retail desde el origen configurado.
+    Utiliza un caché para evitar descargas repetidas: en memoria por proceso
+    y en disco mediante un snapshot Arrow IPC mapeado en memoria, que solo se
+    reconstruye cuando cambia el contenido del origen.
+
+    La carga es única por proceso aunque varios hilos la pidan a la vez. Si
+    falla, se retorna un DataFrame vacío y el fallo no se guarda: la siguiente
+    llamada vuelve a intentar la carga.
     """
+    with _state.condition:
+        if _state.status == STATUS_READY:
+            return _state.df
+
+        if _state.status == STATUS_LOADING:
+            # Otro hilo ya está cargando: esperar su resultado
+            generation = _state.generation
+            while _state.status == STATUS_LOADING and _state.generation == generation:
+                _state.condition.wait()
+            if _state.status == STATUS_READY:
+                return _state.df
+            return pl.DataFrame()
+
+        _state.status = STATUS_LOADING
+        _state.generation += 1
+
+    start = time.perf_counter()
     try:
-        print(f"Intentando cargar dataset desde: {DATASET_URL}", file=sys.stderr)
-        # Especificar el tipo de dato para la columna 'CustomerID' para evitar errores de inferencia
-        df = pl.read_csv(DATASET_URL, dtypes={'CustomerID': pl.Utf8})
-        print(f"Dataset cargado exitosamente: {df.height} filas, {df.width} columnas", file=sys.stderr)
-        return df
+        df, fingerprint = _load_with_retries()
     except Exception as e:
-        print(f"ERROR al cargar el dataset: {type(e).__name__}: {e}", file=sys.stderr)
-        import traceback
-        traceback.print_exc(file=sys.stderr)
+        with _state.condition:
+            _state.status = STATUS_FAILED
+            _state.last_error = f"{type(e).__name__}: {e}"
+            _state.condition.notify_all()
         return pl.DataFrame() # Retorna un DataFrame vacío en caso de error
+
+    # El snapshot ya está ordenado por InvoiceDate; el indicador de orden no se
+    # conserva en Arrow IPC, así que se vuelve a marcar (sin copiar datos)
+    df = df.with_columns(pl.col('InvoiceDate').set_sorted())
+    indexes = _build_indexes(df, fingerprint)
+
+    partitioned_path = _build_partitioned_store(df, fingerprint)
+    cubes = _build_cubes(df, fingerprint)
+
+    elapsed = time.perf_counter() - start
+    print(f"Dataset cargado exitosamente: {df.height} filas, {df.width} columnas (versión {fingerprint[:12]})", file=sys.stderr)
+
+    with _state.condition:
+        _state.df = df
+        _state.fingerprint = fingerprint
+        _state.partitioned_path = partitioned_path
+        _state.quantile_index = indexes['quantile_index']
+        _state.month_index = indexes['month_index']
+        _state.bitmap_index = indexes['bitmap_index']
+        _state.cubes = cubes
+        _state.top_products_index = indexes['top_products_index']
+        _state.load_seconds = elapsed
+        _state.loaded_at = datetime.datetime.now(datetime.timezone.utc)
+        _state.last_error = None
+        _state.status = STATUS_READY
+        _state.condition.notify_all()
+    return df
+
+
+def ensure_loading():
+    """Inicia la carga en segundo plano si el dataset no está cargado ni cargándose"""
+    with _state.condition:
+        if _state.status in (STATUS_READY, STATUS_LOADING):
+            return
+    threading.Thread(target=load_online_retail_data, name='dataset-loader', daemon=True).start()
+
+
+def get_dataset_version():
+    """Versión (huella de contenido) del dataset cargado, o None si no está listo"""
+    return _state.fingerprint if _state.status == STATUS_READY else None
+
+
+def get_partitioned_store():
+    """Directorio del almacén particionado del dataset cargado, o None si no se usa"""
+    return _state.partitioned_path if _state.status == STATUS_READY else None
+
+
+def get_month_index():
+    """Índice mes → filas del DataFrame canónico cargado, o None"""
+    return _state.month_index if _state.status == STATUS_READY else None
+
+
+def get_bitmap_index():
+    """Bitmaps por valor de Country, Category y Subcategory del dataset cargado, o None"""
+    return _state.bitmap_index if _state.status == STATUS_READY else None
+
+
+def get_quantile_index():
+    """Resúmenes de cuantiles por (país, mes) del dataset cargado, o None"""
+    return _state.quantile_index if _state.status == STATUS_READY else None
+
+
+def get_sales_cube(name):
+    """Cubo diario de ventas `name` del dataset cargado (ver cubes.py), o None"""
+    if _state.status != STATUS_READY or _state.cubes is None:
+        return None
+    return _state.cubes.get(name)
+
+
+def get_top_products_index():
+    """Resúmenes de productos más vendidos por partición del dataset cargado, o None"""
+    return _state.top_products_index if _state.status == STATUS_READY else None
+
+
+def get_dataset_status():
+    """
+    Estado de la carga del dataset para los endpoints de salud.
+
+    Returns:
+        dict con estado, filas, tiempo de carga, versión y último error
+    """
+    with _state.condition:
+        ready = _state.status == STATUS_READY
+        return {
+            'status': _state.status,
+            'ready': ready,
+            'rows': _state.df.height if ready else 0,
+            'load_seconds': round(_state.load_seconds, 3) if _state.load_seconds is not None else None,
+            'loaded_at': _state.loaded_at.isoformat() if _state.loaded_at else None,
+            'dataset_version': _state.fingerprint,
+            'store': STORE_PARTITIONED if ready and _state.partitioned_path else STORE_MEMORY,
+            'quantiles': _describe_quantiles() if ready else None,
+            'cubes': {name: cube.height for name, cube in _state.cubes.items()} if ready and _state.cubes else None,
+            'attempts': _state.attempts,
+            'error': _state.last_error,
+        }
+
+
+def _describe_quantiles():
+    """Configuración y precisión de los resúmenes de cuantiles (para /healthz)"""
+    description = get_quantile_settings()
+    if _state.quantile_index is not None:
+        description.update(describe_quantile_index(_state.quantile_index))
+    return description
+
+
+def warm_up():
+    """
+    Carga el dataset de forma anticipada (al arrancar el proceso) para que
+    ninguna petición de usuario pague el costo de la ingesta.
+    """
+    start = time.perf_counter()
+    df = load_online_retail_data()
+    elapsed = time.perf_counter() - start
+    print(f"Warm-up del dataset completado en {elapsed:.2f}s ({df.height} filas)", file=sys.stderr)
+    return df
+
+
+def materialize_shared_dataset():
+    """
+    Materializa el snapshot canónico en disco sin retener el DataFrame.
+
+    Pensado para el proceso maestro de Gunicorn (hook `on_starting`): deja el
+    archivo Arrow, el almacén particionado, los cubos y los índices listos
+    para que cada worker los mapee en memoria sin copiarlos, y el maestro no
+    conserva ninguna copia del dataset.
+
+    Returns:
+        str con la versión (huella de contenido) del dataset materializado
+    """
+    start = time.perf_counter()
+    df, fingerprint = load_with_snapshot(get_data_source(), parse_csv, get_cache_dir())
+    _build_partitioned_store(df, fingerprint)
+    _build_cubes(df, fingerprint)
+    _build_indexes(df, fingerprint)
+    rows = df.height
+    del df
+    elapsed = time.perf_counter() - start
+    print(f"Snapshot compartido listo en {elapsed:.2f}s ({rows} filas, versión {fingerprint[:12]})", file=sys.stderr)
+    return fingerprint
@@ -0,0 +1,83 @@
+"""
+Construcción ligera de figuras de Plotly como dicts.
+
+Las figuras del dashboard tienen un layout fijo en el que solo cambian los
+datos, el título y algún rango; construirlas con plotly.graph_objects hace
+pasar cada traza y cada actualización del layout por los validadores de
+propiedades, lo que cuesta milisegundos por petición sin aportar nada. Aquí
+las figuras se arman directamente en la forma que produce
+`go.Figure.to_plotly_json()` (propiedades anidadas, sin atajos como
+`font_size`), a partir de plantillas de layout precalculadas que solo se
+completan con los datos.
+
+Las plantillas de este módulo y de cada gráfico se comparten entre figuras:
+no deben modificarse, solo copiarse al sobreescribir una clave
+(`{**PLANTILLA, 'text': ...}`).
+"""
+import threading
+
+_template = None
+_template_lock = threading.Lock()
+
+# Fuente de los títulos y anotaciones del dashboard
+ARIAL = 'Arial, sans-serif'
+
+
+def plotly_template():
+    """
+    Template por defecto de Plotly tal como lo incluye go.Figure() en su
+    layout. Se calcula una sola vez por proceso.
+    """
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                import plotly.graph_objects as go
+                _template = go.Figure().to_plotly_json()['layout']['template']
+    return _template
+
+
+def make_figure(data=(), layout=None):
+    """
+    Figura como dict, equivalente a go.Figure(data, layout).to_plotly_json().
+
+    Args:
+        data: lista de trazas (dicts con su 'type')
+        layout: dict del layout, sin el template
+
+    Returns:
+        dict con 'data' y 'layout'
+    """
+    layout = dict(layout) if layout else {}
+    layout['template'] = plotly_template()
+    return {'data': list(data), 'layout': layout}
+
+
+def empty_figure():
+    """Equivalente de go.Figure() vacía"""
+    return make_figure()
+
+
+def title(text, size, color='#0824a4'):
+    """Título centrado del dashboard"""
+    return {
+        'text': text,
+        'x': 0.5,
+        'xanchor': 'center',
+        'font': {'size': size, 'color': color, 'family': ARIAL},
+    }
+
+
+def paper_annotation(text, y, yanchor='bottom', size=11, color='#000000'):
+    """Anotación centrada en coordenadas del papel (subtítulos y totales)"""
+    return {
+        'text': text,
+        'xref': 'paper',
+        'yref': 'paper',
+        'x': 0.5,
+        'y': y,
+        'xanchor': 'center',
+        'yanchor': yanchor,
+        'showarrow': False,
+        'font': {'size': size, 'color': color, 'family': ARIAL},
+    }
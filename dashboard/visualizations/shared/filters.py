@@ -0,0 +1,249 @@
+"""
+Motor único de filtros de los endpoints.
+
+Todos los endpoints describen su consulta con un `FilterSpec` (país, ventana
+de meses, perfil de cliente, categoría, subcategoría, clientes) y obtienen el
+plan lazy con `spec.compile()`. La especificación se normaliza al crearla, de
+modo que dos peticiones equivalentes producen la misma clave (`spec.key`),
+que es la que usan los cachés e índices.
+
+Los umbrales de perfil se calculan, como en los endpoints originales, sobre
+las filas filtradas por fechas, país, clientes y transacciones válidas (antes
+de categoría y subcategoría), y se memorizan por `classification_key` en
+shared/profiles.py. Con la clasificación fijada, todos los filtros conmutan:
+la ventana de fechas se resuelve como un slice del DataFrame ordenado, y país,
+categoría, subcategoría y perfil como un AND de bitmaps (ver bitmaps.py).
+"""
+import re
+from dataclasses import dataclass
+
+import polars as pl
+
+from dashboard.visualizations.shared.query import scan_online_retail_data, scan_sales_cube
+from dashboard.visualizations.shared.profiles import (
+    PERFIL_CODES,
+    PERFIL_CODE_COLUMN,
+    PERFIL_DTYPE,
+    get_profile_classification
+)
+
+_MONTH_PATTERN = re.compile(r'^(\d{4})-(\d{1,2})$')
+
+
+def _normalize_text(value):
+    """Texto sin espacios sobrantes; vacío equivale a sin filtro"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _normalize_month(value):
+    """Normaliza un mes a 'YYYY-MM'; lanza ValueError si el formato es inválido"""
+    value = _normalize_text(value)
+    if value is None:
+        return None
+    match = _MONTH_PATTERN.match(value)
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"Mes inválido '{value}', se esperaba YYYY-MM")
+    return f'{match.group(1)}-{int(match.group(2)):02d}'
+
+
+@dataclass(frozen=True)
+class FilterSpec:
+    """
+    Especificación normalizada e inmutable (hashable) de los filtros de una consulta.
+
+    Attributes:
+        country: país
+        start_date: primer mes 'YYYY-MM'
+        end_date: último mes 'YYYY-MM' (incluido completo)
+        customer_profile: perfil de cliente (clasificación IQR)
+        category: categoría de producto
+        subcategory: subcategoría de producto
+        customer_ids: tupla ordenada de CustomerID enteros
+        valid_only: solo transacciones con cliente, cantidad y total positivos
+    """
+    country: str = None
+    start_date: str = None
+    end_date: str = None
+    customer_profile: str = None
+    category: str = None
+    subcategory: str = None
+    customer_ids: tuple = None
+    valid_only: bool = False
+
+    @classmethod
+    def from_params(cls, country=None, start_date=None, end_date=None, customer_profile=None,
+                    category=None, subcategory=None, customer_ids=None, valid_only=False):
+        """Crea la especificación normalizando los parámetros recibidos por los endpoints"""
+        if customer_ids is not None:
+            customer_ids = tuple(sorted({int(cid) for cid in customer_ids}))
+        return cls(
+            country=_normalize_text(country),
+            start_date=_normalize_month(start_date),
+            end_date=_normalize_month(end_date),
+            customer_profile=_normalize_text(customer_profile),
+            category=_normalize_text(category),
+            subcategory=_normalize_text(subcategory),
+            customer_ids=customer_ids,
+            valid_only=bool(valid_only),
+        )
+
+    @property
+    def key(self):
+        """Clave normalizada y estable de la especificación (para cachés e índices)"""
+        return tuple(
+            (name, value) for name, value in (
+                ('country', self.country),
+                ('start_date', self.start_date),
+                ('end_date', self.end_date),
+                ('customer_profile', self.customer_profile),
+                ('category', self.category),
+                ('subcategory', self.subcategory),
+                ('customer_ids', self.customer_ids),
+                ('valid_only', self.valid_only or None),
+            )
+            if value is not None
+        )
+
+    @property
+    def classification_key(self):
+        """Clave de los filtros que determinan los umbrales de perfil"""
+        return (
+            self.country, self.start_date, self.end_date,
+            self.customer_ids, self.valid_only
+        )
+
+    def base_equals(self):
+        """Filtros de igualdad indexados que determinan los umbrales de perfil"""
+        return {'Country': self.country} if self.country else {}
+
+    def equals(self):
+        """Todos los filtros de igualdad indexados (país, categoría y subcategoría)"""
+        equals = self.base_equals()
+        if self.category:
+            equals['Category'] = self.category
+        if self.subcategory:
+            equals['Subcategory'] = self.subcategory
+        return equals
+
+    def base_predicates(self):
+        """Filtros por fila no indexados (clientes y transacciones válidas)"""
+        predicates = []
+        if self.customer_ids is not None:
+            predicates.append(pl.col('CustomerID').is_in(list(self.customer_ids)))
+        if self.valid_only:
+            predicates.extend([
+                pl.col('CustomerID').is_not_null(),
+                pl.col('Total') > 0,
+                pl.col('Quantity') > 0,
+            ])
+        return predicates
+
+    def scan(self, equals, first_day=None, last_day=None, aligned=None, masks=None):
+        """
+        Escaneo limitado a la ventana de fechas y a los filtros de igualdad
+        indexados, con los filtros no indexados aplicados encima
+        """
+        lf = scan_online_retail_data(
+            country=self.country,
+            start_date=self.start_date,
+            end_date=self.end_date,
+            first_day=first_day,
+            last_day=last_day,
+            aligned=aligned,
+            equals=equals,
+            masks=masks
+        )
+        if lf is None:
+            return None
+
+        predicates = self.base_predicates()
+        if predicates:
+            lf = lf.filter(pl.all_horizontal(predicates))
+        return lf
+
+    def compile(self, columns=None, classify=False, days=None):
+        """
+        Compila la especificación a un plan lazy sobre el dataset canónico.
+
+        Args:
+            columns: columnas del resultado (opcional; por defecto todas)
+            classify: agregar la columna 'Perfil' aunque no se filtre por perfil
+            days: tupla (primer_día, último_día) para limitar el resultado a unos
+                días dentro de la ventana de meses (opcional). Los umbrales de
+                perfil se siguen calculando sobre la ventana completa.
+
+        Returns:
+            pl.LazyFrame filtrado, o None si el dataset no está disponible
+        """
+        first_day, last_day = days if days else (None, None)
+
+        if self.customer_profile or classify:
+            lf = self._classify(first_day, last_day)
+        else:
+            lf = self.scan(self.equals(), first_day, last_day)
+
+        if lf is None:
+            return None
+
+        if columns:
+            if classify and 'Perfil' not in columns:
+                columns = [*columns, 'Perfil']
+            lf = lf.select(columns)
+        return lf
+
+    def compile_cube(self, name):
+        """
+        Compila la especificación a un plan sobre un cubo diario de ventas.
+
+        Los cubos solo agregan por día, país, categoría, subcategoría y
+        producto: las consultas filtradas por perfil, clientes o
+        transacciones válidas necesitan las filas originales.
+
+        Args:
+            name: nombre del cubo (CUBE_DAILY o CUBE_PRODUCTS)
+
+        Returns:
+            pl.LazyFrame sobre el cubo, o None si la especificación no se
+            puede responder desde el cubo o el cubo no está disponible
+        """
+        if self.customer_profile or self.customer_ids is not None or self.valid_only:
+            return None
+        return scan_sales_cube(name, self.start_date, self.end_date, self.equals())
+
+    def _classify(self, first_day, last_day):
+        """
+        Plan con la columna 'Perfil' y el filtro de perfil, usando la
+        clasificación memorizada para los filtros base de esta especificación
+        """
+        base_plan = self.scan(self.base_equals())
+        if base_plan is None:
+            return None
+
+        classification = get_profile_classification(self, base_plan)
+        code = PERFIL_CODES.get(self.customer_profile) if self.customer_profile else None
+
+        if classification.codes is not None:
+            # Códigos ya calculados para todo el DataFrame canónico: se agregan
+            # antes de seleccionar filas para que queden alineados, y el filtro
+            # de perfil es un bitmap más
+            masks = [classification.bitmap(code)] if code is not None else None
+            lf = self.scan(
+                self.equals(), first_day, last_day,
+                aligned=[classification.codes], masks=masks
+            )
+        else:
+            lf = self.scan(self.equals(), first_day, last_day)
+            lf = lf.with_columns(classification.code_expr())
+            if code is not None:
+                lf = lf.filter(pl.col(PERFIL_CODE_COLUMN) == code)
+
+        if self.customer_profile and code is None:
+            # Perfil desconocido: ninguna fila
+            lf = lf.filter(pl.lit(False))
+
+        return lf.with_columns(
+            pl.col(PERFIL_CODE_COLUMN).cast(PERFIL_DTYPE).alias('Perfil')
+        ).drop(PERFIL_CODE_COLUMN)
@@ -0,0 +1,176 @@
+"""
+Resúmenes de productos más vendidos por partición (heavy hitters).
+
+Al cargar el dataset se guarda, para cada partición (mes, país, categoría,
+subcategoría), los `size` productos con más ventas y su suma exacta en la
+partición, junto con una cota residual: la venta del primer producto que
+quedó fuera (o nada si la partición entró completa). Cualquier producto no
+guardado en una partición vendió allí a lo sumo max(0, residual).
+
+Para un Top N sobre un filtro cualquiera se combinan los resúmenes de las
+particiones que intervienen:
+
+1. Cota superior de cada producto = sus sumas guardadas + los residuales de
+   las particiones donde no aparece.
+2. Pasada exacta solo sobre los candidatos con mayor cota superior.
+3. Si el N-ésimo total exacto supera la cota de todo producto no refinado, el
+   resultado es exacto; si no, se recurre a la agregación completa.
+
+Las ventas incluyen devoluciones (importes negativos), por eso las cotas solo
+acotan por arriba y la pasada exacta es necesaria.
+"""
+import polars as pl
+
+PARTITION_COLUMNS = ['year_month', 'Country', 'Category', 'Subcategory']
+
+# Candidatos que se refinan por cada producto pedido
+CANDIDATE_FACTOR = 4
+
+
+class TopProductsIndex:
+    """
+    Resúmenes por partición.
+
+    Attributes:
+        entries: DataFrame (partición, Description, Sales, Residual) con los
+            productos guardados de cada partición y el residual de su partición
+        residuals: DataFrame (partición, Residual) con la cota residual
+            (max(0, residual), 0 si la partición está completa)
+        size: productos guardados por partición
+    """
+
+    def __init__(self, entries, residuals, size):
+        self.entries = entries
+        self.residuals = residuals
+        self.size = size
+
+
+def build_top_products_index(df, size):
+    """
+    Construye los resúmenes de productos más vendidos del DataFrame canónico.
+
+    Args:
+        df: DataFrame canónico
+        size: productos guardados por partición
+
+    Returns:
+        TopProductsIndex
+    """
+    sales = (
+        df.lazy()
+        .group_by([
+            pl.col('InvoiceDate').dt.strftime('%Y-%m').alias('year_month'),
+            pl.col('Country').cast(pl.Utf8),
+            pl.col('Category').cast(pl.Utf8),
+            pl.col('Subcategory').cast(pl.Utf8),
+            pl.col('Description').cast(pl.Utf8),
+        ])
+        .agg(pl.col('Total').sum().alias('Sales'))
+        .with_columns(
+            pl.col('Sales').rank('ordinal', descending=True)
+            .over(PARTITION_COLUMNS).alias('rank')
+        )
+        .filter(pl.col('rank') <= size + 1)
+        .collect()
+    )
+
+    residuals = (
+        sales.filter(pl.col('rank') == size + 1)
+        .select([*PARTITION_COLUMNS, pl.col('Sales').clip(lower_bound=0).alias('Residual')])
+    )
+    entries = (
+        sales.filter(pl.col('rank') <= size)
+        .join(residuals, on=PARTITION_COLUMNS, how='left', nulls_equal=True)
+        .with_columns(pl.col('Residual').fill_null(0.0))
+        .select([*PARTITION_COLUMNS, 'Description', 'Sales', 'Residual'])
+    )
+    return TopProductsIndex(entries, residuals, size)
+
+
+def _partition_filter(start_month=None, end_month=None, equals=None):
+    """Predicado sobre las columnas de partición para una ventana de meses y filtros"""
+    predicates = []
+    if start_month:
+        predicates.append(pl.col('year_month') >= start_month)
+    if end_month:
+        predicates.append(pl.col('year_month') <= end_month)
+    for column, value in (equals or {}).items():
+        predicates.append(pl.col(column) == value)
+    return pl.all_horizontal(predicates) if predicates else pl.lit(True)
+
+
+def _description_filter(descriptions):
+    """Predicado de pertenencia a un conjunto de productos (incluido el nulo)"""
+    values = [d for d in descriptions if d is not None]
+    predicate = pl.col('Description').cast(pl.Utf8).is_in(values)
+    if len(values) < len(descriptions):
+        predicate = predicate | pl.col('Description').is_null()
+    return predicate
+
+
+def top_products(index, lf, n, start_month=None, end_month=None, equals=None):
+    """
+    Top N productos por ventas usando los resúmenes y una pasada exacta sobre
+    los candidatos.
+
+    Args:
+        index: TopProductsIndex
+        lf: LazyFrame (Description, Sales, Quantity) ya filtrado por la consulta,
+            sobre el que se calculan los totales exactos de los candidatos
+        n: número de productos
+        start_month, end_month, equals: filtros de la consulta sobre las
+            columnas de partición (deben ser los mismos aplicados a `lf`)
+
+    Returns:
+        DataFrame (Description, TotalSales, TotalQuantity) ordenado por ventas,
+        o None si las cotas no garantizan el resultado exacto
+    """
+    predicate = _partition_filter(start_month, end_month, equals)
+    residuals = index.residuals.filter(predicate)
+    residual_total = residuals['Residual'].sum()
+
+    bounds = (
+        index.entries.lazy()
+        .filter(predicate)
+        .group_by('Description')
+        .agg([
+            pl.col('Sales').sum().alias('Stored'),
+            pl.col('Residual').sum().alias('Covered'),
+        ])
+        .with_columns(
+            (pl.col('Stored') + residual_total - pl.col('Covered')).alias('UpperBound')
+        )
+        .sort('UpperBound', descending=True)
+        .collect()
+    )
+
+    k = n * CANDIDATE_FACTOR
+    candidates = bounds.head(k)['Description'].to_list()
+    if not candidates:
+        return None
+
+    # Cota de cualquier producto no refinado: los que no aparecen en ningún
+    # resumen solo pueden existir en particiones incompletas y vendieron a lo
+    # sumo la suma de sus residuales
+    unrefined_bounds = []
+    if residuals.height:
+        unrefined_bounds.append(residual_total)
+    if bounds.height > k:
+        unrefined_bounds.append(bounds['UpperBound'][k])
+
+    exact = (
+        lf.filter(_description_filter(candidates))
+        .group_by('Description')
+        .agg([
+            pl.col('Sales').sum().alias('TotalSales'),
+            pl.col('Quantity').sum().alias('TotalQuantity')
+        ])
+        .sort('TotalSales', descending=True)
+        .head(n)
+        .collect()
+    )
+
+    if unrefined_bounds:
+        if exact.height < n or exact['TotalSales'][-1] < max(unrefined_bounds):
+            return None
+    return exact
@@ -0,0 +1,202 @@
+"""
+Índices del dataset guardados junto al snapshot.
+
+Al cargar el dataset cada proceso necesita, además del DataFrame, el índice
+mes → filas (time_index.py), los bitmaps por valor de dimensión (bitmaps.py),
+los resúmenes de cuantiles por (país, mes) (quantiles.py) y los resúmenes de
+productos más vendidos por partición (heavy_hitters.py). Construirlos en cada
+worker cuesta tiempo de arranque y, sobre todo, memoria privada que crece con
+el número de workers.
+
+Igual que los cubos de ventas, se construyen una sola vez por versión del
+dataset (y configuración de los resúmenes) y se guardan en
+`DASHBOARD_DATA_CACHE_DIR`:
+
+- `retail-<huella>-v<formato>.indexes-<ajustes>.json`: índice de meses y
+  la ubicación de cada bitmap y resumen en los arreglos (se escribe el último)
+- `...bitmaps.npy`: un bitmap empaquetado por fila
+- `...quantile-values.npy` / `...quantile-weights.npy`: valores y pesos de
+  todos los resúmenes, concatenados
+- `...top-entries.arrow` / `...top-residuals.arrow`: resúmenes de productos
+
+Los workers abren los arreglos con `mmap_mode='r'` y los DataFrames con
+`memory_map`, de modo que sus páginas se comparten en la caché de páginas del
+sistema operativo. Los índices abiertos son de solo lectura.
+"""
+import hashlib
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from .bitmaps import build_bitmap_index
+from .heavy_hitters import TopProductsIndex, build_top_products_index
+from .quantiles import QuantileSummary, build_quantile_index
+from .snapshot import SNAPSHOT_FORMAT, build_lock, open_snapshot, write_atomic, write_snapshot
+from .time_index import build_month_index
+
+# Versión del formato de los índices: incrementarla invalida los archivos guardados
+INDEX_FORMAT = 1
+
+INDEX_FILES = (
+    'bitmaps.npy',
+    'quantile-values.npy',
+    'quantile-weights.npy',
+    'top-entries.arrow',
+    'top-residuals.arrow',
+)
+
+
+def index_prefix(cache_dir, fingerprint, epsilon, exact_limit, top_size):
+    """Prefijo de las rutas de los índices para una huella y configuración"""
+    settings = hashlib.sha256(
+        repr((INDEX_FORMAT, float(epsilon), int(exact_limit), int(top_size))).encode('utf-8')
+    ).hexdigest()[:12]
+    return Path(cache_dir) / f'retail-{fingerprint[:16]}-v{SNAPSHOT_FORMAT}.indexes-{settings}'
+
+
+def _index_path(prefix, name):
+    return prefix.with_name(f'{prefix.name}.{name}')
+
+
+def _save_array(path, array):
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+    write_atomic(path, write)
+
+
+def _write_indexes(df, prefix, epsilon, exact_limit, top_size):
+    """Construye los índices del DataFrame canónico y los guarda con ese prefijo"""
+    month_index = build_month_index(df)
+
+    bitmap_layout = {}
+    bitmaps = []
+    for column, by_value in build_bitmap_index(df).items():
+        bitmap_layout[column] = {}
+        for value, bitmap in by_value.items():
+            bitmap_layout[column][value] = len(bitmaps)
+            bitmaps.append(bitmap)
+    width = (df.height + 7) // 8
+    _save_array(
+        _index_path(prefix, 'bitmaps.npy'),
+        np.stack(bitmaps) if bitmaps else np.zeros((0, width), dtype=np.uint8)
+    )
+
+    quantile_layout = []
+    values = []
+    weights = []
+    offset = 0
+    for (subset, country), by_month in build_quantile_index(df, epsilon, exact_limit).items():
+        for year_month, by_column in by_month.items():
+            for column, summary in by_column.items():
+                length = len(summary.values)
+                quantile_layout.append(
+                    [subset, country, year_month, column, offset, length, int(summary.rank_error)]
+                )
+                values.append(summary.values)
+                weights.append(summary.weights)
+                offset += length
+    _save_array(
+        _index_path(prefix, 'quantile-values.npy'),
+        np.concatenate(values) if values else np.empty(0, dtype=np.float64)
+    )
+    _save_array(
+        _index_path(prefix, 'quantile-weights.npy'),
+        np.concatenate(weights) if weights else np.empty(0, dtype=np.int64)
+    )
+
+    top_products_index = build_top_products_index(df, top_size)
+    write_snapshot(top_products_index.entries, _index_path(prefix, 'top-entries.arrow'))
+    write_snapshot(top_products_index.residuals, _index_path(prefix, 'top-residuals.arrow'))
+
+    # El archivo de metadatos se escribe el último: su existencia indica que
+    # los demás archivos están completos
+    metadata = {
+        'format': INDEX_FORMAT,
+        'rows': df.height,
+        'month_index': month_index,
+        'bitmaps': bitmap_layout,
+        'quantiles': quantile_layout,
+        'top_size': top_size,
+    }
+
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+    write_atomic(_index_path(prefix, 'json'), write)
+
+
+def _open_indexes(prefix):
+    """Abre los índices guardados con ese prefijo (arreglos mapeados en memoria)"""
+    with open(_index_path(prefix, 'json'), 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+
+    month_index = {
+        year_month: (int(start), int(end))
+        for year_month, (start, end) in sorted(metadata['month_index'].items())
+    }
+
+    bitmaps = np.load(_index_path(prefix, 'bitmaps.npy'), mmap_mode='r')
+    bitmap_index = {
+        column: {value: bitmaps[row] for value, row in by_value.items()}
+        for column, by_value in metadata['bitmaps'].items()
+    }
+
+    values = np.load(_index_path(prefix, 'quantile-values.npy'), mmap_mode='r')
+    weights = np.load(_index_path(prefix, 'quantile-weights.npy'), mmap_mode='r')
+    quantile_index = {}
+    for subset, country, year_month, column, offset, length, rank_error in metadata['quantiles']:
+        by_month = quantile_index.setdefault((subset, country), {})
+        by_month.setdefault(year_month, {})[column] = QuantileSummary(
+            values[offset:offset + length], weights[offset:offset + length], rank_error
+        )
+
+    top_products_index = TopProductsIndex(
+        open_snapshot(_index_path(prefix, 'top-entries.arrow')),
+        open_snapshot(_index_path(prefix, 'top-residuals.arrow')),
+        metadata['top_size'],
+    )
+    return {
+        'month_index': month_index,
+        'bitmap_index': bitmap_index,
+        'quantile_index': quantile_index,
+        'top_products_index': top_products_index,
+    }
+
+
+def ensure_indexes(df, cache_dir, fingerprint, epsilon, exact_limit, top_size):
+    """
+    Abre los índices de esta versión del dataset, construyéndolos si no
+    existen, y elimina los de versiones o configuraciones anteriores.
+
+    Args:
+        df: DataFrame canónico (ordenado por InvoiceDate)
+        cache_dir: directorio de snapshots
+        fingerprint: huella de contenido del dataset
+        epsilon, exact_limit: configuración de los resúmenes de cuantiles
+        top_size: productos guardados por partición
+
+    Returns:
+        dict con month_index, bitmap_index, quantile_index y top_products_index
+    """
+    cache_dir = Path(cache_dir)
+    prefix = index_prefix(cache_dir, fingerprint, epsilon, exact_limit, top_size)
+    current = {_index_path(prefix, name).name for name in ('json', *INDEX_FILES)}
+
+    if not all((cache_dir / name).exists() for name in current):
+        with build_lock(cache_dir):
+            if not all((cache_dir / name).exists() for name in current):
+                print(f"Construyendo índices del dataset: {prefix.name}", file=sys.stderr)
+                _write_indexes(df, prefix, epsilon, exact_limit, top_size)
+
+            # Eliminar índices de otras versiones del dataset o configuraciones
+            for old_path in cache_dir.glob('retail-*.indexes-*'):
+                if old_path.name not in current:
+                    try:
+                        old_path.unlink()
+                    except OSError:
+                        pass
+
+    return _open_indexes(prefix)
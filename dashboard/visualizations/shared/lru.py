@@ -0,0 +1,107 @@
+"""
+Caché LRU en memoria, segura entre hilos, para los índices que se memorizan
+por clave de filtro (clasificaciones de perfil, series diarias de ventas,
+índices de vecinos de similitud).
+"""
+import threading
+from collections import OrderedDict
+
+from dashboard.visualizations.shared.data_loader import get_setting
+
+
+class LRUCache:
+    """
+    Caché LRU con tamaño máximo configurable y contadores de aciertos.
+    Opcionalmente también limita la memoria de las entradas: put() recibe el
+    tamaño en bytes de cada una y se descartan las menos usadas hasta que el
+    total cabe en el presupuesto.
+
+    Args:
+        size_setting: nombre del ajuste con el número máximo de entradas
+        default_size: tamaño por defecto si el ajuste no está definido
+        bytes_setting: nombre del ajuste con la memoria máxima en bytes (opcional)
+        default_max_bytes: memoria máxima por defecto si el ajuste no está definido
+    """
+
+    def __init__(self, size_setting, default_size, bytes_setting=None, default_max_bytes=None):
+        self.size_setting = size_setting
+        self.default_size = default_size
+        self.bytes_setting = bytes_setting
+        self.default_max_bytes = default_max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_size(self):
+        return max(1, int(get_setting(self.size_setting, self.default_size)))
+
+    @property
+    def max_bytes(self):
+        if self.bytes_setting is None:
+            return None
+        return max(0, int(get_setting(self.bytes_setting, self.default_max_bytes)))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry, nbytes=0):
+        """
+        Guarda una entrada. Con presupuesto de memoria, una entrada que no
+        cabe sola en él no se guarda.
+
+        Returns:
+            bool indicando si la entrada quedó en la caché
+        """
+        max_size = self.max_size
+        max_bytes = self.max_bytes
+        if max_bytes is not None and nbytes > max_bytes:
+            return False
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = entry
+            self.sizes[key] = nbytes
+            self.total_bytes += nbytes
+            while len(self.entries) > max_size or (max_bytes is not None and self.total_bytes > max_bytes):
+                oldest = next(iter(self.entries))
+                self._discard(oldest)
+                self.evictions += 1
+            return True
+
+    def _discard(self, key):
+        if key in self.entries:
+            del self.entries[key]
+            self.total_bytes -= self.sizes.pop(key, 0)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """Tamaño y aciertos de la caché (para los endpoints de salud)"""
+        max_bytes = self.max_bytes
+        with self.lock:
+            stats = {
+                'entries': len(self.entries),
+                'max_entries': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+            if max_bytes is not None:
+                stats['bytes'] = self.total_bytes
+                stats['max_bytes'] = max_bytes
+                stats['evictions'] = self.evictions
+            return stats
@@ -0,0 +1,127 @@
+"""
+Almacén en disco del dataset particionado por mes y país (Parquet, estilo Hive).
+
+El DataFrame canónico se escribe como un árbol de archivos Parquet:
+
+    retail-<huella>-v<formato>.parts/
+        year_month=2010-12/country=United%20Kingdom/part-0.parquet
+        year_month=2010-12/country=France/part-0.parquet
+        ...
+
+Las consultas lo leen con `pl.scan_parquet(hive_partitioning=True)` y filtran
+por las columnas de partición (`year_month`, `country`), de modo que Polars
+descarta los archivos que no cumplen el filtro (partition pruning): una
+consulta de un país y tres meses solo abre esos archivos.
+"""
+import os
+import shutil
+import sys
+import urllib.parse
+from pathlib import Path
+
+import polars as pl
+
+from .snapshot import SNAPSHOT_FORMAT, build_lock
+
+# Columnas de partición (se derivan de la ruta, no se guardan en los archivos)
+PARTITION_COLUMNS = ['year_month', 'country']
+
+PARTITION_SCHEMA = {
+    'year_month': pl.Utf8,
+    'country': pl.Utf8,
+}
+
+
+def partitioned_path(cache_dir, fingerprint):
+    """Directorio del almacén particionado para una huella de contenido"""
+    return Path(cache_dir) / f'retail-{fingerprint[:16]}-v{SNAPSHOT_FORMAT}.parts'
+
+
+def _partition_value(value):
+    """Codifica un valor de partición para usarlo como nombre de directorio"""
+    return urllib.parse.quote(str(value), safe='')
+
+
+def write_partitioned(df, path):
+    """
+    Escribe el DataFrame canónico particionado por `year_month` y `country`.
+    Se escribe en un directorio temporal que se renombra al terminar, para no
+    dejar nunca un almacén a medias.
+    """
+    path = Path(path)
+    tmp_path = Path(f'{path}.{os.getpid()}.tmp')
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+
+    try:
+        keyed = df.with_columns(
+            pl.col('InvoiceDate').dt.strftime('%Y-%m').alias('year_month')
+        )
+        for (year_month, country), part in keyed.group_by(['year_month', 'Country']):
+            part_dir = (
+                tmp_path
+                / f'year_month={_partition_value(year_month)}'
+                / f'country={_partition_value(country)}'
+            )
+            part_dir.mkdir(parents=True, exist_ok=True)
+            part.drop('year_month').write_parquet(part_dir / 'part-0.parquet')
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+
+
+def ensure_partitioned(df, cache_dir, fingerprint):
+    """
+    Construye el almacén particionado de esta versión del dataset si no existe
+    y elimina los de versiones anteriores.
+
+    Returns:
+        Path del almacén particionado
+    """
+    cache_dir = Path(cache_dir)
+    path = partitioned_path(cache_dir, fingerprint)
+    if path.exists():
+        return path
+
+    with build_lock(cache_dir):
+        if not path.exists():
+            print(f"Construyendo almacén particionado: {path.name}", file=sys.stderr)
+            write_partitioned(df, path)
+
+        # Eliminar almacenes de otras versiones del dataset
+        for old_path in cache_dir.glob('retail-*.parts'):
+            if old_path != path:
+                shutil.rmtree(old_path, ignore_errors=True)
+
+    return path
+
+
+def scan_partitioned(path, start_month=None, end_month=None, country=None):
+    """
+    LazyFrame sobre el almacén particionado con poda de particiones.
+
+    Args:
+        path: directorio del almacén particionado
+        start_month: primer mes 'YYYY-MM' (opcional)
+        end_month: último mes 'YYYY-MM' (opcional)
+        country: país (opcional)
+
+    Returns:
+        pl.LazyFrame con las columnas del esquema canónico
+    """
+    lf = pl.scan_parquet(
+        str(Path(path) / '**' / '*.parquet'),
+        hive_partitioning=True,
+        hive_schema=PARTITION_SCHEMA,
+    )
+
+    # Los filtros sobre columnas de partición descartan archivos sin leerlos
+    if start_month:
+        lf = lf.filter(pl.col('year_month') >= start_month)
+    if end_month:
+        lf = lf.filter(pl.col('year_month') <= end_month)
+    if country:
+        lf = lf.filter(pl.col('country') == country)
+
+    return lf.drop(PARTITION_COLUMNS)
@@ -0,0 +1,185 @@
+"""
+Servicio de clasificación de transacciones por perfil de cliente.
+
+La clasificación depende de los umbrales IQR (Q3 + 1.5 * IQR) de Total y
+UnitPrice calculados sobre las filas filtradas por país, fechas y clientes.
+Calcular esos cuantiles y reclasificar todas las filas en cada petición es lo
+más caro de aplicar un filtro de perfil, así que se memoriza por clave de
+filtro normalizada (y versión del dataset):
+
+- los umbrales `(total_upper, price_upper)`
+- la columna compacta de códigos de perfil (UInt8, alineada con el DataFrame
+  canónico en memoria)
+
+Cambiar el perfil en el selector pasa a ser una comparación de enteros sobre
+esa columna. Los umbrales de una clave nueva se obtienen combinando los
+resúmenes de cuantiles por (país, mes) de shared/quantiles.py, y solo se
+recorre la columna completa cuando esos resúmenes no sirven (filtro por
+clientes, o resúmenes aproximados en modo exacto). La caché es privada de
+cada worker y tiene un tamaño máximo en entradas
+(DASHBOARD_PROFILE_CACHE_SIZE) y en bytes (DASHBOARD_PROFILE_CACHE_MAX_BYTES,
+la columna de códigos más sus bitmaps); descarta las claves menos usadas
+recientemente (LRU).
+"""
+import polars as pl
+
+from dashboard.visualizations.shared.data_loader import (
+    QUANTILE_MODE_APPROXIMATE,
+    get_dataset_version,
+    get_partitioned_store,
+    get_quantile_index,
+    get_quantile_settings,
+    load_online_retail_data
+)
+from dashboard.visualizations.shared.query import (
+    PERFIL_MINORISTA_ESTANDAR,
+    PERFIL_MAYORISTA_ESTANDAR,
+    PERFIL_MINORISTA_LUJO,
+    PERFIL_MAYORISTA_LUJO,
+    iqr_upper_bound
+)
+from dashboard.visualizations.shared.bitmaps import pack_mask
+from dashboard.visualizations.shared.lru import LRUCache
+from dashboard.visualizations.shared.quantiles import (
+    SUBSET_ALL,
+    SUBSET_VALID,
+    merged_upper_bounds
+)
+
+# Orden de los perfiles: el código UInt8 es la posición en esta lista
+PERFILES = [
+    PERFIL_MINORISTA_ESTANDAR,
+    PERFIL_MAYORISTA_ESTANDAR,
+    PERFIL_MINORISTA_LUJO,
+    PERFIL_MAYORISTA_LUJO,
+]
+PERFIL_CODES = {perfil: code for code, perfil in enumerate(PERFILES)}
+PERFIL_DTYPE = pl.Enum(PERFILES)
+
+# Nombre interno de la columna de códigos
+PERFIL_CODE_COLUMN = '_PerfilCode'
+
+DEFAULT_CACHE_SIZE = 32
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def perfil_code_expr(total_upper, price_upper):
+    """
+    Expresión por fila (sin agregaciones) con el código de perfil para unos
+    umbrales ya calculados
+    """
+    # Igual que el `otherwise` de la clasificación original, los nulos cuentan
+    # como "no supera el umbral"
+    mayorista = (pl.col('Total') > total_upper).fill_null(False)
+    lujo = (pl.col('UnitPrice') > price_upper).fill_null(False)
+    return (
+        mayorista.cast(pl.UInt8) + 2 * lujo.cast(pl.UInt8)
+    ).alias(PERFIL_CODE_COLUMN)
+
+
+class ProfileClassification:
+    """Umbrales y códigos de perfil memorizados para una clave de filtro"""
+
+    def __init__(self, total_upper, price_upper, codes=None, relative_error=0.0):
+        self.total_upper = total_upper
+        self.price_upper = price_upper
+        # Error de rango relativo de los cuantiles usados (0.0 si son exactos)
+        self.relative_error = relative_error
+        # Series UInt8 alineada con el DataFrame canónico (None en el almacén particionado)
+        self.codes = codes
+        self.bitmaps = {}
+
+    @property
+    def nbytes(self):
+        """Memoria de los códigos y de los bitmaps que se pueden memorizar (uno por perfil)"""
+        if self.codes is None:
+            return 0
+        return len(self.codes) + len(PERFILES) * ((len(self.codes) + 7) // 8)
+
+    def code_expr(self):
+        return perfil_code_expr(self.total_upper, self.price_upper)
+
+    def bitmap(self, code):
+        """Bitmap empaquetado de las filas con un código de perfil (se memoriza)"""
+        bitmap = self.bitmaps.get(code)
+        if bitmap is None:
+            bitmap = pack_mask(self.codes == code)
+            self.bitmaps[code] = bitmap
+        return bitmap
+
+
+_cache = LRUCache(
+    'DASHBOARD_PROFILE_CACHE_SIZE', DEFAULT_CACHE_SIZE,
+    'DASHBOARD_PROFILE_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES
+)
+
+
+def _thresholds_from_summaries(spec):
+    """
+    Umbrales a partir de los resúmenes de cuantiles por (país, mes).
+
+    Returns:
+        tuple: (total_upper, price_upper, relative_error), o None si los
+        resúmenes no cubren los filtros de la consulta o no cumplen la
+        precisión configurada
+    """
+    index = get_quantile_index()
+    if index is None or spec.customer_ids is not None:
+        return None
+
+    subset = SUBSET_VALID if spec.valid_only else SUBSET_ALL
+    total_upper, price_upper, relative_error = merged_upper_bounds(
+        index, subset, spec.country, spec.start_date, spec.end_date
+    )
+    if relative_error > 0 and get_quantile_settings()['mode'] != QUANTILE_MODE_APPROXIMATE:
+        return None
+    return total_upper, price_upper, relative_error
+
+
+def get_profile_classification(spec, base_plan):
+    """
+    Obtiene (o calcula y memoriza) la clasificación por perfil de una consulta.
+
+    Args:
+        spec: FilterSpec de la consulta; solo sus filtros previos a la
+            clasificación forman parte de la clave
+        base_plan: LazyFrame con esos filtros ya aplicados, usado para calcular
+            los umbrales exactos si no están en caché ni en los resúmenes
+
+    Returns:
+        ProfileClassification
+    """
+    key = (get_dataset_version(), spec.classification_key)
+    classification = _cache.get(key)
+    if classification is not None:
+        return classification
+
+    thresholds = _thresholds_from_summaries(spec)
+    if thresholds is not None:
+        total_upper, price_upper, relative_error = thresholds
+    else:
+        # Modo exacto: cuantiles sobre las filas filtradas
+        exact = base_plan.select([
+            iqr_upper_bound('Total').alias('total_upper'),
+            iqr_upper_bound('UnitPrice').alias('price_upper'),
+        ]).collect()
+        total_upper = exact['total_upper'][0]
+        price_upper = exact['price_upper'][0]
+        relative_error = 0.0
+
+    codes = None
+    if get_partitioned_store() is None:
+        # Códigos para todas las filas del DataFrame canónico: las consultas
+        # posteriores solo agregan la columna (sin copiarla) y comparan enteros
+        codes = load_online_retail_data().select(
+            perfil_code_expr(total_upper, price_upper)
+        ).to_series()
+
+    classification = ProfileClassification(total_upper, price_upper, codes, relative_error)
+    _cache.put(key, classification, classification.nbytes)
+    return classification
+
+
+def get_classification_cache_stats():
+    """Estadísticas de la caché de clasificación (aciertos, fallos, entradas)"""
+    return _cache.stats()
@@ -0,0 +1,221 @@
+"""
+Resúmenes de cuantiles combinables por (país, mes).
+
+Los umbrales de perfil necesitan los percentiles 25 y 75 de Total y UnitPrice
+sobre el país y el rango de meses elegidos. En lugar de recorrer la columna
+completa en cada petición, al cargar el dataset se construye un resumen por
+(subconjunto, país, mes) y columna, y los cuantiles de cualquier rango se
+obtienen combinando unos pocos resúmenes.
+
+Cada resumen es una lista ordenada de valores con su peso (número de filas):
+- Mientras el número de valores distintos no supera `exact_limit`, el resumen
+  es el histograma exacto y los cuantiles combinados coinciden exactamente con
+  los de Polars (interpolación 'nearest').
+- Por encima de ese límite se comprime a ceil(1 / epsilon) puntos, con un error
+  de rango de a lo sumo ceil(epsilon * n). Los errores de los resúmenes
+  combinados se suman, así que el error relativo del resultado se mantiene en
+  torno a epsilon y se informa junto con los cuantiles.
+
+También se guardan resúmenes por mes para todos los países (país '*'), de modo
+que una consulta sin país combina como mucho un resumen por mes.
+"""
+import math
+
+import numpy as np
+import polars as pl
+
+# Subconjuntos de filas con resúmenes propios
+SUBSET_ALL = 'all'
+SUBSET_VALID = 'valid'
+
+# País comodín: resúmenes de todos los países
+ALL_COUNTRIES = '*'
+
+QUANTILE_COLUMNS = ['Total', 'UnitPrice']
+
+
+class QuantileSummary:
+    """
+    Resumen combinable de una distribución: valores ordenados y distintos,
+    peso de cada uno y cota del error de rango acumulado (0 si es exacto).
+    """
+
+    __slots__ = ('values', 'weights', 'rank_error')
+
+    def __init__(self, values, weights, rank_error=0):
+        self.values = values
+        self.weights = weights
+        self.rank_error = rank_error
+
+    @property
+    def count(self):
+        return int(self.weights.sum())
+
+    @property
+    def exact(self):
+        return self.rank_error == 0
+
+    @property
+    def relative_error(self):
+        """Error de rango relativo al número de filas (0.0 si es exacto)"""
+        count = self.count
+        return self.rank_error / count if count else 0.0
+
+    @classmethod
+    def from_counts(cls, values, counts, epsilon, exact_limit):
+        """Crea un resumen a partir de valores distintos ordenados y sus frecuencias"""
+        summary = cls(
+            np.asarray(values, dtype=np.float64),
+            np.asarray(counts, dtype=np.int64),
+        )
+        if len(summary.values) > exact_limit:
+            summary = summary.compress(epsilon)
+        return summary
+
+    @classmethod
+    def merge(cls, summaries):
+        """Combina varios resúmenes (los pesos de valores repetidos se suman)"""
+        summaries = [s for s in summaries if len(s.values)]
+        if not summaries:
+            return cls(np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64))
+        if len(summaries) == 1:
+            return summaries[0]
+
+        values, inverse = np.unique(
+            np.concatenate([s.values for s in summaries]), return_inverse=True
+        )
+        weights = np.bincount(
+            inverse, weights=np.concatenate([s.weights for s in summaries])
+        ).astype(np.int64)
+        return cls(values, weights, sum(s.rank_error for s in summaries))
+
+    def compress(self, epsilon):
+        """
+        Reduce el resumen a ceil(1 / epsilon) puntos: cada punto conserva el
+        peso de los rangos que representa, con un error de rango <= ceil(epsilon * n)
+        """
+        points = max(1, math.ceil(1 / epsilon))
+        count = self.count
+        if len(self.values) <= points or count == 0:
+            return self
+
+        cumulative = np.cumsum(self.weights)
+        targets = np.ceil(np.arange(1, points + 1) * count / points)
+        keep = np.unique(np.searchsorted(cumulative, targets))
+        kept_cumulative = cumulative[keep]
+        weights = np.diff(kept_cumulative, prepend=0)
+        return QuantileSummary(
+            self.values[keep],
+            weights.astype(np.int64),
+            self.rank_error + math.ceil(count / points),
+        )
+
+    def quantile(self, q):
+        """
+        Cuantil con la semántica 'nearest' de Polars: el elemento de rango
+        floor((n - 1) * q + 0.5) de los valores ordenados. None si está vacío.
+        """
+        count = self.count
+        if count == 0:
+            return None
+        rank = math.floor((count - 1) * q + 0.5)
+        cumulative = np.cumsum(self.weights)
+        return float(self.values[np.searchsorted(cumulative, rank, side='right')])
+
+    def iqr_upper_bound(self):
+        """Límite superior IQR (Q3 + 1.5 * IQR), igual que query.iqr_upper_bound"""
+        q1 = self.quantile(0.25)
+        q3 = self.quantile(0.75)
+        if q1 is None or q3 is None:
+            return None
+        return q3 + 1.5 * (q3 - q1)
+
+
+def _summaries_for(df, group_columns, epsilon, exact_limit):
+    """Resúmenes por grupo y columna a partir de las frecuencias de cada valor"""
+    summaries = {}
+    for column in QUANTILE_COLUMNS:
+        counts = (
+            df.filter(pl.col(column).is_not_null() & pl.col(column).is_not_nan())
+            .group_by([*group_columns, column])
+            .agg(pl.len().alias('count'))
+            .sort([*group_columns, column])
+        )
+        for key, group in counts.partition_by(group_columns, as_dict=True, maintain_order=True).items():
+            summaries.setdefault(key, {})[column] = QuantileSummary.from_counts(
+                group[column].to_numpy(), group['count'].to_numpy(), epsilon, exact_limit
+            )
+    return summaries
+
+
+def build_quantile_index(df, epsilon, exact_limit):
+    """
+    Construye los resúmenes de cuantiles del DataFrame canónico.
+
+    Args:
+        df: DataFrame canónico
+        epsilon: error de rango relativo máximo de los resúmenes comprimidos
+        exact_limit: valores distintos por resumen a partir de los cuales se comprime
+
+    Returns:
+        dict {(subconjunto, país): {'YYYY-MM': {columna: QuantileSummary}}}
+    """
+    keyed = df.select([
+        pl.col('Country').cast(pl.Utf8),
+        pl.col('InvoiceDate').dt.strftime('%Y-%m').alias('year_month'),
+        (
+            pl.col('CustomerID').is_not_null() &
+            (pl.col('Total') > 0) &
+            (pl.col('Quantity') > 0)
+        ).alias('valid'),
+        *QUANTILE_COLUMNS,
+    ])
+
+    index = {}
+    for subset, rows in ((SUBSET_ALL, keyed), (SUBSET_VALID, keyed.filter(pl.col('valid')))):
+        for (country, year_month), summaries in _summaries_for(
+                rows, ['Country', 'year_month'], epsilon, exact_limit).items():
+            index.setdefault((subset, country), {})[year_month] = summaries
+        for (year_month,), summaries in _summaries_for(
+                rows, ['year_month'], epsilon, exact_limit).items():
+            index.setdefault((subset, ALL_COUNTRIES), {})[year_month] = summaries
+    return index
+
+
+def merged_upper_bounds(index, subset, country=None, start_month=None, end_month=None):
+    """
+    Límites superiores IQR de Total y UnitPrice combinando los resúmenes del
+    país y el rango de meses indicados.
+
+    Returns:
+        tuple: (total_upper, price_upper, relative_error)
+    """
+    by_month = index.get((subset, country or ALL_COUNTRIES), {})
+    selected = [
+        summaries for year_month, summaries in by_month.items()
+        if (start_month is None or year_month >= start_month)
+        and (end_month is None or year_month <= end_month)
+    ]
+
+    total = QuantileSummary.merge([s['Total'] for s in selected if 'Total' in s])
+    price = QuantileSummary.merge([s['UnitPrice'] for s in selected if 'UnitPrice' in s])
+    return (
+        total.iqr_upper_bound(),
+        price.iqr_upper_bound(),
+        max(total.relative_error, price.relative_error),
+    )
+
+
+def describe_quantile_index(index):
+    """Resumen del índice para los endpoints de salud"""
+    summaries = [
+        summary
+        for by_month in index.values()
+        for by_column in by_month.values()
+        for summary in by_column.values()
+    ]
+    return {
+        'summaries': len(summaries),
+        'exact_summaries': sum(1 for s in summaries if s.exact),
+        'max_relative_error': max((s.relative_error for s in summaries), default=0.0),
+    }
@@ -0,0 +1,169 @@
+"""
+Capa de consultas lazy sobre el dataset canónico.
+
+Cada endpoint construye un único plan `pl.LazyFrame` (filtros, columnas
+derivadas y agregaciones) que Polars optimiza antes de ejecutarlo: los
+filtros se empujan hasta el escaneo (predicate pushdown) y solo se leen las
+columnas que el endpoint necesita (projection pushdown), sin copiar frames
+intermedios de ancho completo.
+
+La ventana de fechas se resuelve en el propio escaneo: sobre el DataFrame en
+memoria (ordenado por InvoiceDate) es un `slice()` sin copia obtenido del
+índice de meses o por búsqueda binaria, y los filtros de igualdad sobre
+dimensiones indexadas se combinan con bitmaps (ver bitmaps.py) y extraen las
+filas de una sola vez; con el almacén particionado
+(DASHBOARD_DATA_STORE=partitioned) el país y la ventana de meses descartan los
+archivos que no intervienen.
+
+Las consultas que solo suman ventas y cantidades por día o por producto
+pueden responderse desde los cubos diarios preagregados
+(`scan_sales_cube`), sin recorrer las transacciones.
+"""
+import datetime
+import polars as pl
+from dashboard.visualizations.shared.data_loader import (
+    load_online_retail_data,
+    get_bitmap_index,
+    get_month_index,
+    get_partitioned_store,
+    get_sales_cube
+)
+from dashboard.visualizations.shared.cubes import slice_days
+from dashboard.visualizations.shared.bitmaps import select_rows
+from dashboard.visualizations.shared.partitioned import scan_partitioned
+from dashboard.visualizations.shared.time_index import (
+    month_window,
+    month_days,
+    day_window,
+    intersect_windows
+)
+
+# Etiquetas de perfil de cliente (clasificación por IQR de Total y UnitPrice)
+PERFIL_MINORISTA_ESTANDAR = 'Minorista Estándar'
+PERFIL_MAYORISTA_ESTANDAR = 'Mayorista Estándar'
+PERFIL_MINORISTA_LUJO = 'Minorista Lujo'
+PERFIL_MAYORISTA_LUJO = 'Mayorista Lujo'
+
+
+def scan_online_retail_data(columns=None, country=None, start_date=None, end_date=None,
+                            first_day=None, last_day=None, aligned=None, equals=None, masks=None):
+    """
+    Devuelve un LazyFrame sobre el dataset canónico, limitado a la ventana de
+    fechas indicada.
+
+    Args:
+        columns: columnas a proyectar (opcional). Si se omite, el optimizador
+            descarta igualmente las columnas que el plan no usa.
+        country: país de la consulta (opcional), para podar particiones
+        start_date: primer mes 'YYYY-MM' (opcional, incluido)
+        end_date: último mes 'YYYY-MM' (opcional, incluido completo)
+        first_day: primer día (datetime.date) dentro de la ventana de meses (opcional)
+        last_day: último día (datetime.date) dentro de la ventana de meses (opcional)
+        aligned: Series alineadas fila a fila con el DataFrame canónico que se
+            agregan como columnas (solo almacén en memoria)
+        equals: dict {columna: valor} de filtros de igualdad sobre dimensiones
+            indexadas (Country, Category, Subcategory)
+        masks: bitmaps empaquetados adicionales alineados con el DataFrame
+            canónico (solo almacén en memoria)
+
+    Las filas devueltas ya cumplen la ventana de fechas y los filtros de
+    `equals` y `masks`; el parámetro `country` solo se usa para descartar
+    particiones.
+
+    Returns:
+        pl.LazyFrame, o None si el dataset no está disponible
+    """
+    df = load_online_retail_data()
+
+    if df is None or df.is_empty():
+        return None
+
+    equals = equals or {}
+    partitioned_path = get_partitioned_store()
+    if partitioned_path is not None and aligned is None and not masks:
+        lf = scan_partitioned(partitioned_path, start_date, end_date, country)
+        if first_day is not None:
+            lf = lf.filter(pl.col('InvoiceDate') >= datetime.datetime.combine(first_day, datetime.time()))
+        if last_day is not None:
+            next_day = datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time())
+            lf = lf.filter(pl.col('InvoiceDate') < next_day)
+        for column, value in equals.items():
+            lf = lf.filter(pl.col(column) == value)
+    else:
+        height = df.height
+        if aligned:
+            df = df.with_columns(aligned)
+
+        # Ventana de filas por índice de meses y búsqueda binaria de días
+        window = intersect_windows(
+            month_window(get_month_index(), start_date, end_date),
+            day_window(df['InvoiceDate'], first_day, last_day) if first_day or last_day else None
+        )
+
+        if equals or masks:
+            # AND de bitmaps dentro de la ventana y una sola extracción de filas
+            rows = select_rows(get_bitmap_index(), equals, masks or [], window, height)
+            df = df[rows]
+        elif window is not None:
+            df = df.slice(window[0], window[1] - window[0])
+        lf = df.lazy()
+
+    if columns:
+        lf = lf.select(columns)
+    return lf
+
+
+def scan_sales_cube(name, start_date=None, end_date=None, equals=None):
+    """
+    Devuelve un LazyFrame sobre un cubo diario de ventas (ver cubes.py),
+    limitado a la ventana de meses y a los filtros de igualdad indicados.
+
+    Args:
+        name: nombre del cubo (CUBE_DAILY o CUBE_PRODUCTS)
+        start_date: primer mes 'YYYY-MM' (opcional, incluido)
+        end_date: último mes 'YYYY-MM' (opcional, incluido completo)
+        equals: dict {columna: valor} sobre dimensiones del cubo
+
+    Returns:
+        pl.LazyFrame con las columnas del cubo (Fecha, dimensiones, Sales y
+        Quantity), o None si el cubo no está disponible
+    """
+    load_online_retail_data()
+    cube = get_sales_cube(name)
+    if cube is None:
+        return None
+
+    # El cubo está ordenado por día: la ventana de meses es un slice
+    lf = slice_days(cube, *month_days(start_date, end_date)).lazy()
+    for column, value in (equals or {}).items():
+        lf = lf.filter(pl.col(column) == value)
+    return lf
+
+
+def iqr_upper_bound(column):
+    """
+    Expresión con el límite superior IQR (Q3 + 1.5 * IQR) de una columna,
+    calculado sobre las filas que llegan a ese punto del plan
+    """
+    q1 = pl.col(column).quantile(0.25)
+    q3 = pl.col(column).quantile(0.75)
+    return q3 + 1.5 * (q3 - q1)
+
+
+def perfil_expr():
+    """
+    Expresión que clasifica cada transacción en un perfil de cliente según
+    si Total y UnitPrice superan su límite superior IQR
+    """
+    total_upper = iqr_upper_bound('Total')
+    price_upper = iqr_upper_bound('UnitPrice')
+    return (
+        pl.when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') <= price_upper))
+        .then(pl.lit(PERFIL_MAYORISTA_ESTANDAR))
+        .when((pl.col('Total') <= total_upper) & (pl.col('UnitPrice') > price_upper))
+        .then(pl.lit(PERFIL_MINORISTA_LUJO))
+        .when((pl.col('Total') > total_upper) & (pl.col('UnitPrice') > price_upper))
+        .then(pl.lit(PERFIL_MAYORISTA_LUJO))
+        .otherwise(pl.lit(PERFIL_MINORISTA_ESTANDAR))
+        .alias('Perfil')
+    )
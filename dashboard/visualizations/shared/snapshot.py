@@ -0,0 +1,250 @@
+"""
+Caché local del dataset en formato columnar (Arrow IPC).
+
+El CSV de origen se parsea una sola vez y el resultado se guarda como un
+snapshot Arrow IPC sin compresión, identificado por la huella SHA-256 del
+contenido original. Los arranques posteriores mapean el snapshot en memoria
+(memory_map) en lugar de volver a descargar y parsear el CSV, y el snapshot
+solo se reconstruye cuando cambia el contenido del origen.
+
+Como el snapshot es un archivo mapeado en memoria, todos los procesos que lo
+abren (por ejemplo, los workers de Gunicorn) comparten las mismas páginas
+físicas a través de la caché de páginas del sistema operativo: la memoria del
+dataset no se multiplica por el número de workers.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import urllib.request
+from pathlib import Path
+
+import polars as pl
+
+# Versión del formato del snapshot: incrementarla invalida los snapshots previos
+SNAPSHOT_FORMAT = 3
+
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = '.build.lock'
+
+# Validador de un origen accesible que no expone ETag ni Last-Modified: no
+# permite reutilizar el snapshot sin descargar el contenido y comparar su huella
+NO_VALIDATOR = 'none:'
+
+
+def is_url(source):
+    """Indica si el origen es una URL HTTP(S)"""
+    return str(source).startswith(('http://', 'https://'))
+
+
+def get_source_validator(source, timeout=10):
+    """
+    Obtiene un validador barato del origen sin descargarlo completo.
+
+    Para URLs usa las cabeceras ETag/Last-Modified de una petición HEAD;
+    para archivos locales usa tamaño y fecha de modificación.
+
+    Returns:
+        str con el validador (NO_VALIDATOR si el origen responde sin
+        cabeceras de validación), o None si el origen no está accesible
+    """
+    try:
+        if is_url(source):
+            request = urllib.request.Request(source, method='HEAD')
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                etag = response.headers.get('ETag')
+                if etag:
+                    return f'etag:{etag}'
+                last_modified = response.headers.get('Last-Modified')
+                length = response.headers.get('Content-Length')
+                if last_modified:
+                    return f'lm:{last_modified}:{length}'
+                return NO_VALIDATOR
+        stat = os.stat(source)
+        return f'stat:{stat.st_size}:{stat.st_mtime_ns}'
+    except Exception as e:
+        print(f"No se pudo validar el origen {source}: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+
+
+def read_source_bytes(source, timeout=60):
+    """Lee el contenido crudo del origen (URL o archivo local)"""
+    if is_url(source):
+        with urllib.request.urlopen(source, timeout=timeout) as response:
+            return response.read()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def compute_fingerprint(raw):
+    """Huella de contenido (SHA-256) del origen"""
+    return hashlib.sha256(raw).hexdigest()
+
+
+def snapshot_path(cache_dir, fingerprint):
+    """Ruta del snapshot para una huella de contenido"""
+    return Path(cache_dir) / f'retail-{fingerprint[:16]}-v{SNAPSHOT_FORMAT}.arrow'
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(Path(cache_dir) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_atomic(path, write):
+    """Escribe en un archivo temporal y lo renombra (evita snapshots a medias)"""
+    tmp_path = Path(f'{path}.{os.getpid()}.tmp')
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def _write_manifest(cache_dir, manifest):
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+    write_atomic(Path(cache_dir) / MANIFEST_NAME, write)
+
+
+@contextlib.contextmanager
+def build_lock(cache_dir):
+    """
+    Bloqueo exclusivo entre procesos para que un solo proceso construya el
+    snapshot mientras el resto espera. En plataformas sin fcntl no bloquea.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    with open(Path(cache_dir) / LOCK_NAME, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _valid_entry(cache_dir, entry):
+    """Ruta del snapshot de una entrada del manifiesto, o None si no es utilizable"""
+    if not entry or entry.get('format') != SNAPSHOT_FORMAT:
+        return None
+    path = Path(cache_dir) / entry['snapshot']
+    return path if path.exists() else None
+
+
+def open_snapshot(path):
+    """Abre un snapshot Arrow IPC mapeándolo en memoria (sin copiarlo)"""
+    return pl.read_ipc(path, memory_map=True)
+
+
+def write_snapshot(df, path):
+    """Guarda el DataFrame como Arrow IPC sin compresión (requisito para memory_map)"""
+    # Un único chunk: IPC no admite diccionarios categóricos distintos por batch
+    df = df.rechunk()
+    write_atomic(path, lambda tmp_path: df.write_ipc(tmp_path, compression='uncompressed'))
+
+
+def attach_snapshot(source, cache_dir):
+    """
+    Abre el último snapshot registrado para el origen sin validarlo contra el
+    origen (sin peticiones de red ni lectura del CSV).
+
+    Lo usan los workers en modo compartido: el proceso maestro ya materializó
+    el snapshot y los workers solo lo mapean en memoria.
+
+    Returns:
+        tuple: (DataFrame, fingerprint), o None si no hay snapshot utilizable
+    """
+    entry = _read_manifest(cache_dir).get(str(source))
+    path = _valid_entry(cache_dir, entry)
+    if path is None:
+        return None
+    print(f"Usando snapshot compartido: {path.name}", file=sys.stderr)
+    return open_snapshot(path), entry['fingerprint']
+
+
+def load_with_snapshot(source, parse, cache_dir):
+    """
+    Carga el dataset usando el snapshot local cuando es válido.
+
+    1. Si el validador del origen coincide con el del manifiesto, abre el snapshot.
+    2. Si el origen no está accesible (sin red), usa el último snapshot conocido.
+    3. En otro caso (también si el origen no tiene validador) descarga el
+       contenido, calcula su huella y reutiliza el snapshot con esa huella o
+       lo construye con `parse(raw_bytes)`.
+
+    La construcción se hace bajo un bloqueo entre procesos: si varios procesos
+    arrancan a la vez, solo uno descarga y parsea el CSV y el resto reutiliza
+    su snapshot.
+
+    Args:
+        source: URL o ruta del CSV de origen
+        parse: función que recibe los bytes crudos y devuelve un pl.DataFrame
+        cache_dir: directorio donde se guardan snapshots y manifiesto
+
+    Returns:
+        tuple: (DataFrame, fingerprint)
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    validator = get_source_validator(source)
+
+    def reuse(entry):
+        path = _valid_entry(cache_dir, entry)
+        if path is None or validator == NO_VALIDATOR:
+            return None
+        if validator is None:
+            print("Origen no disponible: usando el último snapshot local", file=sys.stderr)
+        elif validator != entry.get('validator'):
+            return None
+        print(f"Usando snapshot local: {path.name}", file=sys.stderr)
+        return open_snapshot(path), entry['fingerprint']
+
+    result = reuse(_read_manifest(cache_dir).get(str(source)))
+    if result is not None:
+        return result
+
+    with build_lock(cache_dir):
+        # Otro proceso pudo haber construido el snapshot mientras se esperaba el bloqueo
+        manifest = _read_manifest(cache_dir)
+        entry = manifest.get(str(source))
+        result = reuse(entry)
+        if result is not None:
+            return result
+
+        raw = read_source_bytes(source)
+        fingerprint = compute_fingerprint(raw)
+        path = snapshot_path(cache_dir, fingerprint)
+
+        if not path.exists():
+            print(f"Construyendo snapshot local: {path.name}", file=sys.stderr)
+            df = parse(raw)
+            write_snapshot(df, path)
+            del df
+
+        # Eliminar el snapshot anterior de este origen si cambió el contenido
+        if entry and entry.get('snapshot') not in (None, path.name):
+            try:
+                (cache_dir / entry['snapshot']).unlink()
+            except OSError:
+                pass
+
+        manifest[str(source)] = {
+            'validator': validator,
+            'fingerprint': fingerprint,
+            'format': SNAPSHOT_FORMAT,
+            'snapshot': path.name,
+        }
+        _write_manifest(cache_dir, manifest)
+
+    return open_snapshot(path), fingerprint
@@ -0,0 +1,110 @@
+"""
+Índice temporal del DataFrame canónico.
+
+El DataFrame canónico se guarda ordenado por InvoiceDate, y al cargarlo se
+construye un índice mes → (fila inicial, fila final). Así una ventana de
+meses 'YYYY-MM' se resuelve con una búsqueda en el índice, y una ventana de
+días con una búsqueda binaria sobre la columna ordenada, en ambos casos como
+un `slice()` sin copia antes de cualquier otro filtro.
+"""
+import bisect
+import datetime
+
+import polars as pl
+
+
+def sort_by_time(df):
+    """Ordena el DataFrame por InvoiceDate (orden estable) y marca la columna como ordenada"""
+    return df.sort('InvoiceDate', nulls_last=True, maintain_order=True).with_columns(
+        pl.col('InvoiceDate').set_sorted()
+    )
+
+
+def build_month_index(df):
+    """
+    Construye el índice mes → filas de un DataFrame ordenado por InvoiceDate.
+
+    Returns:
+        dict {'YYYY-MM': (fila_inicial, fila_final_exclusiva)} en orden cronológico
+    """
+    months = (
+        df.lazy()
+        .with_row_index('row')
+        .group_by(pl.col('InvoiceDate').dt.strftime('%Y-%m').alias('year_month'))
+        .agg([
+            pl.col('row').min().alias('start'),
+            (pl.col('row').max() + 1).alias('end'),
+        ])
+        .sort('year_month')
+        .collect()
+    )
+    return {
+        row['year_month']: (int(row['start']), int(row['end']))
+        for row in months.iter_rows(named=True)
+        if row['year_month'] is not None
+    }
+
+
+def month_window(month_index, start_month=None, end_month=None):
+    """
+    Filas [inicio, fin) de una ventana de meses (ambos extremos incluidos).
+
+    Returns:
+        tuple: (fila_inicial, fila_final_exclusiva), o None si la ventana no
+        restringe las filas
+    """
+    if not start_month and not end_month:
+        return None
+
+    months = list(month_index)
+    first = bisect.bisect_left(months, start_month) if start_month else 0
+    last = bisect.bisect_right(months, end_month) if end_month else len(months)
+    if first >= last:
+        return 0, 0
+    return month_index[months[first]][0], month_index[months[last - 1]][1]
+
+
+def month_days(start_month=None, end_month=None):
+    """
+    Primer y último día (datetime.date) de una ventana de meses 'YYYY-MM'
+    (ambos extremos incluidos; None si el extremo no se indica)
+    """
+    first_day = None
+    last_day = None
+    if start_month:
+        year, month = map(int, start_month.split('-'))
+        first_day = datetime.date(year, month, 1)
+    if end_month:
+        year, month = map(int, end_month.split('-'))
+        next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+        last_day = next_month - datetime.timedelta(days=1)
+    return first_day, last_day
+
+
+def day_window(dates, first_day=None, last_day=None):
+    """
+    Filas [inicio, fin) de los días first_day..last_day (incluidos) mediante
+    búsqueda binaria sobre la columna InvoiceDate ordenada.
+
+    Returns:
+        tuple: (fila_inicial, fila_final_exclusiva)
+    """
+    start = 0
+    end = len(dates)
+    if first_day is not None:
+        lower = datetime.datetime.combine(first_day, datetime.time())
+        start = int(dates.search_sorted(lower, side='left'))
+    if last_day is not None:
+        upper = datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time())
+        end = int(dates.search_sorted(upper, side='left'))
+    return start, max(start, end)
+
+
+def intersect_windows(*windows):
+    """Intersección de ventanas de filas (las None no restringen)"""
+    windows = [w for w in windows if w is not None]
+    if not windows:
+        return None
+    start = max(w[0] for w in windows)
+    end = min(w[1] for w in windows)
+    return start, max(start, end)
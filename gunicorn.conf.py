@@ -0,0 +1,33 @@
+"""
+Configuración de Gunicorn con el dataset compartido entre workers.
+
+El proceso maestro materializa una sola vez el snapshot Arrow del dataset
+antes de crear los workers, sin cargar Django ni retener el DataFrame. Cada
+worker mapea ese mismo archivo en memoria (memory_map), de modo que las
+páginas del dataset se comparten en la caché de páginas del sistema operativo
+y el número de workers se puede aumentar sin multiplicar la memoria.
+"""
+import os
+import sys
+
+# Activar el modo compartido salvo que se indique lo contrario
+os.environ.setdefault('DASHBOARD_DATA_SHARED', 'true')
+
+# Los workers cargan el dataset al iniciar (ver dashboard/apps.py)
+os.environ.setdefault('DASHBOARD_SERVER_PROCESS', 'true')
+
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+
+# Sin preload: el maestro no importa la aplicación y los workers no heredan
+# copias privadas del dataset; todos mapean el mismo snapshot
+preload_app = False
+
+
+def on_starting(server):
+    from dashboard.visualizations.shared.data_loader import materialize_shared_dataset
+
+    try:
+        materialize_shared_dataset()
+    except Exception as e:
+        # Los workers reintentarán la carga por su cuenta (bajo el bloqueo del snapshot)
+        print(f"No se pudo materializar el snapshot compartido: {type(e).__name__}: {e}", file=sys.stderr)